@@ -1,30 +1,42 @@
 import os
-import pandas as pd
 from datetime import datetime
 import uuid
 import base64
 import logging
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
+import time
 from browser_manager import BrowserManager
+from concurrency_controller import create_adaptive_pool
+from progress_tracker import ProgressTracker
+from logger_manager import LoggerManager, configure_logging
+from data_cache import DataCache, format_value
+from template_compiler import TemplateCache, TemplateSelector
+from pdf_optimizer import PostProcessor
 import re
+from concurrent.futures import wait, FIRST_COMPLETED, ALL_COMPLETED
 
-# 配置日志
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s [%(levelname)s] %(message)s',
-    datefmt='%Y-%m-%d %H:%M:%S'
-)
+# 日志由 LoggerManager 统一转发到 loguru
 logger = logging.getLogger(__name__)
 
 class PDFMaker:
     def __init__(self, config):
-        self.config = config
-        self.chrome_path = config.get('paths', 'chrome_path')
-        self.template_path = config.get('paths', 'template_path')
-        self.output_dir = config.get('paths', 'output_dir')
-        self.browser_manager = BrowserManager(config)
+        # 任务开始时取一次配置快照，之后逐行处理不再读取配置
+        self.config = config.snapshot()
+        self.chrome_path = self.config.chrome_path
+        self.template_path = self.config.template_path
+        self.output_dir = self.config.output_dir
+        self.browser_manager = BrowserManager(self.config)
+        self.data_cache = DataCache(self.config)
+        # 用于输出文件名的字段
+        self.key_field = self.config.get('output', 'filename_field', default='平台订单号')
+        self.log_manager = LoggerManager()
+        # 已编译模板的 LRU 缓存，按修改时间自动重新编译
+        self.templates = TemplateCache(
+            int(self.config.get('templates', 'cache_size', default='16')),
+            optimized=self.config.get_bool('templates', 'optimize', True))
+        # 按列选择模板，未配置时所有行使用 paths/template_path
+        self.template_selector = TemplateSelector.from_config(self.config)
+        # 生成后的压缩、去重与合并，未启用时为 None
+        self.postprocessor = PostProcessor.from_config(self.config)
         
         # Excel 字段到 HTML 占位符的映射关系
         self.field_mapping = {
@@ -43,20 +55,58 @@ class PDFMaker:
             os.makedirs(self.output_dir)
 
     def read_excel(self, excel_file):
-        """读取 Excel 文件"""
-        df = pd.read_excel(excel_file)
+        """读取数据文件（Excel / CSV / Parquet），Excel 优先走输入缓存"""
+        df = self.data_cache.read(excel_file)
         logger.info(f"成功读取 Excel 文件，列名: {list(df.columns)}")
         return df
 
+    def load_rows(self, excel_file, field_mapping, selection=None):
+        """按映射读取所需列，返回与编译模板占位符顺序一致的紧凑行数据，selection 用于只生成部分行"""
+        return self.data_cache.load_rows(
+            excel_file, self.get_template(), field_mapping,
+            key_field=self.key_field, selection=selection)
+
+    def load_groups(self, excel_file, field_mapping, selection=None):
+        """按模板分组读取行数据，返回 [(CompiledTemplate, MappedRows), ...]
+
+        配置了 templates/column 时按该列的值为每行选择模板，否则只有一组。
+        """
+        if self.template_selector is None:
+            return [(self.get_template(), self.load_rows(excel_file, field_mapping, selection))]
+        return self.data_cache.load_template_groups(
+            excel_file, self.template_selector, self.templates, field_mapping,
+            key_field=self.key_field, selection=selection)
+
+    def process_groups(self, groups, pool, on_result=None, should_stop=None, priority=0):
+        """逐组生成，同一时间浏览器只处理一种版式，返回 (成功数, 失败数)"""
+        succeeded = failed = 0
+        for template, rows in groups:
+            if should_stop and should_stop():
+                break
+            ok, bad = self.process_rows(
+                rows, pool, template=template, on_result=on_result,
+                should_stop=should_stop, priority=priority)
+            succeeded += ok
+            failed += bad
+        return succeeded, failed
+
     def format_value(self, value):
         """格式化值，处理不同的数据类型"""
-        if pd.isna(value):  # 处理空值
-            return ""
-        elif isinstance(value, (int, float)):  # 处理数字
-            if isinstance(value, float) and value.is_integer():
-                return str(int(value))
-            return str(value)
-        return str(value)
+        return format_value(value)
+
+    def get_template(self, template_path=None):
+        """获取编译后的模板，文件修改后自动重新编译"""
+        return self.templates.get(template_path or self.template_path)
+
+    def render_row(self, values, template=None):
+        """用按占位符排序的值元组渲染模板"""
+        return (template or self.get_template()).render(values)
+
+    def close(self):
+        """关闭常驻浏览器，并等待后处理完成"""
+        self.browser_manager.close()
+        if self.postprocessor:
+            self.postprocessor.close()
 
     def render_template(self, row_data, field_mapping):
         """渲染 HTML 模板"""
@@ -66,7 +116,9 @@ class PDFMaker:
             
             # 查找所有占位符
             placeholders = re.findall(r'\{\{([^}]+)\}\}', template_content)
-            logger.debug(f"模板中的占位符: {placeholders}")
+            verbose = logger.isEnabledFor(logging.DEBUG)
+            if verbose:
+                logger.debug("模板中的占位符: %s", placeholders)
             
             # 创建替换映射
             replacements = {}
@@ -81,10 +133,12 @@ class PDFMaker:
                 if excel_field and excel_field in row_data:
                     value = self.format_value(row_data[excel_field])
                     replacements[f"{{{{{placeholder}}}}}"] = value
-                    logger.debug(f"替换占位符 {placeholder} 为值: {value}")
+                    if verbose:
+                        logger.debug("替换占位符 %s 为值: %s", placeholder, value)
                 else:
                     replacements[f"{{{{{placeholder}}}}}"] = ""
-                    logger.debug(f"未找到占位符 {placeholder} 的映射，设置为空")
+                    if verbose:
+                        logger.debug("未找到占位符 %s 的映射，设置为空", placeholder)
             
             # 应用所有替换
             for old, new in replacements.items():
@@ -98,6 +152,10 @@ class PDFMaker:
 
     def get_chrome_driver(self):
         """配置并返回 Chrome driver"""
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        from selenium.webdriver.chrome.options import Options
+        
         options = Options()
         options.add_argument('--headless')
         options.add_argument('--disable-gpu')
@@ -114,74 +172,215 @@ class PDFMaker:
         if options is None:
             options = {}
 
-        default_options = {
-            'paperWidth': self.config.get('pdf_settings', 'paper_width'),
-            'paperHeight': self.config.get('pdf_settings', 'paper_height'),
-            'marginTop': self.config.get('pdf_settings', 'margin_top'),
-            'marginBottom': self.config.get('pdf_settings', 'margin_bottom'),
-            'marginLeft': self.config.get('pdf_settings', 'margin_left'),
-            'marginRight': self.config.get('pdf_settings', 'margin_right'),
-            'printBackground': True,
-            'preferCSSPageSize': True,
-            'scale': self.config.get('pdf_settings', 'scale')
-        }
+        default_options = self.config.pdf_options
         default_options.update(options)
         
         result = driver.execute_cdp_cmd('Page.printToPDF', default_options)
         return base64.b64decode(result['data'])
 
-    def generate_pdf(self, html_content, row_data):
+    def output_path(self, order_id=None):
+        """生成唯一的输出文件名（使用订单号和UUID）"""
+        if not order_id:
+            order_id = datetime.now().strftime('%Y%m%d%H%M%S')
+        unique_id = uuid.uuid4().hex[:8]
+        return os.path.join(self.output_dir, f"order_{order_id}_{unique_id}.pdf")
+
+    def stable_output_path(self, index, order_id=None):
+        """按行号和订单号生成固定的输出文件名，同一行重复生成时覆盖原文件"""
+        name = f"order_{order_id}_{index + 1}" if order_id else f"order_{index + 1}"
+        return os.path.join(self.output_dir, f"{name}.pdf")
+
+    def generate_pdf(self, html_content, row_data=None, order_id=None):
         """生成 PDF 文件"""
         try:
-            # 生成唯一的输出文件名（使用订单号和UUID）
-            try:
-                order_id = self.format_value(row_data['平台订单号'])
-            except KeyError:
-                order_id = datetime.now().strftime('%Y%m%d%H%M%S')
-                
-            unique_id = uuid.uuid4().hex[:8]
-            output_file = os.path.join(self.output_dir, f"order_{order_id}_{unique_id}.pdf")
+            if not order_id:
+                try:
+                    order_id = self.format_value(row_data[self.key_field])
+                except (KeyError, TypeError):
+                    order_id = None
+            output_file = self.output_path(order_id)
             
             # 使用浏览器管理器生成 PDF
             self.browser_manager.print_to_pdf(html_content, output_file)
-            logger.info(f"成功生成 PDF 文件: {output_file}")
+            logger.debug("成功生成 PDF 文件: %s", output_file)
             return output_file
             
         except Exception as e:
             logger.error(f"生成 PDF 时发生错误: {str(e)}")
             return None
 
-    def process(self, excel_file):
-        """处理整个流程"""
+    def generate_row(self, template, values, order_id=None):
+        """用编译模板和值元组生成 PDF（热页面模式下只注入值），失败时返回 None"""
+        try:
+            output_file = self.output_path(order_id)
+            self.browser_manager.print_values(template, values, output_file)
+            return output_file
+        except Exception as e:
+            logger.error(f"生成 PDF 时发生错误: {str(e)}")
+            return None
+
+    def process_rows(self, rows, pool, template=None, on_result=None, should_stop=None, priority=0,
+                     stable_names=False):
+        """通过浏览器池并发生成 PDF，返回 (成功数, 失败数)
+
+        同时在途的任务数限制为浏览器数量的两倍，避免一次性渲染全部 HTML 占用大量内存。
+        on_result(index, key, output_file, error) 在每行完成后调用。
+        should_stop 返回 True 时停止提交，并取消还在浏览器池中排队的行。
+        stable_names 为 True 时输出文件名按行固定（见 stable_output_path），可能被重跑的分片使用。
+        """
+        template = template or self.get_template()
+        window = max(1, pool.size * 2)
+        in_flight = {}
+        succeeded = failed = 0
+
+        def collect(return_when):
+            nonlocal succeeded, failed
+            done, _ = wait(list(in_flight), return_when=return_when)
+            for future in done:
+                index, key, output_file, submitted = in_flight.pop(future)
+                if future.cancelled():
+                    continue
+                error = future.exception()
+                latency_ms = round((time.perf_counter() - submitted) * 1000, 1)
+                if error is None:
+                    succeeded += 1
+                    self.log_manager.log_row(
+                        'ok', row=index + 1, key=key, file=output_file, latency_ms=latency_ms)
+                    if self.postprocessor:
+                        self.postprocessor.submit(output_file)
+                else:
+                    failed += 1
+                    output_file = None
+                    logger.error(f"第 {index + 1} 行 PDF 生成失败: {str(error)}")
+                    self.log_manager.log_row(
+                        'failed', row=index + 1, key=key, error=str(error), latency_ms=latency_ms)
+                if on_result:
+                    on_result(index, key, output_file, error)
+
+        for index, key, values in rows:
+            if should_stop and should_stop():
+                for future in in_flight:
+                    future.cancel()
+                break
+            if len(in_flight) >= window:
+                collect(FIRST_COMPLETED)
+            output_file = self.stable_output_path(index, key) if stable_names else self.output_path(key)
+            future = pool.print_values(template, values, output_file, priority=priority)
+            in_flight[future] = (index, key, output_file, time.perf_counter())
+        if in_flight:
+            collect(ALL_COMPLETED)
+        # 任务结束时提交不足一批的剩余文件，常驻进程（监视目录、任务队列）不必等到退出
+        if self.postprocessor:
+            self.postprocessor.flush()
+        return succeeded, failed
+
+    def process(self, excel_file, processes=1, selection=None):
+        """处理整个流程，processes 大于 1 时使用多进程并通过共享内存分发行数据
+
+        selection 为 RowSelection 时只生成选中的行。
+        """
         try:
             logger.info(f"开始处理 Excel 文件: {excel_file}")
             
-            # 读取 Excel 文件
-            df = self.read_excel(excel_file)
+            # 只读取映射用到的列，并在启动浏览器之前完成行选择和模板分组
+            groups = self.load_groups(excel_file, self.field_mapping, selection)
+            total = sum(len(rows) for _, rows in groups)
+            if not total:
+                logger.warning("没有需要生成的行")
+                return
+            
+            if processes > 1:
+                from shared_rows import SharedRows, render_in_processes
+                succeeded = failed = 0
+                # 逐组取出：写入共享内存后父进程不再引用该组的行数据，每行只保留一份
+                groups.reverse()
+                while groups:
+                    template, rows = groups.pop()
+                    shared = SharedRows.create(rows)
+                    del rows
+                    ok, bad = render_in_processes(
+                        self.config, shared, template.path, processes, postprocessor=self.postprocessor)
+                    succeeded += ok
+                    failed += bad
+                logger.info(f"多进程处理完成，成功 {succeeded} 行，失败 {failed} 行")
+                return
             
-            # 处理每一行数据
-            for index, row in df.iterrows():
+            # 通过浏览器池并发生成，并发数由控制器自动调节
+            pool, controller = create_adaptive_pool(self.config)
+            with pool:
+                if controller:
+                    controller.start()
+                # 命令行下每隔几秒输出一次进度
+                tracker = ProgressTracker(total, interval=5.0)
+
+                def report(index, key, output_file, error):
+                    stats = tracker.update(ok=error is None)
+                    if stats is not None:
+                        logger.info(ProgressTracker.describe(stats))
+
                 try:
-                    logger.info(f"正在处理第 {index + 1} 行数据...")
-                    
-                    # 渲染模板
-                    html_content = self.render_template(row, self.field_mapping)
-                    
-                    # 生成 PDF
-                    output_file = self.generate_pdf(html_content, row)
-                    
-                    if output_file:
-                        logger.info(f"第 {index + 1} 行 PDF 生成成功: {output_file}")
-                    else:
-                        logger.error(f"第 {index + 1} 行 PDF 生成失败")
-                        
-                except Exception as e:
-                    logger.error(f"处理第 {index + 1} 行时发生错误: {str(e)}")
-                    continue
+                    succeeded, failed = self.process_groups(groups, pool, on_result=report)
+                finally:
+                    if controller:
+                        controller.stop()
+            logger.info(f"处理完成，成功 {succeeded} 行，失败 {failed} 行")
                 
         except Exception as e:
             logger.error(f"处理过程中发生错误: {str(e)}")
+        finally:
+            self.close()
 
 if __name__ == "__main__":
-    pdf_maker = PDFMaker()
-    pdf_maker.process("PayOrder_1742629289639.xlsx")
+    import argparse
+    from config_manager import ConfigManager, ConfigSnapshot
+    from row_selection import RowSelection, SelectionError
+
+    parser = argparse.ArgumentParser(description="根据数据文件批量生成 PDF")
+    parser.add_argument('input', nargs='?', default="PayOrder_1742629289639.xlsx",
+                        help="数据文件（.xlsx / .xls / .csv / .parquet）")
+    parser.add_argument('--no-cache', action='store_true', help="不使用输入缓存，直接解析 Excel")
+    parser.add_argument('--processes', type=int, default=1, help="工作进程数，大于 1 时通过共享内存分发数据")
+    parser.add_argument('--rows', default=None, help="只生成指定行号（从 1 开始），如 1-10,15,200-")
+    parser.add_argument('--filter', default=None,
+                        help="pandas query 筛选表达式，只能引用已映射的列，如 \"`country` == 'US'\"")
+    parser.add_argument('--keys', default=None, help="只生成指定键值（输出文件名字段）的行，逗号分隔")
+    parser.add_argument('--template-column', default=None,
+                        help="按该列的值为每行选择模板（<模板目录>/<值>.html，找不到时使用默认模板）")
+    parser.add_argument('--template-rules', default=None, help="模板规则 JSON 文件：{列值: 模板路径}")
+    parser.add_argument('--hot-page', action='store_true', help="热页面模式：模板只加载一次，每行只注入值")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="试运行：抽样渲染少量行，估算总耗时、磁盘占用和推荐并发，不生成输出文件")
+    parser.add_argument('--sample', type=int, default=40, help="试运行抽样的行数")
+    args = parser.parse_args()
+
+    try:
+        selection = RowSelection.from_text(args.rows, args.filter, args.keys)
+    except SelectionError as e:
+        parser.error(str(e))
+
+    config = ConfigManager()
+    configure_logging(config)
+    if args.template_column or args.template_rules or args.hot_page:
+        # 只影响本次运行，不写回 config.xml
+        values = dict(config.snapshot().values)
+        if args.template_column:
+            values[('templates', 'column')] = args.template_column
+        if args.template_rules:
+            values[('templates', 'rules_file')] = args.template_rules
+        if args.hot_page:
+            values[('browser', 'hot_page')] = 'true'
+        config = ConfigSnapshot.from_values(values)
+    pdf_maker = PDFMaker(config)
+    if args.no_cache:
+        pdf_maker.data_cache.enabled = False
+    if args.dry_run:
+        from capacity_planner import CapacityPlanner
+        try:
+            report = CapacityPlanner(pdf_maker, args.sample).run(
+                args.input, pdf_maker.field_mapping, selection)
+            print(CapacityPlanner.describe(report))
+        finally:
+            pdf_maker.close()
+        raise SystemExit(0)
+    pdf_maker.process(args.input, processes=args.processes, selection=selection)
+
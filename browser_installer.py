@@ -52,6 +52,26 @@ class BrowserInstaller:
             QMessageBox.critical(self.parent, "安装失败", f"安装 Undetected Chrome 失败：{str(e)}")
             return False
             
+    def install_weasyprint(self):
+        """安装 WeasyPrint"""
+        try:
+            dialog = QProgressDialog("正在安装 WeasyPrint...", None, 0, 0, self.parent)
+            dialog.setWindowModality(Qt.WindowModal)
+            dialog.setWindowTitle("安装进度")
+            dialog.setCancelButton(None)
+            dialog.show()
+            
+            subprocess.check_call([sys.executable, "-m", "pip", "install", "--upgrade", "weasyprint"])
+            
+            dialog.close()
+            QMessageBox.information(self.parent, "安装成功", "WeasyPrint 安装完成！")
+            return True
+            
+        except Exception as e:
+            logger.error(f"安装 WeasyPrint 失败: {str(e)}")
+            QMessageBox.critical(self.parent, "安装失败", f"安装 WeasyPrint 失败：{str(e)}")
+            return False
+            
     def check_browser_installation(self, browser_type):
         """检查浏览器是否已安装"""
         try:
@@ -69,6 +89,11 @@ class BrowserInstaller:
                 import undetected_chromedriver
                 return True
                 
+            elif browser_type == "weasyprint":
+                # 检查 WeasyPrint（依赖系统的 Pango 库，导入失败也视为未安装）
+                import weasyprint
+                return True
+                
             return True
             
         except Exception as e:
@@ -1,18 +1,58 @@
 import os
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-import undetected_chromedriver as uc
-from playwright.sync_api import sync_playwright
+import uuid
+import base64
+import importlib.util
 import tempfile
+from cdp_engine import CDPBrowser
+from template_compiler import HOT_BIND_SCRIPT, hot_fill_script
 import shutil
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 各引擎依赖的第三方包；只在启动该引擎时导入，打包时未选中的引擎可以整体排除
+ENGINE_MODULES = {
+    'local': 'selenium',
+    'undetected': 'undetected_chromedriver',
+    'playwright': 'playwright',
+    'cdp': None,
+    'weasyprint': 'weasyprint',
+}
+
+
+def engine_available(browser_type):
+    """引擎依赖的包是否存在（只查找不导入）"""
+    module = ENGINE_MODULES.get(browser_type)
+    return module is None or importlib.util.find_spec(module) is not None
+
+
+def write_atomic(path, data):
+    """先写入同目录的临时文件再改名，读取方不会看到写了一半的文件，重复生成时整体替换"""
+    temp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
 
 class BrowserManager:
     def __init__(self, config):
-        self.config = config
-        self.browser_type = config.get('browser', 'type', default='local')
-        self.chrome_path = config.get('paths', 'chrome_path')
+        # 使用配置快照，打印时不再逐项查询 XML
+        self.config = config.snapshot()
+        self.browser_type = self.config.browser_type
+        self.chrome_path = self.config.chrome_path
+        self.pdf_options = self.config.pdf_options
         self.temp_dir = None
+        # 常驻浏览器实例（playwright 时额外保存 playwright 对象和页面）
+        self.browser = None
+        self.playwright = None
+        self.page = None
+        # 热页面模式：模板只加载一次，之后每行只注入值
+        self.hot_page = self.config.get_bool('browser', 'hot_page', False) and self.browser_type != 'weasyprint'
+        self.hot_template = None
         
     def create_temp_dir(self):
         """创建临时目录用于存储浏览器文件"""
@@ -26,10 +66,14 @@ class BrowserManager:
             try:
                 shutil.rmtree(self.temp_dir)
             except Exception as e:
-                print(f"清理临时文件失败: {str(e)}")
+                logger.warning(f"清理临时文件失败: {str(e)}")
                 
     def get_selenium_driver(self):
         """获取 Selenium WebDriver"""
+        from selenium import webdriver
+        from selenium.webdriver.chrome.service import Service
+        from selenium.webdriver.chrome.options import Options
+        
         options = Options()
         options.add_argument('--headless')
         options.add_argument('--disable-gpu')
@@ -43,6 +87,8 @@ class BrowserManager:
         
     def get_undetected_driver(self):
         """获取 Undetected ChromeDriver"""
+        import undetected_chromedriver as uc
+        
         options = uc.ChromeOptions()
         options.add_argument('--headless')
         options.add_argument('--disable-gpu')
@@ -58,6 +104,8 @@ class BrowserManager:
         
     def get_playwright_browser(self):
         """获取 Playwright 浏览器"""
+        from playwright.sync_api import sync_playwright
+        
         playwright = sync_playwright().start()
         browser = playwright.chromium.launch(
             headless=True,
@@ -65,6 +113,13 @@ class BrowserManager:
         )
         return browser, playwright
         
+    def get_cdp_browser(self):
+        """获取直连 DevTools 协议的 Chrome（不经过 chromedriver），池中各线程共享同一个进程"""
+        transport = self.config.get('browser', 'cdp_transport', default='auto')
+        if self.config.get('browser', 'cdp_shared', default='true').lower() == 'false':
+            return CDPBrowser(self.chrome_path, transport, owned=True)
+        return CDPBrowser.acquire(self.chrome_path, transport)
+        
     def get_browser(self):
         """根据配置获取浏览器实例"""
         if self.browser_type == 'local':
@@ -73,56 +128,192 @@ class BrowserManager:
             return self.get_undetected_driver()
         elif self.browser_type == 'playwright':
             return self.get_playwright_browser()
+        elif self.browser_type == 'cdp':
+            return self.get_cdp_browser()
+        elif self.browser_type == 'weasyprint':
+            # 不启动浏览器，进程内渲染；可选依赖，用到时才导入
+            from weasy_engine import WeasyRenderer
+            return WeasyRenderer(self.config)
         else:
             raise ValueError(f"不支持的浏览器类型: {self.browser_type}")
             
-    def print_to_pdf(self, html_content, output_path):
-        """使用选定的浏览器打印 PDF"""
-        try:
+    @property
+    def is_ready(self):
+        """浏览器是否已经启动（预热完成）"""
+        return self.browser is not None
+        
+    def start(self):
+        """启动浏览器并保持常驻，后续打印复用同一个实例"""
+        if self.browser is None:
             if self.browser_type == 'playwright':
-                browser, playwright = self.get_playwright_browser()
+                self.browser, self.playwright = self.get_playwright_browser()
+                self.page = self.browser.new_page()
+            elif self.browser_type == 'cdp':
+                browser = self.get_cdp_browser()
                 try:
-                    page = browser.new_page()
-                    page.set_content(html_content)
-                    page.pdf(path=output_path, format='A4')
-                finally:
-                    browser.close()
-                    playwright.stop()
+                    self.page = browser.new_page()
+                except Exception:
+                    browser.release()
+                    raise
+                self.browser = browser
             else:
-                # 创建临时 HTML 文件
-                temp_html = os.path.join(self.create_temp_dir(), 'temp.html')
-                with open(temp_html, 'w', encoding='utf-8') as f:
-                    f.write(html_content)
-                    
-                # 获取浏览器实例
-                if self.browser_type == 'local':
-                    driver = self.get_selenium_driver()
-                else:
-                    driver = self.get_undetected_driver()
-                    
-                try:
-                    # 加载 HTML 文件
-                    driver.get(f'file:///{os.path.abspath(temp_html)}')
-                    
-                    # 打印为 PDF
-                    pdf_data = driver.execute_cdp_cmd('Page.printToPDF', {
-                        'paperWidth': self.config.get('pdf_settings', 'paper_width'),
-                        'paperHeight': self.config.get('pdf_settings', 'paper_height'),
-                        'marginTop': self.config.get('pdf_settings', 'margin_top'),
-                        'marginBottom': self.config.get('pdf_settings', 'margin_bottom'),
-                        'marginLeft': self.config.get('pdf_settings', 'margin_left'),
-                        'marginRight': self.config.get('pdf_settings', 'margin_right'),
-                        'printBackground': True,
-                        'preferCSSPageSize': True,
-                        'scale': self.config.get('pdf_settings', 'scale')
-                    })
-                    
-                    # 保存 PDF 文件
-                    with open(output_path, 'wb') as f:
-                        f.write(pdf_data['data'])
-                        
-                finally:
-                    driver.quit()
-                    
+                self.browser = self.get_browser()
+        return self.browser
+        
+    def close(self):
+        """关闭常驻浏览器并清理临时文件"""
+        try:
+            if self.browser is not None:
+                if self.browser_type == 'playwright':
+                    self.browser.close()
+                    self.playwright.stop()
+                elif self.browser_type == 'cdp':
+                    # 只关闭自己的标签页，浏览器进程由最后一个使用者关闭
+                    try:
+                        self.page.close()
+                    finally:
+                        self.browser.release()
+                elif self.browser_type != 'weasyprint':
+                    self.browser.quit()
+        except Exception as e:
+            logger.warning(f"关闭浏览器失败: {str(e)}")
         finally:
-            self.cleanup() 
\ No newline at end of file
+            self.browser = None
+            self.playwright = None
+            self.page = None
+            self.hot_template = None
+            self.cleanup()
+            self.temp_dir = None
+            
+    def _load(self, html_content):
+        """在常驻页面中加载 HTML（等待 load 事件）"""
+        # 页面内容被替换，热页面绑定随之失效
+        self.hot_template = None
+        if self.browser_type == 'playwright':
+            self.page.set_content(html_content)
+        elif self.browser_type == 'cdp':
+            self.page.load(html_content)
+        else:
+            # 创建临时 HTML 文件
+            temp_html = os.path.join(self.create_temp_dir(), 'temp.html')
+            with open(temp_html, 'w', encoding='utf-8') as f:
+                f.write(html_content)
+            self.browser.get(f'file:///{os.path.abspath(temp_html)}')
+            
+    def _print(self):
+        """把当前页面打印为 PDF 字节"""
+        if self.browser_type == 'playwright':
+            return self.page.pdf(
+                width=f"{self.config.paper_width}in",
+                height=f"{self.config.paper_height}in",
+                margin={
+                    'top': f"{self.config.margin_top}in",
+                    'bottom': f"{self.config.margin_bottom}in",
+                    'left': f"{self.config.margin_left}in",
+                    'right': f"{self.config.margin_right}in"
+                },
+                scale=self.config.scale,
+                print_background=self.config.print_background,
+                prefer_css_page_size=self.config.prefer_css_page_size
+            )
+        if self.browser_type == 'cdp':
+            return self.page.print_current(self.pdf_options)
+        pdf_data = self.browser.execute_cdp_cmd('Page.printToPDF', self.pdf_options)
+        return base64.b64decode(pdf_data['data'])
+        
+    def _evaluate(self, expression):
+        """在当前页面执行脚本，返回值为 Promise 时等待其完成"""
+        if self.browser_type == 'playwright':
+            return self.page.evaluate(expression)
+        if self.browser_type == 'cdp':
+            return self.page.evaluate(expression)
+        return self.browser.execute_script(f"return {expression};")
+        
+    def render_pdf(self, html_content):
+        """渲染 HTML 并返回 PDF 字节"""
+        self.start()
+        if self.browser_type == 'weasyprint':
+            return self.browser.render_pdf(html_content)
+        try:
+            self._load(html_content)
+            return self._print()
+        except Exception:
+            # 浏览器可能已经崩溃，关闭后下次重新启动
+            self.close()
+            raise
+            
+    def render_values(self, template, values):
+        """用编译模板和值元组渲染 PDF 字节
+
+        热页面模式下模板只加载一次，占位符绑定到文本节点，之后每行通过一次脚本调用写入值再打印；
+        模板无法绑定或值中含有 HTML 时整页加载。
+        """
+        if self.browser_type == 'weasyprint':
+            # 模板选择器可能选用其他目录的模板，相对路径以正在渲染的模板所在目录为准
+            self.start()
+            base_url = os.path.dirname(template.path) if template.path else None
+            return self.browser.render_pdf(template.render(values), base_url=base_url)
+        if not (self.hot_page and template.can_bind(values)):
+            return self.render_pdf(template.render(values))
+        self.start()
+        try:
+            if self.hot_template is not template:
+                self._load(template.hot_html)
+                bound = self._evaluate(HOT_BIND_SCRIPT)
+                if bound != len(template.placeholders):
+                    template.hot_disabled = True
+                    logger.warning(f"模板无法使用热页面模式，改为整页加载: {template.path}")
+                    return self.render_pdf(template.render(values))
+                self.hot_template = template
+            self._evaluate(hot_fill_script(values))
+            return self._print()
+        except Exception:
+            self.close()
+            raise
+            
+    def render_image(self, html_content):
+        """按打印样式渲染 HTML，返回第一页大小的 PNG 截图（用于预览）"""
+        if self.browser_type == 'weasyprint':
+            raise RuntimeError("WeasyPrint 引擎不支持截图预览，请使用浏览器引擎预览")
+        self.start()
+        self.hot_template = None
+        # 视口与纸张大小一致（CSS 像素为 1/96 英寸）
+        width = int(round(self.config.paper_width * 96))
+        height = int(round(self.config.paper_height * 96))
+        try:
+            if self.browser_type == 'playwright':
+                self.page.set_viewport_size({'width': width, 'height': height})
+                self.page.emulate_media(media='print')
+                self.page.set_content(html_content)
+                return self.page.screenshot(type='png')
+            if self.browser_type == 'cdp':
+                return self.page.screenshot(html_content, width, height)
+                
+            temp_html = os.path.join(self.create_temp_dir(), 'preview.html')
+            with open(temp_html, 'w', encoding='utf-8') as f:
+                f.write(html_content)
+            self.browser.execute_cdp_cmd('Emulation.setDeviceMetricsOverride', {
+                'width': width, 'height': height, 'deviceScaleFactor': 1, 'mobile': False})
+            self.browser.execute_cdp_cmd('Emulation.setEmulatedMedia', {'media': 'print'})
+            try:
+                self.browser.get(f'file:///{os.path.abspath(temp_html)}')
+                image = self.browser.execute_cdp_cmd('Page.captureScreenshot', {
+                    'format': 'png',
+                    'clip': {'x': 0, 'y': 0, 'width': width, 'height': height, 'scale': 1}})
+            finally:
+                # 恢复默认设置，不影响之后的 PDF 打印
+                self.browser.execute_cdp_cmd('Emulation.setEmulatedMedia', {'media': ''})
+                self.browser.execute_cdp_cmd('Emulation.clearDeviceMetricsOverride', {})
+            return base64.b64decode(image['data'])
+            
+        except Exception:
+            self.close()
+            raise
+            
+    def print_to_pdf(self, html_content, output_path):
+        """使用选定的浏览器打印 PDF"""
+        write_atomic(output_path, self.render_pdf(html_content))
+            
+    def print_values(self, template, values, output_path):
+        """用编译模板和值元组生成 PDF 文件（支持热页面模式）"""
+        write_atomic(output_path, self.render_values(template, values))
@@ -0,0 +1,181 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from browser_manager import BrowserManager
+
+logger = logging.getLogger(__name__)
+
+# 关闭工作线程用的哨兵优先级，排在所有任务之后
+_SHUTDOWN_PRIORITY = float('inf')
+
+
+class BrowserPool:
+    """浏览器池：每个工作线程持有一个常驻的 BrowserManager，任务在持有浏览器的线程上执行
+
+    Selenium 驱动和 Playwright 同步接口都不能跨线程使用，所以浏览器始终留在创建它的线程里，
+    调用方通过 submit 提交任务并拿到 Future。优先级数值越小越先执行。
+    """
+
+    def __init__(self, config, size=None, warm=True, active=None):
+        self.config = config.snapshot()
+        self.size = size or int(self.config.get('pool', 'size', default='2'))
+        # 实际参与处理的线程数，其余线程挂起并释放浏览器，由并发控制器调整
+        self.active = min(active or self.size, self.size)
+        self.warm = warm
+        self._tasks = queue.PriorityQueue()
+        self._seq = itertools.count()
+        self._workers = []
+        self._managers = []
+        self._lock = threading.Lock()
+        self._active_changed = threading.Condition(self._lock)
+        self._closed = False
+        # 最近一次预热失败的原因，供界面显示
+        self.warm_error = None
+        # 统计信息：完成任务数、失败数、累计耗时（秒）
+        self.completed = 0
+        self.failed = 0
+        self.busy_seconds = 0.0
+
+    def start(self):
+        """启动工作线程，warm 为 True 时每个线程立即启动浏览器"""
+        with self._lock:
+            while len(self._workers) < self.size:
+                index = len(self._workers)
+                worker = threading.Thread(
+                    target=self._worker, args=(index,),
+                    name=f"browser-pool-{index}", daemon=True)
+                self._workers.append(worker)
+                worker.start()
+        return self
+
+    @property
+    def ready_count(self):
+        """已完成预热的浏览器数量"""
+        return sum(1 for manager in list(self._managers) if manager.is_ready)
+
+    @property
+    def is_ready(self):
+        return self.ready_count >= self.active
+
+    def readiness(self):
+        """返回 (状态, 已就绪数, 目标数)，状态为 warming / ready / failed"""
+        ready = self.ready_count
+        if ready >= self.active:
+            return 'ready', ready, self.active
+        if self.warm_error and ready == 0:
+            return 'failed', ready, self.active
+        return 'warming', ready, self.active
+
+    def set_active(self, count):
+        """调整参与处理的线程数（1 ~ size）"""
+        with self._active_changed:
+            self.active = max(1, min(count, self.size))
+            self._active_changed.notify_all()
+        return self.active
+
+    def stats(self):
+        """返回累计统计的快照"""
+        with self._lock:
+            return self.completed, self.failed, self.busy_seconds
+
+    @property
+    def pending(self):
+        """排队中的任务数"""
+        return self._tasks.qsize()
+
+    def submit(self, fn, *args, priority=0, **kwargs):
+        """提交任务，fn 的第一个参数为该线程持有的 BrowserManager"""
+        if self._closed:
+            raise RuntimeError("浏览器池已关闭")
+        if not self._workers:
+            self.start()
+        future = Future()
+        self._tasks.put((priority, next(self._seq), (future, fn, args, kwargs)))
+        return future
+
+    def render_pdf(self, html_content, priority=0):
+        """渲染 HTML，Future 的结果为 PDF 字节"""
+        return self.submit(lambda manager: manager.render_pdf(html_content), priority=priority)
+
+    def print_to_pdf(self, html_content, output_path, priority=0):
+        """渲染 HTML 并写入 output_path"""
+        return self.submit(
+            lambda manager: manager.print_to_pdf(html_content, output_path), priority=priority)
+
+    def print_values(self, template, values, output_path, priority=0):
+        """用编译模板和值元组生成 PDF 写入 output_path，HTML 在浏览器线程中拼接"""
+        return self.submit(
+            lambda manager: manager.print_values(template, values, output_path), priority=priority)
+
+    def _worker(self, index):
+        manager = BrowserManager(self.config)
+        self._managers.append(manager)
+        if self.warm and index < self.active:
+            try:
+                manager.start()
+                logger.info(f"浏览器池 #{index} 预热完成")
+            except Exception as e:
+                self.warm_error = str(e)
+                logger.error(f"浏览器池 #{index} 预热失败: {str(e)}")
+
+        try:
+            while True:
+                self._wait_until_active(index, manager)
+                _, _, item = self._tasks.get()
+                if item is None:
+                    break
+                future, fn, args, kwargs = item
+                if not future.set_running_or_notify_cancel():
+                    continue
+                started = time.perf_counter()
+                try:
+                    future.set_result(fn(manager, *args, **kwargs))
+                    ok = True
+                except BaseException as e:
+                    future.set_exception(e)
+                    ok = False
+                with self._lock:
+                    self.completed += 1
+                    self.failed += 0 if ok else 1
+                    self.busy_seconds += time.perf_counter() - started
+        finally:
+            manager.close()
+            self._managers.remove(manager)
+
+    def _wait_until_active(self, index, manager):
+        """序号超出 active 的线程挂起，挂起前关闭浏览器以释放内存"""
+        with self._active_changed:
+            if index < self.active or self._closed:
+                return
+        if manager.is_ready:
+            logger.info(f"浏览器池 #{index} 挂起，关闭浏览器")
+            manager.close()
+        with self._active_changed:
+            while index >= self.active and not self._closed:
+                self._active_changed.wait()
+            if self._closed:
+                return
+        logger.info(f"浏览器池 #{index} 恢复处理")
+
+    def close(self, wait=True):
+        """关闭浏览器池，已排队的任务执行完后退出"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._active_changed.notify_all()
+            workers = list(self._workers)
+        for _ in workers:
+            self._tasks.put((_SHUTDOWN_PRIORITY, next(self._seq), None))
+        if wait:
+            for worker in workers:
+                worker.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -1,9 +1,45 @@
 import PyInstaller.__main__
 import os
+import json
 import shutil
+import subprocess
 import sys
+import tempfile
+import time
+import argparse
 from datetime import datetime
-import importlib
+import importlib.util
+
+APP_NAME = 'PDF生成器'
+
+# 各渲染引擎需要打包的第三方包（cdp 只用标准库）
+ENGINE_PACKAGES = {
+    'local': ['selenium'],
+    'undetected': ['selenium', 'undetected_chromedriver'],
+    'playwright': ['playwright'],
+    'cdp': [],
+    'weasyprint': ['weasyprint'],
+}
+
+# 打包配置：包含哪些引擎，第一个为打包后默认使用的引擎；未包含的引擎对应的包全部排除
+BUILD_PROFILES = {
+    'cdp': ['cdp'],
+    'local': ['local', 'cdp'],
+    'undetected': ['undetected', 'cdp'],
+    'playwright': ['playwright', 'cdp'],
+    'weasyprint': ['weasyprint', 'cdp'],
+    'full': ['local', 'undetected', 'playwright', 'cdp', 'weasyprint'],
+}
+
+# 程序从不使用、但可能被依赖间接拉进来的包
+ALWAYS_EXCLUDED = [
+    'webdriver_manager', 'pdfkit', 'tkinter', 'matplotlib', 'IPython', 'notebook', 'scipy', 'pytest',
+    'PyQt5.QtWebEngineWidgets', 'PyQt5.QtWebEngineCore', 'PyQt5.QtWebEngine', 'PyQt5.QtQml',
+    'PyQt5.QtQuick', 'PyQt5.QtMultimedia', 'PyQt5.QtSql', 'PyQt5.QtTest',
+]
+
+# 冷启动目标（秒）
+STARTUP_TARGET = 1.0
 
 def create_directories():
     """创建必要的目录"""
@@ -21,7 +57,7 @@ def clean_build_files():
         if os.path.exists(dir_name):
             shutil.rmtree(dir_name)
             print(f"清理目录：{dir_name}")
-    
+
     # 清理 spec 文件
     for file in os.listdir('.'):
         if file.endswith('.spec'):
@@ -37,101 +73,148 @@ def copy_resources(dist_dir):
         ('logs', '日志目录'),
         ('finished', '输出目录')
     ]
-    
+
     for resource, desc in resources:
         if os.path.exists(resource):
             if os.path.isdir(resource):
-                shutil.copytree(resource, os.path.join(dist_dir, resource))
+                shutil.copytree(resource, os.path.join(dist_dir, resource), dirs_exist_ok=True)
             else:
                 shutil.copy2(resource, dist_dir)
             print(f"复制{desc}：{resource}")
         else:
             print(f"警告：{desc} {resource} 不存在")
 
-def build():
-    """构建可执行文件"""
-    print("开始构建 PDF 生成器...")
-    
-    # 清理之前的构建文件
-    clean_build_files()
-    
-    # 创建必要的目录
-    create_directories()
-    
-    # PyInstaller 参数
+def set_default_engine(dist_dir, engine):
+    """把打包目录中配置文件的默认引擎设为本次打包的引擎"""
+    from config_manager import ConfigManager
+    cwd = os.getcwd()
+    os.chdir(dist_dir)
+    try:
+        config = ConfigManager(save_delay=0)
+        config.set('browser', 'type', engine)
+        config.flush()
+    finally:
+        os.chdir(cwd)
+    print(f"默认引擎：{engine}")
+
+def pyinstaller_params(profile, onefile=False, debug=False):
+    """按打包配置生成 PyInstaller 参数"""
+    engines = BUILD_PROFILES[profile]
+    included = {package for engine in engines for package in ENGINE_PACKAGES[engine]}
+    excluded = {package for packages in ENGINE_PACKAGES.values() for package in packages} - included
+
     params = [
         'main.py',  # 主程序文件
-        '--name=PDF生成器',  # 生成的exe名称
+        f'--name={APP_NAME}',  # 生成的exe名称
         '--windowed',  # 使用 GUI 模式
         '--icon=icon.ico',  # 程序图标
-        '--add-data=config.xml;.',  # 添加配置文件
-        '--add-data=tr91vewuqjsieb6ot1zd.html;.',  # 添加模板文件
-        '--add-data=logs;logs',  # 添加日志目录
-        '--add-data=finished;finished',  # 添加输出目录
         '--clean',  # 清理临时文件
         '--noconfirm',  # 不确认覆盖
-        '--noconsole',  # 不显示控制台窗口
-        # 核心依赖
-        '--hidden-import=pandas',
+        '--onefile' if onefile else '--onedir',
+        # 模板文件随程序分发；配置、日志、输出目录在打包后复制或在运行时创建
+        f'--add-data=tr91vewuqjsieb6ot1zd.html{os.pathsep}.',
+        # 核心依赖由 PyInstaller 的分析和钩子收集，不再整包复制
         '--hidden-import=openpyxl',
-        '--hidden-import=PyQt5',
-        '--hidden-import=loguru',
-        '--hidden-import=utils',  # 添加工具模块
-        # 浏览器相关
-        '--hidden-import=selenium',
-        '--hidden-import=playwright',
-        '--hidden-import=undetected_chromedriver',
-        '--hidden-import=webdriver_manager',
-        # PDF相关
-        '--hidden-import=pdfkit',
-        '--hidden-import=wkhtmltopdf',
-        # 添加必要的包数据
-        f'--add-data={os.path.dirname(importlib.import_module("pandas").__file__)};pandas',
-        f'--add-data={os.path.dirname(importlib.import_module("openpyxl").__file__)};openpyxl',
-        f'--add-data={os.path.dirname(importlib.import_module("PyQt5").__file__)};PyQt5',
-        f'--add-data={os.path.dirname(importlib.import_module("loguru").__file__)};loguru',
-        f'--add-data={os.path.dirname(importlib.import_module("selenium").__file__)};selenium',
-        f'--add-data={os.path.dirname(importlib.import_module("playwright").__file__)};playwright',
-        f'--add-data={os.path.dirname(importlib.import_module("undetected_chromedriver").__file__)};undetected_chromedriver',
-        '--collect-all=webdriver_manager',
-        '--collect-all=pdfkit',
     ]
+    # 引擎在运行时才导入，需要显式声明
+    for package in sorted(included):
+        if importlib.util.find_spec(package) is None:
+            raise RuntimeError(f"打包配置 {profile} 需要 {package}，但当前环境未安装")
+        params.append(f'--hidden-import={package}')
+    if 'weasyprint' in included:
+        params.append('--collect-data=weasyprint')
+    for package in sorted(excluded) + ALWAYS_EXCLUDED:
+        params.append(f'--exclude-module={package}')
+
+    if debug:
+        params.extend(['--debug=all', '--log-level=DEBUG'])
+    else:
+        params.append('--log-level=WARN')
+    return params
+
+def measure_startup(executable, cwd, runs=3):
+    """多次启动打包后的程序（--startup-probe），返回每次的 (总耗时, 程序内计时)"""
+    results = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as directory:
+            result_file = os.path.join(directory, 'startup.json')
+            started = time.perf_counter()
+            subprocess.run([executable, f'--startup-probe={result_file}'], cwd=cwd, timeout=120, check=True)
+            elapsed = time.perf_counter() - started
+            inner = None
+            if os.path.exists(result_file):
+                with open(result_file, 'r', encoding='utf-8') as f:
+                    inner = json.load(f)
+            results.append((elapsed, inner))
+    return results
+
+def report_startup(results):
+    """输出启动时间测量结果"""
+    print("\n启动时间（启动到窗口显示后退出）：")
+    for number, (elapsed, inner) in enumerate(results, 1):
+        detail = f"，其中导入 {inner['imports']:.2f} 秒，创建窗口完成 {inner['window']:.2f} 秒" if inner else ""
+        print(f"  第 {number} 次{'（冷启动）' if number == 1 else ''}：{elapsed:.2f} 秒{detail}")
+    cold = results[0][0]
+    if cold <= STARTUP_TARGET:
+        print(f"冷启动 {cold:.2f} 秒，达到 {STARTUP_TARGET:.0f} 秒目标")
+    else:
+        print(f"警告：冷启动 {cold:.2f} 秒，超过 {STARTUP_TARGET:.0f} 秒目标（单文件模式每次启动都要解压，可改用目录模式）")
+
+def build(profile='cdp', onefile=False, debug=False, probe=True):
+    """构建可执行文件"""
+    print(f"开始构建 PDF 生成器（打包配置：{profile}，{'单文件' if onefile else '目录'}模式）...")
+
+    # 清理之前的构建文件
+    clean_build_files()
+
+    # 创建必要的目录
+    create_directories()
 
-    # 添加调试信息收集
-    params.extend([
-        '--debug=all',  # 启用所有调试信息
-        '--log-level=DEBUG',  # 设置日志级别
-    ])
-    
     # 执行打包
     print("正在打包...")
-    PyInstaller.__main__.run(params)
-    
-    # 复制额外文件到dist目录
-    dist_dir = os.path.join('dist', 'PDF生成器')
+    PyInstaller.__main__.run(pyinstaller_params(profile, onefile, debug))
+
+    # 复制额外文件到dist目录（单文件模式时与 exe 放在一起）
+    dist_dir = 'dist' if onefile else os.path.join('dist', APP_NAME)
     if not os.path.exists(dist_dir):
         os.makedirs(dist_dir)
-        
+
     # 复制资源文件
     copy_resources(dist_dir)
-    
+    set_default_engine(dist_dir, BUILD_PROFILES[profile][0])
+
     # 清理 build 文件夹
     if os.path.exists('build'):
         shutil.rmtree('build')
         print("清理构建临时文件：build")
-    
+
     print("\n打包完成！")
     print(f"可执行文件位于：{os.path.abspath(dist_dir)}")
     print(f"构建时间：{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
     print("\n注意：")
-    print("1. 最终程序在 dist/PDF生成器 目录下")
-    print("2. 可以直接分发 dist/PDF生成器 目录")
+    print(f"1. 最终程序在 {dist_dir} 目录下")
+    print(f"2. 可以直接分发 {dist_dir} 目录")
     print("3. build 文件夹已自动清理")
     print("4. 请确保 finished 和 logs 目录存在且有写入权限")
+    print(f"5. 包含的引擎：{', '.join(BUILD_PROFILES[profile])}")
+
+    if probe:
+        executable = os.path.abspath(os.path.join(dist_dir, APP_NAME + ('.exe' if sys.platform == 'win32' else '')))
+        try:
+            report_startup(measure_startup(executable, dist_dir))
+        except Exception as e:
+            print(f"警告：启动时间测量失败：{str(e)}")
 
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="打包 PDF 生成器")
+    parser.add_argument('--profile', choices=sorted(BUILD_PROFILES), default='cdp',
+                        help="打包配置：只包含对应引擎（都包含 cdp），full 包含全部引擎")
+    parser.add_argument('--onefile', action='store_true', help="单文件模式（每次启动需要解压，启动较慢）")
+    parser.add_argument('--debug', action='store_true', help="启用 PyInstaller 调试信息")
+    parser.add_argument('--no-probe', action='store_true', help="打包后不测量启动时间")
+    args = parser.parse_args()
     try:
-        build()
+        build(args.profile, args.onefile, args.debug, not args.no_probe)
     except Exception as e:
         print(f"构建过程中发生错误：{str(e)}")
-        sys.exit(1) 
\ No newline at end of file
+        sys.exit(1)
@@ -0,0 +1,262 @@
+import os
+import time
+import random
+import logging
+import tempfile
+import threading
+from browser_pool import BrowserPool
+from concurrency_controller import free_memory_ratio
+from progress_tracker import format_duration
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+# 按内容长度把每个模板组的行分为几层，长文本（多页）和短文本分别抽样
+LENGTH_STRATA = 4
+# 推荐并发时最多使用的可用内存比例
+MEMORY_BUDGET = 0.8
+# 第二阶段等待所有浏览器预热完成的最长时间（秒）
+WARM_TIMEOUT = 120
+
+
+def process_memory():
+    """本进程及其子进程（浏览器）的常驻内存（字节），未安装 psutil 时返回 None"""
+    if psutil is None:
+        return None
+    try:
+        process = psutil.Process()
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.Error:
+                pass
+        return total
+    except psutil.Error:
+        return None
+
+
+def available_memory():
+    """可用内存（字节），无法获取时返回 None"""
+    if psutil is not None:
+        return psutil.virtual_memory().available
+    ratio = free_memory_ratio()
+    if ratio is None or not hasattr(os, 'sysconf'):
+        return None
+    try:
+        return int(ratio * os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES'))
+    except (ValueError, OSError):
+        return None
+
+
+def _timed_render(manager, template, values, directory):
+    """在浏览器线程中渲染一行并写入临时目录，返回 (打印秒数, 写盘秒数, 字节数)"""
+    started = time.perf_counter()
+    pdf_data = manager.render_values(template, values)
+    printed = time.perf_counter()
+    with tempfile.NamedTemporaryFile(dir=directory, suffix='.pdf', delete=False) as f:
+        f.write(pdf_data)
+    written = time.perf_counter()
+    os.remove(f.name)
+    return printed - started, written - printed, len(pdf_data)
+
+
+def _warm(manager, barrier):
+    """启动本线程的浏览器，并等到所有线程都领到预热任务，保证每个线程各预热一次"""
+    try:
+        manager.start()
+    except Exception:
+        barrier.abort()
+        raise
+    barrier.wait()
+
+
+class CapacityPlanner:
+    """试运行：分层抽样少量行走完整的渲染流程，测量各阶段耗时、内存和输出大小，推算整批任务的成本
+
+    先用一个浏览器串行渲染一半样本，得到每行耗时和单个浏览器的内存；
+    再按推荐并发渲染另一半，得到实际吞吐量。PDF 只写入临时目录，不产生最终输出。
+    """
+
+    def __init__(self, pdf_maker, sample_size=40, max_workers=None, seed=0):
+        self.pdf_maker = pdf_maker
+        self.config = pdf_maker.config
+        self.sample_size = max(2, sample_size)
+        self.max_workers = max_workers or int(
+            self.config.get('pool', 'max_size', default=str(os.cpu_count() or 2)))
+        self.random = random.Random(seed)
+
+    def stratify(self, groups):
+        """按模板和内容长度分层，返回 [(模板, [值元组, ...]), ...]"""
+        strata = []
+        for template, rows in groups:
+            ordered = sorted(rows.rows, key=lambda values: sum(len(value) for value in values))
+            count = min(LENGTH_STRATA, len(ordered))
+            for layer in range(count):
+                start = layer * len(ordered) // count
+                end = (layer + 1) * len(ordered) // count
+                if end > start:
+                    strata.append((template, ordered[start:end]))
+        return strata
+
+    def sample(self, strata):
+        """按层大小成比例抽样，每层至少一行，返回 [(层序号, 模板, 值元组), ...]"""
+        total = sum(len(rows) for _, rows in strata)
+        picked = []
+        for number, (template, rows) in enumerate(strata):
+            count = min(len(rows), max(1, round(self.sample_size * len(rows) / total)))
+            for values in self.random.sample(rows, count):
+                picked.append((number, template, values))
+        self.random.shuffle(picked)
+        return picked
+
+    def run(self, excel_file, field_mapping, selection=None):
+        """执行试运行，返回报告字典"""
+        started = time.perf_counter()
+        groups = self.pdf_maker.load_groups(excel_file, field_mapping, selection)
+        load_seconds = time.perf_counter() - started
+        total_rows = sum(len(rows) for _, rows in groups)
+        if not total_rows:
+            raise ValueError("没有需要生成的行")
+
+        strata = self.stratify(groups)
+        picked = self.sample(strata)
+
+        # HTML 拼接在本进程中完成，单独计时
+        started = time.perf_counter()
+        for _, template, values in picked:
+            template.render(values)
+        html_seconds = (time.perf_counter() - started) / len(picked)
+
+        results = [None] * len(picked)
+        serial = picked[:max(1, len(picked) // 2)]
+        baseline = process_memory()
+        pool = BrowserPool(self.config, size=self.max_workers, active=1)
+        with tempfile.TemporaryDirectory(prefix='dry_run_') as directory, pool:
+            started = time.perf_counter()
+            while pool.readiness()[0] == 'warming':
+                time.sleep(0.05)
+            if pool.readiness()[0] == 'failed':
+                raise RuntimeError(f"浏览器启动失败: {pool.warm_error}")
+            startup_seconds = time.perf_counter() - started
+
+            # 第一阶段：单个浏览器串行渲染，得到每行耗时
+            for position, (_, template, values) in enumerate(serial):
+                results[position] = pool.submit(_timed_render, template, values, directory).result()
+            single_memory = process_memory()
+            per_browser = None
+            if baseline is not None and single_memory is not None:
+                per_browser = max(0, single_memory - baseline)
+
+            service = sum(result[0] + result[1] for result in results[:len(serial)]) / len(serial)
+            workers, limits = self.recommend(per_browser)
+
+            # 第二阶段：按推荐并发渲染其余样本，得到实际吞吐量
+            parallel = picked[len(serial):]
+            throughput = None
+            peak_memory = single_memory
+            if parallel:
+                # 新恢复的线程在第一个任务时才启动浏览器，先全部预热，启动时间不计入吞吐量
+                active = pool.set_active(workers)
+                barrier = threading.Barrier(active, timeout=WARM_TIMEOUT)
+                for future in [pool.submit(_warm, barrier) for _ in range(active)]:
+                    future.result()
+                started = time.perf_counter()
+                futures = [pool.submit(_timed_render, template, values, directory)
+                           for _, template, values in parallel]
+                for position, future in enumerate(futures, start=len(serial)):
+                    results[position] = future.result()
+                    memory = process_memory()
+                    if memory is not None:
+                        peak_memory = max(peak_memory or 0, memory)
+                throughput = len(parallel) / (time.perf_counter() - started)
+
+        return self.report(
+            strata, picked, results, total_rows, load_seconds, html_seconds, startup_seconds,
+            service, workers, limits, throughput, per_browser, peak_memory, baseline)
+
+    def recommend(self, per_browser):
+        """按 CPU 核数、可用内存和 pool/max_size 推荐并发数，返回 (并发数, 各项上限)"""
+        limits = {'cpu': os.cpu_count() or 1, 'max_size': self.max_workers}
+        available = available_memory()
+        if per_browser and available:
+            # 已经启动的一个浏览器不计入可用内存
+            limits['memory'] = max(1, int((available * MEMORY_BUDGET + per_browser) // per_browser))
+        return max(1, min(limits.values())), limits
+
+    def report(self, strata, picked, results, total_rows, load_seconds, html_seconds,
+               startup_seconds, service, workers, limits, throughput, per_browser, peak_memory, baseline):
+        """按层加权推算总耗时和磁盘占用"""
+        by_layer = {}
+        for (number, _, _), result in zip(picked, results):
+            by_layer.setdefault(number, []).append(result)
+        service_total = size_total = 0.0
+        for number, (_, rows) in enumerate(strata):
+            measured = by_layer[number]
+            service_total += len(rows) * sum(p + w for p, w, _ in measured) / len(measured)
+            size_total += len(rows) * sum(size for _, _, size in measured) / len(measured)
+
+        print_seconds = sum(p for p, _, _ in results) / len(results)
+        write_seconds = sum(w for _, w, _ in results) / len(results)
+        # 并行效率：实际吞吐量与理想吞吐量之比，上限为 1
+        efficiency = 1.0
+        if throughput and service:
+            efficiency = min(1.0, throughput * service / workers)
+        projected = (load_seconds + startup_seconds + total_rows * html_seconds
+                     + service_total / (workers * efficiency))
+        return {
+            'rows': total_rows,
+            'sampled': len(picked),
+            'strata': len(strata),
+            'stages': {
+                'load': load_seconds,
+                'browser_start': startup_seconds,
+                'html_per_row': html_seconds,
+                'print_per_row': print_seconds,
+                'write_per_row': write_seconds,
+            },
+            'throughput': throughput,
+            'efficiency': efficiency,
+            'concurrency': workers,
+            'limits': limits,
+            'memory': {
+                'per_browser': per_browser,
+                'peak': peak_memory - baseline if peak_memory is not None and baseline is not None else None,
+            },
+            'bytes_per_row': size_total / total_rows,
+            'projected_seconds': projected,
+            'projected_bytes': size_total,
+        }
+
+    @staticmethod
+    def describe(report):
+        """生成便于阅读的报告文字"""
+        stages = report['stages']
+        megabyte = 1048576
+        memory = report['memory']
+        limits = "，".join(f"{name} {value}" for name, value in report['limits'].items())
+        lines = [
+            f"共 {report['rows']} 行，分 {report['strata']} 层抽样 {report['sampled']} 行",
+            f"读取数据 {stages['load']:.2f} 秒，浏览器启动 {stages['browser_start']:.2f} 秒",
+            f"每行：拼接 HTML {stages['html_per_row'] * 1000:.2f} 毫秒，"
+            f"打印 {stages['print_per_row'] * 1000:.0f} 毫秒，写盘 {stages['write_per_row'] * 1000:.1f} 毫秒，"
+            f"平均 {report['bytes_per_row'] / 1024:.1f} KB",
+        ]
+        if memory['per_browser'] is not None:
+            lines.append(f"每个浏览器约 {memory['per_browser'] / megabyte:.0f} MB，"
+                         f"试运行峰值增加 {(memory['peak'] or 0) / megabyte:.0f} MB")
+        else:
+            lines.append("未安装 psutil，无法测量内存，推荐并发只考虑 CPU")
+        if report['throughput']:
+            lines.append(f"并发 {report['concurrency']} 时实测 {report['throughput']:.2f} 行/秒，"
+                         f"并行效率 {report['efficiency']:.0%}")
+        lines += [
+            f"推荐并发：{report['concurrency']}（上限：{limits}）",
+            f"预计总耗时：{format_duration(report['projected_seconds'])}",
+            f"预计磁盘占用：{report['projected_bytes'] / megabyte:.1f} MB",
+        ]
+        return "\n".join(lines)
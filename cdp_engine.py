@@ -0,0 +1,458 @@
+import base64
+import itertools
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import tempfile
+import threading
+import time
+import queue
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+# 常见的 Chrome / Chromium 可执行文件名，paths/chrome_path 不存在时依次查找
+CHROME_NAMES = ('google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser', 'chrome', 'msedge')
+
+CHROME_ARGS = [
+    '--headless',
+    '--disable-gpu',
+    '--no-sandbox',
+    '--disable-dev-shm-usage',
+    '--no-first-run',
+    '--no-default-browser-check',
+    '--disable-extensions',
+    '--disable-background-networking',
+    '--disable-sync',
+    '--hide-scrollbars',
+    '--mute-audio',
+]
+
+
+class CDPError(Exception):
+    """DevTools 协议调用失败或连接断开"""
+
+
+def find_chrome(chrome_path=None):
+    """返回可用的 Chrome 可执行文件路径"""
+    if chrome_path and os.path.isfile(chrome_path):
+        return chrome_path
+    for name in CHROME_NAMES:
+        found = shutil.which(name)
+        if found:
+            return found
+    raise CDPError(f"找不到 Chrome 可执行文件: {chrome_path}")
+
+
+class PipeTransport:
+    """--remote-debugging-pipe：Chrome 从 fd 3 读取命令、向 fd 4 写入结果，消息以 \\0 分隔"""
+
+    def __init__(self, read_fd, write_fd):
+        self.read_fd = read_fd
+        self.write_fd = write_fd
+        self._buffer = b''
+        self._write_lock = threading.Lock()
+
+    def send(self, text):
+        data = text.encode('utf-8') + b'\0'
+        with self._write_lock:
+            view = memoryview(data)
+            while view:
+                written = os.write(self.write_fd, view)
+                view = view[written:]
+
+    def recv(self):
+        while True:
+            end = self._buffer.find(b'\0')
+            if end >= 0:
+                message, self._buffer = self._buffer[:end], self._buffer[end + 1:]
+                return message.decode('utf-8')
+            chunk = os.read(self.read_fd, 1024 * 1024)
+            if not chunk:
+                raise EOFError("DevTools 管道已关闭")
+            self._buffer += chunk
+
+    def close(self):
+        for fd in (self.read_fd, self.write_fd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+class WebSocketTransport:
+    """最小的 WebSocket 客户端（RFC 6455），只用于连接本机 DevTools 端口"""
+
+    def __init__(self, host, port, path, timeout=10):
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        key = base64.b64encode(os.urandom(16)).decode('ascii')
+        request = (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        )
+        self.sock.sendall(request.encode('ascii'))
+        self._file = self.sock.makefile('rb')
+        status = self._file.readline()
+        if b' 101 ' not in status:
+            raise CDPError(f"WebSocket 握手失败: {status.decode('latin-1').strip()}")
+        while self._file.readline() not in (b'\r\n', b''):
+            pass
+        self.sock.settimeout(None)
+        self._write_lock = threading.Lock()
+
+    def _send_frame(self, opcode, payload):
+        header = bytearray([0x80 | opcode])
+        length = len(payload)
+        if length < 126:
+            header.append(0x80 | length)
+        elif length < 1 << 16:
+            header.append(0x80 | 126)
+            header += struct.pack('!H', length)
+        else:
+            header.append(0x80 | 127)
+            header += struct.pack('!Q', length)
+        mask = os.urandom(4)
+        # 客户端发出的帧必须掩码，整块异或比逐字节快得多
+        repeated = (mask * (length // 4 + 1))[:length]
+        masked = (int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')).to_bytes(length, 'big')
+        with self._write_lock:
+            self.sock.sendall(bytes(header) + mask + masked)
+
+    def send(self, text):
+        self._send_frame(0x1, text.encode('utf-8'))
+
+    def _read_exact(self, size):
+        data = self._file.read(size)
+        if data is None or len(data) < size:
+            raise EOFError("DevTools 连接已关闭")
+        return data
+
+    def recv(self):
+        message = bytearray()
+        while True:
+            first, second = self._read_exact(2)
+            opcode = first & 0x0F
+            length = second & 0x7F
+            if length == 126:
+                length = struct.unpack('!H', self._read_exact(2))[0]
+            elif length == 127:
+                length = struct.unpack('!Q', self._read_exact(8))[0]
+            if second & 0x80:
+                mask = self._read_exact(4)
+                payload = bytes(b ^ mask[i % 4] for i, b in enumerate(self._read_exact(length)))
+            else:
+                payload = self._read_exact(length)
+            if opcode == 0x8:
+                raise EOFError("DevTools 连接已关闭")
+            if opcode == 0x9:
+                self._send_frame(0xA, payload)
+                continue
+            if opcode in (0x0, 0x1, 0x2):
+                message += payload
+                if first & 0x80:
+                    return message.decode('utf-8')
+
+    def close(self):
+        try:
+            self._send_frame(0x8, b'')
+        except OSError:
+            pass
+        self._file.close()
+        self.sock.close()
+
+
+class CDPConnection:
+    """DevTools 协议连接：后台线程读取消息，按 id 分发响应，按 (session, 事件名) 分发事件"""
+
+    def __init__(self, transport):
+        self.transport = transport
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._events = {}
+        self._lock = threading.Lock()
+        self.error = None
+        self._reader = threading.Thread(target=self._read_loop, name="cdp-reader", daemon=True)
+        self._reader.start()
+
+    @property
+    def is_alive(self):
+        return self.error is None
+
+    def _read_loop(self):
+        try:
+            while True:
+                message = json.loads(self.transport.recv())
+                if 'id' in message:
+                    with self._lock:
+                        future = self._pending.pop(message['id'], None)
+                    if future is None:
+                        continue
+                    if 'error' in message:
+                        future.set_exception(CDPError(message['error'].get('message', str(message['error']))))
+                    else:
+                        future.set_result(message.get('result', {}))
+                else:
+                    waiter = self._events.get((message.get('sessionId'), message.get('method')))
+                    if waiter is not None:
+                        waiter.put(message.get('params', {}))
+        except Exception as e:
+            self.error = e
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            for future in pending.values():
+                future.set_exception(CDPError(f"DevTools 连接已断开: {str(e)}"))
+
+    def send(self, method, params=None, session_id=None, timeout=60):
+        """发送命令并等待结果"""
+        if self.error is not None:
+            raise CDPError(f"DevTools 连接已断开: {str(self.error)}")
+        future = Future()
+        with self._lock:
+            message_id = next(self._ids)
+            self._pending[message_id] = future
+        message = {'id': message_id, 'method': method, 'params': params or {}}
+        if session_id:
+            message['sessionId'] = session_id
+        self.transport.send(json.dumps(message))
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            with self._lock:
+                self._pending.pop(message_id, None)
+            raise CDPError(f"{method} 超时")
+
+    def subscribe(self, session_id, method):
+        """订阅事件，返回接收事件参数的队列"""
+        waiter = queue.Queue()
+        self._events[(session_id, method)] = waiter
+        return waiter
+
+    def unsubscribe(self, session_id, method):
+        self._events.pop((session_id, method), None)
+
+    def close(self):
+        self.transport.close()
+
+
+class CDPPage:
+    """浏览器中的一个标签页（target），每个工作线程使用自己的标签页"""
+
+    def __init__(self, browser, target_id, session_id):
+        self.browser = browser
+        self.connection = browser.connection
+        self.target_id = target_id
+        self.session_id = session_id
+        self.html_path = os.path.join(browser.user_data_dir, f"page_{target_id}.html")
+        self._loaded = self.connection.subscribe(session_id, 'Page.loadEventFired')
+
+    def send(self, method, params=None, timeout=60):
+        return self.connection.send(method, params, session_id=self.session_id, timeout=timeout)
+
+    def load(self, html_content, timeout=30):
+        """写入临时文件后导航，等待 load 事件（图片、字体加载完成）"""
+        with open(self.html_path, 'w', encoding='utf-8') as f:
+            f.write(html_content)
+        while not self._loaded.empty():
+            self._loaded.get_nowait()
+        result = self.send('Page.navigate', {'url': Path(os.path.abspath(self.html_path)).as_uri()})
+        if result.get('errorText'):
+            raise CDPError(f"页面加载失败: {result['errorText']}")
+        try:
+            self._loaded.get(timeout=timeout)
+        except queue.Empty:
+            raise CDPError("等待页面加载超时")
+
+    def print_current(self, options):
+        """把当前页面打印为 PDF 字节"""
+        result = self.send('Page.printToPDF', options)
+        return base64.b64decode(result['data'])
+
+    def print_to_pdf(self, html_content, options):
+        """加载 HTML 并返回 PDF 字节"""
+        self.load(html_content)
+        return self.print_current(options)
+
+    def evaluate(self, expression):
+        """执行脚本并等待 Promise，返回结果值"""
+        result = self.send('Runtime.evaluate', {
+            'expression': expression, 'awaitPromise': True, 'returnByValue': True})
+        if 'exceptionDetails' in result:
+            details = result['exceptionDetails']
+            raise CDPError(f"脚本执行失败: {details.get('exception', {}).get('description') or details.get('text')}")
+        return result.get('result', {}).get('value')
+
+    def screenshot(self, html_content, width, height):
+        """按打印样式加载 HTML，返回 width x height 的 PNG 截图"""
+        self.send('Emulation.setDeviceMetricsOverride', {
+            'width': width, 'height': height, 'deviceScaleFactor': 1, 'mobile': False})
+        self.send('Emulation.setEmulatedMedia', {'media': 'print'})
+        try:
+            self.load(html_content)
+            result = self.send('Page.captureScreenshot', {
+                'format': 'png',
+                'clip': {'x': 0, 'y': 0, 'width': width, 'height': height, 'scale': 1}})
+        finally:
+            self.send('Emulation.setEmulatedMedia', {'media': ''})
+            self.send('Emulation.clearDeviceMetricsOverride')
+        return base64.b64decode(result['data'])
+
+    def close(self):
+        self.connection.unsubscribe(self.session_id, 'Page.loadEventFired')
+        try:
+            if self.connection.is_alive:
+                self.browser.connection.send('Target.closeTarget', {'targetId': self.target_id}, timeout=5)
+        except CDPError as e:
+            logger.debug("关闭标签页失败: %s", e)
+        if os.path.exists(self.html_path):
+            os.remove(self.html_path)
+
+
+class CDPBrowser:
+    """不经过 chromedriver，直接通过 DevTools 协议控制无头 Chrome
+
+    POSIX 上使用 --remote-debugging-pipe（通过 posix_spawn 把管道映射到 fd 3/4），
+    其他平台使用 --remote-debugging-port 和本机 WebSocket。一个浏览器进程可以同时打开多个标签页，
+    浏览器池的各个线程通过 acquire / release 共享同一个进程。
+    owned 为 True 时由调用方独占（不放入共享表），引用计数从 1 开始，release 时关闭。
+    """
+
+    _shared = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, chrome_path, transport='auto', owned=False):
+        self.chrome_path = find_chrome(chrome_path)
+        self._refs = 1 if owned else 0
+        self.pid = None
+        self.process = None
+        if transport == 'auto':
+            transport = 'pipe' if hasattr(os, 'posix_spawn') else 'websocket'
+        self.user_data_dir = tempfile.mkdtemp(prefix='chrome_cdp_')
+        args = [self.chrome_path] + CHROME_ARGS + [f'--user-data-dir={self.user_data_dir}']
+        try:
+            if transport == 'pipe':
+                self.connection = CDPConnection(self._spawn_with_pipe(args))
+            else:
+                self.connection = CDPConnection(self._spawn_with_port(args))
+        except BaseException:
+            # 启动或握手失败：结束已启动的进程并删除临时用户目录
+            try:
+                self._wait_or_kill(0)
+            except Exception as e:
+                logger.debug("结束 Chrome 进程失败: %s", e)
+            shutil.rmtree(self.user_data_dir, ignore_errors=True)
+            raise
+        logger.info(f"Chrome 已启动（DevTools {transport}）: {self.chrome_path}")
+
+    def _spawn_with_pipe(self, args):
+        # to_chrome: 我们写、Chrome 从 fd 3 读；from_chrome: Chrome 写 fd 4、我们读
+        to_chrome_read, to_chrome_write = os.pipe()
+        from_chrome_read, from_chrome_write = os.pipe()
+        try:
+            self.pid = os.posix_spawn(
+                args[0], args + ['--remote-debugging-pipe', 'about:blank'], os.environ,
+                file_actions=[
+                    (os.POSIX_SPAWN_DUP2, to_chrome_read, 3),
+                    (os.POSIX_SPAWN_DUP2, from_chrome_write, 4),
+                    (os.POSIX_SPAWN_OPEN, 1, os.devnull, os.O_WRONLY, 0),
+                    (os.POSIX_SPAWN_OPEN, 2, os.devnull, os.O_WRONLY, 0),
+                ])
+        finally:
+            os.close(to_chrome_read)
+            os.close(from_chrome_write)
+        return PipeTransport(from_chrome_read, to_chrome_write)
+
+    def _spawn_with_port(self, args, timeout=30):
+        self.process = subprocess.Popen(
+            args + ['--remote-debugging-port=0', 'about:blank'],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        # Chrome 启动后把实际端口和浏览器 WebSocket 路径写入 DevToolsActivePort
+        port_file = os.path.join(self.user_data_dir, 'DevToolsActivePort')
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.process.poll() is not None:
+                raise CDPError(f"Chrome 启动失败，退出码 {self.process.returncode}")
+            try:
+                with open(port_file, 'r', encoding='utf-8') as f:
+                    lines = f.read().split()
+                if len(lines) >= 2:
+                    return WebSocketTransport('127.0.0.1', int(lines[0]), lines[1])
+            except OSError:
+                pass
+            time.sleep(0.05)
+        raise CDPError("等待 Chrome DevTools 端口超时")
+
+    @classmethod
+    def acquire(cls, chrome_path, transport='auto'):
+        """获取共享的浏览器进程，进程已退出时重新启动"""
+        with cls._shared_lock:
+            key = (chrome_path, transport)
+            browser = cls._shared.get(key)
+            if browser is None or not browser.is_alive:
+                browser = cls(chrome_path, transport)
+                cls._shared[key] = browser
+            browser._refs += 1
+            return browser
+
+    def release(self):
+        """归还共享的浏览器进程，最后一个使用者归还时关闭"""
+        with self._shared_lock:
+            self._refs -= 1
+            if self._refs > 0:
+                return
+            for key, browser in list(self._shared.items()):
+                if browser is self:
+                    del self._shared[key]
+        self.close()
+
+    @property
+    def is_alive(self):
+        return self.connection.is_alive
+
+    def new_page(self):
+        """新建标签页并以 flatten 模式附加会话"""
+        target_id = self.connection.send('Target.createTarget', {'url': 'about:blank'})['targetId']
+        session_id = self.connection.send(
+            'Target.attachToTarget', {'targetId': target_id, 'flatten': True})['sessionId']
+        page = CDPPage(self, target_id, session_id)
+        page.send('Page.enable')
+        return page
+
+    def close(self, timeout=5):
+        """关闭浏览器进程并删除临时用户目录"""
+        try:
+            if self.connection.is_alive:
+                self.connection.send('Browser.close', timeout=timeout)
+        except Exception as e:
+            logger.debug("Browser.close 失败: %s", e)
+        self._wait_or_kill(timeout)
+        self.connection.close()
+        shutil.rmtree(self.user_data_dir, ignore_errors=True)
+
+    def _wait_or_kill(self, timeout):
+        if self.process is not None:
+            try:
+                self.process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            return
+        if self.pid is None:
+            return
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            pid, _ = os.waitpid(self.pid, os.WNOHANG)
+            if pid:
+                return
+            time.sleep(0.05)
+        os.kill(self.pid, signal.SIGKILL)
+        os.waitpid(self.pid, 0)
@@ -0,0 +1,174 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from browser_pool import BrowserPool
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+logger = logging.getLogger(__name__)
+
+
+def system_load():
+    """每个 CPU 核心的平均负载，无法获取时返回 None"""
+    cpus = os.cpu_count() or 1
+    if hasattr(os, 'getloadavg'):
+        return os.getloadavg()[0] / cpus
+    if psutil is not None:
+        return psutil.cpu_percent(interval=None) / 100
+    return None
+
+
+def free_memory_ratio():
+    """可用内存占总内存的比例，无法获取时返回 None"""
+    if psutil is not None:
+        memory = psutil.virtual_memory()
+        return memory.available / memory.total
+    try:
+        info = {}
+        with open('/proc/meminfo', 'r') as f:
+            for line in f:
+                name, value = line.split(':', 1)
+                info[name] = int(value.split()[0])
+        return info['MemAvailable'] / info['MemTotal']
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class ConcurrencyController:
+    """按 AIMD 策略自动调整浏览器池的并发数
+
+    每个采样周期统计吞吐量（行/秒）和单页耗时：吞吐量随并发增加而提升时加一；
+    内存不足、系统负载过高或单页耗时明显变长时减半；增加并发后吞吐量没有提升则退回一步。
+    所有调整都会记录日志，便于事后审查。
+    """
+
+    def __init__(self, pool, min_workers=1, max_workers=None, interval=5.0,
+                 min_free_memory=0.15, max_load=1.5, latency_factor=1.5):
+        self.pool = pool
+        self.min_workers = max(1, min_workers)
+        self.max_workers = min(max_workers or pool.size, pool.size)
+        self.interval = interval
+        self.min_free_memory = min_free_memory
+        self.max_load = max_load
+        self.latency_factor = latency_factor
+        self.decisions = deque(maxlen=200)
+        self._previous = None     # (并发数, 吞吐量)
+        self._baseline_latency = None
+        self._last_stats = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @classmethod
+    def from_config(cls, pool, config):
+        """根据 pool 配置段创建控制器，未启用自动调节时返回 None"""
+        if config.get('pool', 'adaptive', default='true').lower() == 'false':
+            return None
+        return cls(
+            pool,
+            min_workers=int(config.get('pool', 'min_size', default='1')),
+            max_workers=int(config.get('pool', 'max_size', default=str(pool.size))),
+            interval=float(config.get('pool', 'adjust_interval', default='5')),
+            min_free_memory=float(config.get('pool', 'min_free_memory', default='0.15')),
+            max_load=float(config.get('pool', 'max_load', default='1.5')))
+
+    def start(self):
+        """启动调节线程，停止后可以再次启动"""
+        if self._thread is not None and self._thread.is_alive():
+            return self
+        self._stop.clear()
+        self._last_stats = (time.perf_counter(),) + self.pool.stats()
+        self._thread = threading.Thread(target=self._run, name="concurrency-controller", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.step()
+            except Exception as e:
+                logger.error(f"并发调节失败: {str(e)}")
+
+    def sample(self):
+        """采集一个周期的指标"""
+        now = time.perf_counter()
+        completed, failed, busy = self.pool.stats()
+        last_time, last_completed, _, last_busy = self._last_stats
+        self._last_stats = (now, completed, failed, busy)
+        done = completed - last_completed
+        elapsed = now - last_time
+        return {
+            'workers': self.pool.active,
+            'throughput': done / elapsed if elapsed > 0 else 0.0,
+            'latency': (busy - last_busy) / done if done else None,
+            'load': system_load(),
+            'free_memory': free_memory_ratio(),
+            'pending': self.pool.pending
+        }
+
+    def decide(self, metrics):
+        """根据指标给出新的并发数和原因"""
+        workers = metrics['workers']
+        latency = metrics['latency']
+        if metrics['free_memory'] is not None and metrics['free_memory'] < self.min_free_memory:
+            return max(self.min_workers, workers // 2), "可用内存不足"
+        if metrics['load'] is not None and metrics['load'] > self.max_load:
+            return max(self.min_workers, workers // 2), "系统负载过高"
+        if latency is not None:
+            if self._baseline_latency is None or latency < self._baseline_latency:
+                self._baseline_latency = latency
+            elif latency > self._baseline_latency * self.latency_factor and workers > self.min_workers:
+                return max(self.min_workers, workers // 2), "单页耗时明显变长"
+        if metrics['throughput'] == 0:
+            return workers, "本周期没有完成的任务"
+        if self._previous is not None:
+            previous_workers, previous_throughput = self._previous
+            if workers > previous_workers and metrics['throughput'] < previous_throughput * 1.05:
+                return max(self.min_workers, workers - 1), "增加并发后吞吐量没有提升"
+        if metrics['pending'] == 0:
+            return workers, "没有积压任务"
+        if workers < self.max_workers:
+            return workers + 1, "吞吐量仍有提升空间"
+        return workers, "已达到并发上限"
+
+    def step(self):
+        """执行一次采样和调整"""
+        metrics = self.sample()
+        target, reason = self.decide(metrics)
+        workers = metrics['workers']
+        if metrics['throughput'] > 0:
+            self._previous = (workers, metrics['throughput'])
+        if target != workers:
+            self.pool.set_active(target)
+        latency = f"{metrics['latency'] * 1000:.0f} ms" if metrics['latency'] is not None else "-"
+        load = f"{metrics['load']:.2f}" if metrics['load'] is not None else "-"
+        memory = f"{metrics['free_memory']:.0%}" if metrics['free_memory'] is not None else "-"
+        logger.info(
+            f"并发调节: {workers} -> {target}（{reason}）吞吐 {metrics['throughput']:.2f} 行/秒，"
+            f"单页 {latency}，负载 {load}，可用内存 {memory}，排队 {metrics['pending']}")
+        self.decisions.append((time.time(), workers, target, reason, metrics))
+        return target
+
+
+def create_adaptive_pool(config):
+    """按配置创建浏览器池和并发控制器
+
+    线程数取 pool/max_size（默认 CPU 核数），初始并发为 pool/size；
+    pool/adaptive 为 false 时并发固定为 pool/size，控制器为 None。
+    """
+    config = config.snapshot()
+    initial = int(config.get('pool', 'size', default='2'))
+    if config.get('pool', 'adaptive', default='true').lower() == 'false':
+        return BrowserPool(config, size=initial), None
+    max_size = max(initial, int(config.get('pool', 'max_size', default=str(os.cpu_count() or 2))))
+    pool = BrowserPool(config, size=max_size, active=initial)
+    return pool, ConcurrencyController.from_config(pool, config)
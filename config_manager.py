@@ -1,12 +1,122 @@
 import xml.etree.ElementTree as ET
 import os
+import json
+import atexit
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+
+def _to_float(text, default):
+    try:
+        return float(text)
+    except (TypeError, ValueError):
+        return default
+
+
+def _to_bool(text, default):
+    if text is None:
+        return default
+    return text.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+@dataclass(frozen=True)
+class ConfigSnapshot:
+    """某一时刻配置的不可变快照，数值只在创建时解析一次，可以直接传给工作线程或进程"""
+    values: dict = field(repr=False)
+    chrome_path: str = None
+    template_path: str = None
+    output_dir: str = 'finished'
+    browser_type: str = 'local'
+    paper_width: float = 8.27
+    paper_height: float = 11.69
+    margin_top: float = 0.0
+    margin_bottom: float = 0.0
+    margin_left: float = 0.0
+    margin_right: float = 0.0
+    scale: float = 1.0
+    print_background: bool = True
+    prefer_css_page_size: bool = True
+
+    @classmethod
+    def from_values(cls, values):
+        """从 {(section, key): text} 字典创建快照"""
+        def text(section, key, default=None):
+            value = values.get((section, key))
+            return value if value is not None else default
+
+        return cls(
+            values=dict(values),
+            chrome_path=text('paths', 'chrome_path'),
+            template_path=text('paths', 'template_path'),
+            output_dir=text('paths', 'output_dir', 'finished'),
+            browser_type=text('browser', 'type', 'local'),
+            paper_width=_to_float(text('pdf_settings', 'paper_width'), 8.27),
+            paper_height=_to_float(text('pdf_settings', 'paper_height'), 11.69),
+            margin_top=_to_float(text('pdf_settings', 'margin_top'), 0.0),
+            margin_bottom=_to_float(text('pdf_settings', 'margin_bottom'), 0.0),
+            margin_left=_to_float(text('pdf_settings', 'margin_left'), 0.0),
+            margin_right=_to_float(text('pdf_settings', 'margin_right'), 0.0),
+            scale=_to_float(text('pdf_settings', 'scale'), 1.0),
+            print_background=_to_bool(text('pdf_settings', 'print_background'), True),
+            prefer_css_page_size=_to_bool(text('pdf_settings', 'prefer_css_page_size'), True),
+        )
+
+    def get(self, section, key, default=None):
+        """与 ConfigManager.get 相同的取值接口"""
+        value = self.values.get((section, key))
+        return value if value is not None else default
+
+    def get_float(self, section, key, default=0.0):
+        return _to_float(self.values.get((section, key)), default)
+
+    def get_bool(self, section, key, default=False):
+        return _to_bool(self.values.get((section, key)), default)
+
+    def snapshot(self):
+        return self
+
+    @property
+    def pdf_options(self):
+        """Page.printToPDF 使用的参数"""
+        return {
+            'paperWidth': self.paper_width,
+            'paperHeight': self.paper_height,
+            'marginTop': self.margin_top,
+            'marginBottom': self.margin_bottom,
+            'marginLeft': self.margin_left,
+            'marginRight': self.margin_right,
+            'printBackground': self.print_background,
+            'preferCSSPageSize': self.prefer_css_page_size,
+            'scale': self.scale
+        }
+
+
+def load_field_mapping(path):
+    """读取保存的字段映射（Excel 列名 -> HTML 占位符）"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_field_mapping(field_mapping, path):
+    """保存字段映射为 JSON 文件"""
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(field_mapping, f, ensure_ascii=False, indent=2)
+
 
 class ConfigManager:
-    def __init__(self):
+    def __init__(self, save_delay=0.5):
         self.config_file = 'config.xml'
         self.tree = None
         self.root = None
+        # 写入防抖：set 之后延迟 save_delay 秒统一写盘，0 表示立即写盘
+        self.save_delay = save_delay
+        self._lock = threading.RLock()
+        self._dirty = False
+        self._batch_depth = 0
+        self._save_timer = None
         self.load_config()
+        atexit.register(self.flush)
         
     def load_config(self):
         """加载配置文件"""
@@ -25,6 +135,8 @@ class ConfigManager:
         ET.SubElement(paths, 'chrome_path').text = r"C:\Program Files\Google\Chrome\Application\chrome.exe"
         ET.SubElement(paths, 'template_path').text = "tr91vewuqjsieb6ot1zd.html"
         ET.SubElement(paths, 'output_dir').text = "finished"
+        ET.SubElement(paths, 'cache_dir').text = "cache"
+        ET.SubElement(paths, 'mapping_file').text = "field_mapping.json"
         
         # PDF 设置
         pdf_settings = ET.SubElement(self.root, 'pdf_settings')
@@ -36,16 +148,107 @@ class ConfigManager:
         ET.SubElement(pdf_settings, 'margin_right').text = "0"
         ET.SubElement(pdf_settings, 'scale').text = "1.0"
         
+        # 输入缓存设置
+        cache = ET.SubElement(self.root, 'cache')
+        ET.SubElement(cache, 'enabled').text = "true"
+        ET.SubElement(cache, 'max_entries').text = "20"
+        
+        # 浏览器池设置：初始并发、自动调节上下限
+        pool = ET.SubElement(self.root, 'pool')
+        ET.SubElement(pool, 'size').text = "2"
+        ET.SubElement(pool, 'adaptive').text = "true"
+        ET.SubElement(pool, 'min_size').text = "1"
+        ET.SubElement(pool, 'max_size').text = str(os.cpu_count() or 2)
+        ET.SubElement(pool, 'adjust_interval').text = "5"
+        
+        # 按列选择模板：column 为空时所有行使用 paths/template_path
+        templates = ET.SubElement(self.root, 'templates')
+        ET.SubElement(templates, 'column').text = ""
+        ET.SubElement(templates, 'rules_file').text = "template_rules.json"
+        ET.SubElement(templates, 'directory').text = ""
+        ET.SubElement(templates, 'cache_size').text = "16"
+        # 选择模板时预优化（压缩 HTML/CSS、缩小内嵌图片），结果保存在原模板旁
+        ET.SubElement(templates, 'optimize').text = "true"
+        # 删除模板中没有元素匹配的类名和 ID 选择器；值中会插入带类名的 HTML 时保持 false
+        ET.SubElement(templates, 'strip_selectors').text = "false"
+        ET.SubElement(templates, 'image_dpi').text = "200"
+        
+        # 任务队列：同时运行的任务数，优先级更高的任务不受此限制
+        jobs = ET.SubElement(self.root, 'jobs')
+        ET.SubElement(jobs, 'max_running').text = "2"
+        
+        # PDF 后处理（需要 pikepdf）：压缩并去重，merge_batch 大于 0 时每批合并为一个文件
+        postprocess = ET.SubElement(self.root, 'postprocess')
+        ET.SubElement(postprocess, 'enabled').text = "false"
+        ET.SubElement(postprocess, 'workers').text = "2"
+        ET.SubElement(postprocess, 'merge_batch').text = "0"
+        ET.SubElement(postprocess, 'keep_originals').text = "true"
+        
+        # 日志设置：production 仅记录 INFO 及以上并输出逐行 JSON 明细，debug 记录全部调试信息
+        logging_settings = ET.SubElement(self.root, 'logging')
+        ET.SubElement(logging_settings, 'profile').text = "production"
+        ET.SubElement(logging_settings, 'row_sample_rate').text = "1.0"
+        
         # 浏览器设置
         browser = ET.SubElement(self.root, 'browser')
-        ET.SubElement(browser, 'type').text = "local"  # local, undetected, playwright
+        ET.SubElement(browser, 'type').text = "local"  # local, undetected, playwright, cdp, weasyprint
+        # cdp 引擎：auto 时 POSIX 使用管道、Windows 使用本机 WebSocket；shared 为 true 时池中各线程共享一个 Chrome 进程
+        ET.SubElement(browser, 'cdp_transport').text = "auto"
+        ET.SubElement(browser, 'cdp_shared').text = "true"
+        # 热页面模式：模板每个标签页只加载一次，每行通过脚本注入值，无法绑定的模板自动整页加载
+        ET.SubElement(browser, 'hot_page').text = "false"
         
         self.tree = ET.ElementTree(self.root)
         self.save_config()
         
     def save_config(self):
         """保存配置到文件"""
-        self.tree.write(self.config_file, encoding='utf-8', xml_declaration=True)
+        with self._lock:
+            self.tree.write(self.config_file, encoding='utf-8', xml_declaration=True)
+            self._dirty = False
+            
+    def flush(self):
+        """立即写入尚未保存的修改"""
+        with self._lock:
+            if self._save_timer is not None:
+                self._save_timer.cancel()
+                self._save_timer = None
+            if self._dirty:
+                self.save_config()
+                
+    @contextmanager
+    def batch(self):
+        """批量修改配置，退出时只写一次文件"""
+        with self._lock:
+            self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._batch_depth -= 1
+                if self._batch_depth == 0:
+                    self.flush()
+                    
+    def _schedule_save(self):
+        if self._batch_depth > 0:
+            return
+        if self.save_delay <= 0:
+            self.flush()
+            return
+        if self._save_timer is not None:
+            self._save_timer.cancel()
+        self._save_timer = threading.Timer(self.save_delay, self.flush)
+        self._save_timer.daemon = True
+        self._save_timer.start()
+        
+    def snapshot(self):
+        """获取当前配置的不可变快照"""
+        with self._lock:
+            values = {}
+            for section in self.root:
+                for key in section:
+                    values[(section.tag, key.tag)] = key.text
+        return ConfigSnapshot.from_values(values)
         
     def get(self, section, key, default=None):
         """获取配置值"""
@@ -53,14 +256,19 @@ class ConfigManager:
         return element.text if element is not None else default
         
     def set(self, section, key, value):
-        """设置配置值"""
-        section_element = self.root.find(f'.//{section}')
-        if section_element is None:
-            section_element = ET.SubElement(self.root, section)
-            
-        key_element = section_element.find(key)
-        if key_element is None:
-            key_element = ET.SubElement(section_element, key)
-            
-        key_element.text = str(value)
-        self.save_config() 
\ No newline at end of file
+        """设置配置值（写盘经过防抖或批量合并）"""
+        with self._lock:
+            section_element = self.root.find(f'.//{section}')
+            if section_element is None:
+                section_element = ET.SubElement(self.root, section)
+                
+            key_element = section_element.find(key)
+            if key_element is None:
+                key_element = ET.SubElement(section_element, key)
+                
+            if key_element.text == str(value):
+                return
+            key_element.text = str(value)
+            self._dirty = True
+            self._schedule_save()
+ 
\ No newline at end of file
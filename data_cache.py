@@ -0,0 +1,271 @@
+import os
+import hashlib
+import logging
+from itertools import repeat
+
+try:
+    import pyarrow  # noqa: F401
+    HAS_ARROW = True
+except ImportError:
+    HAS_ARROW = False
+
+logger = logging.getLogger(__name__)
+
+EXCEL_EXTENSIONS = ('.xlsx', '.xls')
+CSV_EXTENSIONS = ('.csv',)
+PARQUET_EXTENSIONS = ('.parquet', '.pq')
+SUPPORTED_EXTENSIONS = EXCEL_EXTENSIONS + CSV_EXTENSIONS + PARQUET_EXTENSIONS
+
+# 文件选择对话框使用的过滤器
+FILE_DIALOG_FILTER = (
+    "数据文件 (*.xlsx *.xls *.csv *.parquet);;"
+    "Excel Files (*.xlsx *.xls);;"
+    "CSV Files (*.csv);;"
+    "Parquet Files (*.parquet)"
+)
+
+
+def _pandas():
+    """延迟导入 pandas：界面启动时不加载，第一次读取数据时才导入"""
+    import pandas
+    return pandas
+
+
+def format_value(value):
+    """格式化值，处理不同的数据类型"""
+    if isinstance(value, str):
+        return value
+    if value is None or _pandas().isna(value):  # 处理空值
+        return ""
+    elif isinstance(value, (int, float)):  # 处理数字
+        if isinstance(value, float) and value.is_integer():
+            return str(int(value))
+        return str(value)
+    return str(value)
+
+
+class MappedRows:
+    """紧凑的行数据：每行一个字符串元组，顺序与编译模板的占位符列表一致"""
+
+    __slots__ = ('placeholders', 'rows', 'keys', 'indices')
+
+    def __init__(self, placeholders, rows, keys, indices):
+        self.placeholders = placeholders
+        self.rows = rows          # [(str, ...), ...]
+        self.keys = keys          # 每行用于输出文件名的键值，可能为 None
+        self.indices = indices    # 每行在原始数据中的行号（从 0 开始）
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        """依次返回 (原始行号, 键值, 值元组)"""
+        return zip(self.indices, self.keys, self.rows)
+
+    def slice(self, start, end):
+        """按位置截取一段行"""
+        return MappedRows(self.placeholders, self.rows[start:end],
+                          self.keys[start:end], self.indices[start:end])
+
+
+class DataCache:
+    """输入数据缓存：Excel 首次读取后转存为列式文件，之后直接内存映射读取"""
+
+    def __init__(self, config=None):
+        if config is not None:
+            self.cache_dir = config.get('paths', 'cache_dir', default='cache')
+            self.enabled = config.get('cache', 'enabled', default='true').lower() != 'false'
+            self.max_entries = int(config.get('cache', 'max_entries', default='20'))
+        else:
+            self.cache_dir = 'cache'
+            self.enabled = True
+            self.max_entries = 20
+        # (路径, 大小, 修改时间) -> 文件哈希，避免同一进程内重复计算
+        self._hash_memo = {}
+
+    def file_hash(self, path):
+        """计算文件内容哈希"""
+        stat = os.stat(path)
+        memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime)
+        digest = self._hash_memo.get(memo_key)
+        if digest is None:
+            sha1 = hashlib.sha1()
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                    sha1.update(chunk)
+            digest = sha1.hexdigest()
+            self._hash_memo[memo_key] = digest
+        return digest
+
+    def _cache_candidates(self, digest):
+        """返回某个哈希可能对应的缓存文件（按优先级）"""
+        base = os.path.join(self.cache_dir, digest)
+        candidates = [base + '.pkl']
+        if HAS_ARROW:
+            candidates.insert(0, base + '.parquet')
+        return candidates
+
+    def read(self, path, columns=None):
+        """读取数据文件，支持 Excel / CSV / Parquet
+
+        columns 为需要的列名，文件中不存在的列会被忽略；为 None 时读取全部列。
+        """
+        if columns is not None:
+            columns = list(dict.fromkeys(columns))
+            wanted = set(columns)
+            usecols = lambda column: column in wanted
+        else:
+            usecols = None
+
+        ext = os.path.splitext(path)[1].lower()
+        if ext in CSV_EXTENSIONS:
+            return _pandas().read_csv(path, usecols=usecols)
+        if ext in PARQUET_EXTENSIONS:
+            return self._read_parquet(path, columns)
+        if ext not in EXCEL_EXTENSIONS:
+            raise ValueError(f"不支持的数据文件类型: {ext}")
+
+        if not self.enabled:
+            return _pandas().read_excel(path, usecols=usecols)
+
+        digest = self.file_hash(path)
+        for cache_file in self._cache_candidates(digest):
+            if os.path.exists(cache_file):
+                try:
+                    df = self._load_cache_file(cache_file, columns)
+                    # 更新修改时间，prune 时按最近使用保留
+                    os.utime(cache_file, None)
+                    logger.info(f"命中输入缓存: {cache_file}")
+                    return df
+                except Exception as e:
+                    logger.warning(f"读取输入缓存失败，重新解析 Excel: {str(e)}")
+
+        # 缓存保存完整表格，不同映射可以复用同一份缓存
+        df = _pandas().read_excel(path)
+        self._store(digest, df)
+        return self._project(df, columns)
+
+    def columns(self, path):
+        """读取数据文件的列名"""
+        return list(self.read(path).columns)
+
+    def load_rows(self, path, template, field_mapping, key_field=None, selection=None):
+        """只读取映射用到的列，并转换为按占位符排序的紧凑行数据
+
+        selection 为 RowSelection 时只保留选中的行，行号仍为原始行号。
+        """
+        mapped_columns = template.columns_for(field_mapping)
+        wanted = [column for column in mapped_columns if column is not None]
+        if key_field:
+            wanted.append(key_field)
+        df = self.read(path, columns=wanted).reset_index(drop=True)
+        logger.info(f"按映射读取 {len(df.columns)} 列，共 {len(df)} 行")
+        if selection:
+            df = selection.apply(df, key_field)
+        return self._mapped_rows(df, template, field_mapping, key_field)
+
+    def load_template_groups(self, path, selector, templates, field_mapping, key_field=None, selection=None):
+        """按 selector 为每行选择模板，返回 [(CompiledTemplate, MappedRows), ...]
+
+        同一模板的行放在一组，组内保持原始顺序；templates 为 TemplateCache。
+        """
+        wanted = list(field_mapping) + [selector.column]
+        if key_field:
+            wanted.append(key_field)
+        df = self.read(path, columns=wanted).reset_index(drop=True)
+        logger.info(f"按映射读取 {len(df.columns)} 列，共 {len(df)} 行")
+        if selector.column not in df.columns:
+            raise ValueError(f"数据中没有模板选择列: {selector.column}")
+        if selection:
+            df = selection.apply(df, key_field)
+
+        selector.refresh()
+        template_paths = df[selector.column].map(lambda value: selector.path_for(format_value(value)))
+        groups = []
+        for template_path, group in df.groupby(template_paths, sort=False):
+            template = templates.get(template_path)
+            groups.append((template, self._mapped_rows(group, template, field_mapping, key_field)))
+            logger.info(f"模板 {os.path.basename(template_path)}：{len(group)} 行")
+        return groups
+
+    def _mapped_rows(self, df, template, field_mapping, key_field):
+        """按列格式化后再组装成元组，避免逐行构造 Series；行号取自 df 的索引"""
+        mapped_columns = template.columns_for(field_mapping)
+        formatted = {
+            column: [format_value(v) for v in df[column].tolist()]
+            for column in set(mapped_columns + [key_field]) if column in df.columns
+        }
+        total = len(df)
+        row_columns = [
+            formatted[column] if column in formatted else repeat("", total)
+            for column in mapped_columns
+        ]
+        rows = list(zip(*row_columns)) if row_columns else [()] * total
+        keys = formatted.get(key_field) if key_field else None
+        if keys is None:
+            keys = [None] * total
+        return MappedRows(template.placeholders, rows, keys, df.index.tolist())
+
+    def _project(self, df, columns):
+        if columns is None:
+            return df
+        return df[[column for column in columns if column in df.columns]]
+
+    def _read_parquet(self, path, columns):
+        if columns is not None:
+            import pyarrow.parquet as pq
+            names = set(pq.read_schema(path).names)
+            columns = [column for column in columns if column in names]
+        return _pandas().read_parquet(path, columns=columns, memory_map=True)
+
+    def _load_cache_file(self, cache_file, columns):
+        if cache_file.endswith('.parquet'):
+            return self._read_parquet(cache_file, columns)
+        return self._project(_pandas().read_pickle(cache_file), columns)
+
+    def _store(self, digest, df):
+        """将 DataFrame 写入缓存，先写临时文件再原子替换"""
+        try:
+            if not os.path.exists(self.cache_dir):
+                os.makedirs(self.cache_dir)
+            if HAS_ARROW:
+                cache_file = os.path.join(self.cache_dir, digest + '.parquet')
+                try:
+                    self._atomic_write(cache_file, lambda tmp: df.to_parquet(tmp, index=False))
+                    logger.info(f"已写入输入缓存: {cache_file}")
+                    self.prune()
+                    return
+                except (TypeError, ValueError, pyarrow.ArrowException) as e:
+                    # 混合类型列或非字符串列名无法写入 Parquet，退回 pickle
+                    logger.debug(f"Parquet 缓存写入失败，改用 pickle: {str(e)}")
+            cache_file = os.path.join(self.cache_dir, digest + '.pkl')
+            self._atomic_write(cache_file, df.to_pickle)
+            logger.info(f"已写入输入缓存: {cache_file}")
+            self.prune()
+        except Exception as e:
+            logger.warning(f"写入输入缓存失败: {str(e)}")
+
+    def _atomic_write(self, cache_file, writer):
+        tmp_file = f"{cache_file}.{os.getpid()}.tmp"
+        try:
+            writer(tmp_file)
+            os.replace(tmp_file, cache_file)
+        finally:
+            if os.path.exists(tmp_file):
+                os.remove(tmp_file)
+
+    def prune(self):
+        """仅保留最近使用的若干个缓存文件"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        entries = [
+            os.path.join(self.cache_dir, name)
+            for name in os.listdir(self.cache_dir)
+            if name.endswith(('.parquet', '.pkl'))
+        ]
+        entries.sort(key=os.path.getmtime, reverse=True)
+        for stale in entries[self.max_entries:]:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
@@ -0,0 +1,348 @@
+import json
+import logging
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from browser_pool import BrowserPool
+from concurrency_controller import create_adaptive_pool
+from PDF_Maker import PDFMaker
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    input_path TEXT NOT NULL,
+    template_path TEXT NOT NULL,
+    field_mapping TEXT NOT NULL,
+    total_rows INTEGER NOT NULL,
+    created REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS tasks (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    job_id INTEGER NOT NULL REFERENCES jobs(id),
+    start_row INTEGER NOT NULL,
+    end_row INTEGER NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    succeeded INTEGER NOT NULL DEFAULT 0,
+    failed INTEGER NOT NULL DEFAULT 0,
+    elapsed REAL,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS idx_tasks_status ON tasks(status, lease_until);
+"""
+
+
+class JobQueue:
+    """基于 SQLite 的任务队列，数据库文件放在共享存储上即可供多台机器使用
+
+    任务状态：pending -> leased -> done / failed。租约过期的 leased 任务会被其他节点重新领取，
+    超过最大尝试次数后标记为 failed。
+    """
+
+    def __init__(self, db_path, max_attempts=3, clock=time.time):
+        self.db_path = db_path
+        self.max_attempts = max_attempts
+        # 取当前时间的函数，测试时可替换为假时钟
+        self.clock = clock
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        # 网络文件系统上不使用 WAL，依赖默认的回滚日志和文件锁
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def add_job(self, input_path, template_path, field_mapping, total_rows, chunk_size):
+        """登记任务并按行区间拆分，返回 job id"""
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            cursor = conn.execute(
+                'INSERT INTO jobs (input_path, template_path, field_mapping, total_rows, created) '
+                'VALUES (?, ?, ?, ?, ?)',
+                (input_path, template_path, json.dumps(field_mapping, ensure_ascii=False),
+                 total_rows, self.clock()))
+            job_id = cursor.lastrowid
+            conn.executemany(
+                'INSERT INTO tasks (job_id, start_row, end_row, updated) VALUES (?, ?, ?, ?)',
+                [(job_id, start, min(start + chunk_size, total_rows), self.clock())
+                 for start in range(0, total_rows, chunk_size)])
+            conn.execute('COMMIT')
+            return job_id
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def get_job(self, job_id):
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM jobs WHERE id = ?', (job_id,)).fetchone()
+            return dict(row) if row else None
+        finally:
+            conn.close()
+
+    def claim(self, worker, lease_seconds):
+        """领取一个待处理或租约已过期的任务，没有任务时返回 None"""
+        now = self.clock()
+        conn = self._connect()
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            # 协调节点可能已经退出，领取时顺带把用尽尝试次数的过期任务标记为失败
+            expired = self._expire_exhausted(conn, now)
+            if expired:
+                logger.warning(f"{expired} 个分片租约过期且尝试次数已用尽，标记为失败")
+            row = conn.execute(
+                "SELECT * FROM tasks WHERE (status = 'pending' "
+                "OR (status = 'leased' AND lease_until < ?)) AND attempts < ? "
+                "ORDER BY id LIMIT 1",
+                (now, self.max_attempts)).fetchone()
+            if row is None:
+                conn.execute('COMMIT')
+                return None
+            if row['status'] == 'leased':
+                logger.warning(f"任务 {row['id']} 的租约已过期（原节点 {row['worker']}），重新分配")
+            conn.execute(
+                "UPDATE tasks SET status = 'leased', worker = ?, lease_until = ?, "
+                "attempts = attempts + 1, updated = ? WHERE id = ?",
+                (worker, now + lease_seconds, now, row['id']))
+            conn.execute('COMMIT')
+            return dict(row)
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        finally:
+            conn.close()
+
+    def renew(self, task_id, worker, lease_seconds):
+        """续租，返回租约是否仍属于该节点"""
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE tasks SET lease_until = ?, updated = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (self.clock() + lease_seconds, self.clock(), task_id, worker))
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def complete(self, task_id, worker, succeeded, failed, elapsed):
+        """上报任务完成情况，租约已被其他节点接管时返回 False"""
+        status = 'done' if failed == 0 else 'failed'
+        conn = self._connect()
+        try:
+            cursor = conn.execute(
+                "UPDATE tasks SET status = ?, succeeded = ?, failed = ?, elapsed = ?, "
+                "lease_until = NULL, updated = ? WHERE id = ? AND worker = ? AND status = 'leased'",
+                (status, succeeded, failed, elapsed, self.clock(), task_id, worker))
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def expire_exhausted(self):
+        """租约过期且尝试次数用尽的任务标记为失败"""
+        conn = self._connect()
+        try:
+            return self._expire_exhausted(conn, self.clock())
+        finally:
+            conn.close()
+
+    def _expire_exhausted(self, conn, now):
+        cursor = conn.execute(
+            "UPDATE tasks SET status = 'failed', updated = ? "
+            "WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+            (now, now, self.max_attempts))
+        return cursor.rowcount
+
+    def summary(self, job_id):
+        """返回任务进度和各节点的统计"""
+        conn = self._connect()
+        try:
+            statuses = {
+                row['status']: row['count'] for row in conn.execute(
+                    'SELECT status, COUNT(*) AS count FROM tasks WHERE job_id = ? GROUP BY status',
+                    (job_id,))
+            }
+            workers = [
+                dict(row) for row in conn.execute(
+                    "SELECT worker, COUNT(*) AS tasks, SUM(succeeded) AS succeeded, "
+                    "SUM(failed) AS failed, SUM(elapsed) AS elapsed FROM tasks "
+                    "WHERE job_id = ? AND status IN ('done', 'failed') GROUP BY worker",
+                    (job_id,))
+            ]
+            return {'tasks': statuses, 'workers': workers}
+        finally:
+            conn.close()
+
+
+class Coordinator:
+    """协调节点：把数据文件拆成行区间任务并发布到队列，等待所有节点完成"""
+
+    def __init__(self, config, db_path, chunk_size=None):
+        self.config = config.snapshot()
+        self.queue = JobQueue(db_path)
+        self.chunk_size = chunk_size or int(self.config.get('queue', 'chunk_size', default='200'))
+        self.pdf_maker = PDFMaker(self.config)
+
+    def publish(self, input_path, field_mapping):
+        """发布任务，返回 job id"""
+        rows = self.pdf_maker.load_rows(input_path, field_mapping)
+        job_id = self.queue.add_job(
+            os.path.abspath(input_path), self.pdf_maker.get_template().path,
+            field_mapping, len(rows), self.chunk_size)
+        logger.info(f"已发布任务 {job_id}: {input_path}，共 {len(rows)} 行，每个分片 {self.chunk_size} 行")
+        return job_id
+
+    def wait(self, job_id, interval=2.0):
+        """等待任务全部结束，返回最终统计"""
+        while True:
+            self.queue.expire_exhausted()
+            summary = self.queue.summary(job_id)
+            tasks = summary['tasks']
+            remaining = tasks.get('pending', 0) + tasks.get('leased', 0)
+            logger.info(f"任务 {job_id} 进度: {tasks}")
+            if remaining == 0:
+                for worker in summary['workers']:
+                    logger.info(
+                        f"节点 {worker['worker']}: {worker['tasks']} 个分片，成功 {worker['succeeded']} 行，"
+                        f"失败 {worker['failed']} 行，耗时 {worker['elapsed'] or 0:.1f} 秒")
+                return summary
+            time.sleep(interval)
+
+
+class Worker:
+    """工作节点：循环领取任务，用自己的浏览器池生成 PDF 并上报结果"""
+
+    def __init__(self, config, db_path, workers=None, lease_seconds=None, name=None):
+        self.config = config.snapshot()
+        self.queue = JobQueue(db_path)
+        self.lease_seconds = lease_seconds or float(self.config.get('queue', 'lease_seconds', default='60'))
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:4]}"
+        self.pdf_maker = PDFMaker(self.config)
+        # 指定浏览器数量时并发固定，否则自动调节
+        if workers:
+            self.pool, self.controller = BrowserPool(self.config, size=workers), None
+        else:
+            self.pool, self.controller = create_adaptive_pool(self.config)
+        self._rows = (None, None)  # (job id, 行数据)，同一任务的分片复用读取结果
+        self._stop = threading.Event()
+
+    def load_job_rows(self, job_id):
+        if self._rows[0] != job_id:
+            job = self.queue.get_job(job_id)
+            template = self.pdf_maker.get_template(job['template_path'])
+            rows = self.pdf_maker.data_cache.load_rows(
+                job['input_path'], template, json.loads(job['field_mapping']),
+                key_field=self.pdf_maker.key_field)
+            self._rows = (job_id, (template, rows))
+        return self._rows[1]
+
+    def run_task(self, task):
+        """处理一个分片，处理期间后台线程持续续租"""
+        lease_lost = threading.Event()
+        finished = threading.Event()
+
+        def heartbeat():
+            while not finished.wait(self.lease_seconds / 3):
+                if not self.queue.renew(task['id'], self.name, self.lease_seconds):
+                    lease_lost.set()
+                    return
+
+        renewer = threading.Thread(target=heartbeat, daemon=True)
+        renewer.start()
+        started = time.perf_counter()
+        try:
+            template, rows = self.load_job_rows(task['job_id'])
+            chunk = rows.slice(task['start_row'], task['end_row'])
+            # 分片可能被重新分配给其他节点，输出文件名按行固定，重跑时覆盖而不是多出一份
+            succeeded, failed = self.pdf_maker.process_rows(
+                chunk, self.pool, template=template, stable_names=True,
+                should_stop=lambda: lease_lost.is_set() or self._stop.is_set())
+        except Exception as e:
+            logger.error(f"分片 {task['id']} 处理失败: {str(e)}")
+            succeeded, failed = 0, task['end_row'] - task['start_row']
+        finally:
+            finished.set()
+            renewer.join()
+        elapsed = time.perf_counter() - started
+
+        if lease_lost.is_set() or self._stop.is_set():
+            logger.warning(f"分片 {task['id']} 未完成（租约丢失或节点停止），交由其他节点重新处理")
+            return
+        if self.queue.complete(task['id'], self.name, succeeded, failed, elapsed):
+            rate = succeeded / elapsed if elapsed > 0 else 0
+            logger.info(
+                f"分片 {task['id']} 完成: 行 {task['start_row']}-{task['end_row']}，"
+                f"成功 {succeeded}，失败 {failed}，{rate:.1f} 行/秒")
+        else:
+            logger.warning(f"分片 {task['id']} 的租约已被其他节点接管，结果未上报")
+
+    def run(self, exit_when_idle=False, idle_interval=2.0):
+        """循环领取任务"""
+        self.pool.start()
+        if self.controller:
+            self.controller.start()
+        logger.info(f"工作节点 {self.name} 已启动")
+        try:
+            while not self._stop.is_set():
+                task = self.queue.claim(self.name, self.lease_seconds)
+                if task is None:
+                    if exit_when_idle:
+                        break
+                    self._stop.wait(idle_interval)
+                    continue
+                self.run_task(task)
+        except KeyboardInterrupt:
+            logger.info("收到中断信号，正在退出")
+        finally:
+            if self.controller:
+                self.controller.stop()
+            self.pool.close()
+            self.pdf_maker.close()
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == '__main__':
+    import argparse
+    from config_manager import ConfigManager, load_field_mapping
+    from logger_manager import configure_logging
+
+    parser = argparse.ArgumentParser(description="多节点 PDF 生成：协调节点与工作节点")
+    parser.add_argument('--db', default='pdf_jobs.db', help="共享的 SQLite 队列文件")
+    subparsers = parser.add_subparsers(dest='role', required=True)
+
+    coordinator_parser = subparsers.add_parser('coordinator', help="拆分并发布任务")
+    coordinator_parser.add_argument('input', help="数据文件")
+    coordinator_parser.add_argument('--mapping', default=None, help="字段映射 JSON 文件")
+    coordinator_parser.add_argument('--chunk', type=int, default=None, help="每个分片的行数")
+    coordinator_parser.add_argument('--no-wait', action='store_true', help="发布后立即退出")
+
+    worker_parser = subparsers.add_parser('worker', help="领取并处理任务")
+    worker_parser.add_argument('--workers', type=int, default=None, help="本节点的浏览器数量")
+    worker_parser.add_argument('--lease', type=float, default=None, help="租约时长（秒）")
+    worker_parser.add_argument('--exit-when-idle', action='store_true', help="队列为空时退出")
+
+    args = parser.parse_args()
+    config = ConfigManager()
+    configure_logging(config)
+
+    if args.role == 'coordinator':
+        mapping_file = args.mapping or config.get('paths', 'mapping_file', 'field_mapping.json')
+        coordinator = Coordinator(config, args.db, chunk_size=args.chunk)
+        job_id = coordinator.publish(args.input, load_field_mapping(mapping_file))
+        if not args.no_wait:
+            coordinator.wait(job_id)
+    else:
+        Worker(config, args.db, workers=args.workers, lease_seconds=args.lease).run(
+            exit_when_idle=args.exit_when_idle)
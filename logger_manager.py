@@ -1,55 +1,141 @@
 import os
 import sys
+import json
+import random
+import inspect
+import logging
 from loguru import logger
 from datetime import datetime
 from utils import resource_path
 
+# 日志配置：production 只记录 INFO 及以上，逐行明细写入 JSON Lines；debug 记录全部调试信息
+LOG_PROFILES = {
+    'production': {'console_level': 'INFO', 'file_level': 'INFO', 'std_level': logging.INFO},
+    'debug': {'console_level': 'INFO', 'file_level': 'DEBUG', 'std_level': logging.DEBUG},
+}
+
+
+class InterceptHandler(logging.Handler):
+    """把标准库 logging 的记录转发到 loguru，全程序只有一条日志管道"""
+
+    def emit(self, record):
+        try:
+            level = logger.level(record.levelname).name
+        except ValueError:
+            level = record.levelno
+
+        # 找到真正发出日志的调用位置
+        frame, depth = inspect.currentframe(), 0
+        while frame is not None and (depth == 0 or frame.f_code.co_filename == logging.__file__):
+            frame = frame.f_back
+            depth += 1
+        logger.opt(depth=depth, exception=record.exc_info).log(level, record.getMessage())
+
+
+def _is_row_record(record):
+    return record["extra"].get("row_record", False)
+
+
+def _not_row_record(record):
+    return not record["extra"].get("row_record", False)
+
+
 class LoggerManager:
     _instance = None
-    
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(LoggerManager, cls).__new__(cls)
             cls._instance._initialize_logger()
         return cls._instance
-    
+
     def _initialize_logger(self):
         """初始化日志配置"""
         # 创建 logs 文件夹
-        log_dir = resource_path('logs')
-        if not os.path.exists(log_dir):
-            os.makedirs(log_dir)
-            
+        self.log_dir = resource_path('logs')
+        if not os.path.exists(self.log_dir):
+            os.makedirs(self.log_dir)
+
+        self.profile = None
+        self.row_sample_rate = 1.0
+        self._row_logger = logger.bind(row_record=True)
+        self.configure(os.environ.get('PDF_MAKER_LOG_PROFILE', 'production'))
+
+    def configure(self, profile='production', row_sample_rate=1.0):
+        """切换日志配置，row_sample_rate 为成功行明细的采样比例（失败行始终记录）"""
+        if profile not in LOG_PROFILES:
+            profile = 'production'
+        self.row_sample_rate = row_sample_rate
+        if profile == self.profile:
+            return
+        self.profile = profile
+        settings = LOG_PROFILES[profile]
+
         # 生成日志文件名
         current_time = datetime.now().strftime("%Y%m%d")
-        log_file = os.path.join(log_dir, f"pdf_maker_{current_time}.log")
-        
+        log_file = os.path.join(self.log_dir, f"pdf_maker_{current_time}.log")
+        row_file = os.path.join(self.log_dir, f"rows_{current_time}.jsonl")
+
         # 移除默认的处理器
         logger.remove()
-        
+
         try:
             # 尝试添加控制台输出
             if sys.stderr is not None:
                 logger.add(
                     sys.stderr,
                     format="<green>{time:YYYY-MM-DD HH:mm:ss}</green> | <level>{level: <8}</level> | <cyan>{name}</cyan>:<cyan>{function}</cyan>:<cyan>{line}</cyan> - <level>{message}</level>",
-                    level="INFO"
+                    level=settings['console_level'],
+                    filter=_not_row_record
                 )
         except TypeError:
             # 如果控制台输出失败，忽略错误
             pass
-        
+
         # 添加文件输出
         logger.add(
             log_file,
             format="{time:YYYY-MM-DD HH:mm:ss} | {level: <8} | {name}:{function}:{line} - {message}",
-            level="DEBUG",
+            level=settings['file_level'],
             rotation="00:00",  # 每天午夜轮换
             retention="30 days",  # 保留30天
             encoding="utf-8",
-            enqueue=True  # 启用异步写入
+            enqueue=True,  # 启用异步写入
+            filter=_not_row_record
+        )
+
+        # 逐行明细：每行一条 JSON 记录
+        logger.add(
+            row_file,
+            format="{message}",
+            level="INFO",
+            rotation="00:00",
+            retention="30 days",
+            encoding="utf-8",
+            enqueue=True,
+            filter=_is_row_record
         )
-        
+
+        # 标准库 logging 统一转发到 loguru，级别决定 isEnabledFor 的结果
+        logging.basicConfig(handlers=[InterceptHandler()], level=settings['std_level'], force=True)
+
+    def log_row(self, status, **fields):
+        """记录一行的处理结果（JSON Lines），成功行按采样比例记录"""
+        if status == 'ok' and self.row_sample_rate < 1.0 and random.random() >= self.row_sample_rate:
+            return
+        fields['status'] = status
+        fields['time'] = datetime.now().isoformat(timespec='milliseconds')
+        self._row_logger.info(json.dumps(fields, ensure_ascii=False, default=str))
+
     def get_logger(self):
         """获取日志记录器"""
-        return logger 
\ No newline at end of file
+        return logger
+
+
+def configure_logging(config):
+    """按配置中的 logging 段初始化统一日志管道，返回 LoggerManager"""
+    manager = LoggerManager()
+    manager.configure(
+        config.get('logging', 'profile', default='production'),
+        float(config.get('logging', 'row_sample_rate', default='1.0')))
+    return manager
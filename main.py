@@ -1,91 +1,292 @@
+import time
+# 启动计时起点（--startup-probe 使用），放在其他导入之前
+STARTED = time.perf_counter()
 import sys
 import re
-import pandas as pd
+import json
+import itertools
+import threading
+import multiprocessing
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                            QHBoxLayout, QPushButton, QLabel, QListWidget, 
-                           QFileDialog, QMessageBox, QProgressBar, QGroupBox, QComboBox)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal
-from PyQt5.QtGui import QFont
+                           QFileDialog, QMessageBox, QProgressBar, QGroupBox, QComboBox,
+                           QLineEdit, QFormLayout, QListWidgetItem, QSpinBox)
+from PyQt5.QtCore import Qt, QThread, QObject, QTimer, pyqtSignal
+from PyQt5.QtGui import QFont, QPixmap
 import os
-from config_manager import ConfigManager
+from config_manager import ConfigManager, load_field_mapping, save_field_mapping
 from PDF_Maker import PDFMaker
+from browser_manager import engine_available
 from browser_installer import BrowserInstaller
-from logger_manager import LoggerManager
+from logger_manager import LoggerManager, configure_logging
+from data_cache import DataCache, FILE_DIALOG_FILTER, format_value
+from concurrency_controller import create_adaptive_pool
+from progress_tracker import ProgressTracker
+from row_selection import RowSelection, SelectionError
+from preview_renderer import PreviewRenderer
+from template_compiler import TemplateCache, TemplateSelector
+from template_optimizer import TemplateOptimizer
+
+# 浏览器类型，顺序与界面下拉框一致
+BROWSER_TYPES = ["local", "undetected", "playwright", "cdp", "weasyprint"]
+
+# 任务优先级：数值越小越先执行，与浏览器池的优先级一致
+JOB_PRIORITIES = [("紧急", 0), ("普通", 5), ("后台", 10)]
+
 
 class PDFGeneratorThread(QThread):
     progress = pyqtSignal(int)
+    stats_changed = pyqtSignal(dict)  # 吞吐量、耗时、剩余时间等统计
     finished = pyqtSignal()
     error = pyqtSignal(str)
     status_changed = pyqtSignal(str)  # 新增状态信号
+    done = pyqtSignal()  # 无论成功、失败还是取消，线程结束前都会发出
     
-    def __init__(self, excel_file, field_mapping, config):
+    def __init__(self, excel_file, field_mapping, config, selection=None,
+                 pool=None, priority=5, job_id=0):
         super().__init__()
         self.excel_file = excel_file
         self.field_mapping = field_mapping
         self.config = config
-        self.is_paused = False
-        self.is_stopped = False
+        self.selection = selection
+        self.pool = pool
+        self.priority = priority
+        self.job_id = job_id
+        self.state = "排队中"
+        self.stats = None
+        self.tracker = None
+        # 暂停和停止用事件实现，暂停时线程阻塞等待，不占用 CPU
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+        self._stop_event = threading.Event()
+        
+    @property
+    def is_paused(self):
+        return not self._resume_event.is_set()
+        
+    @property
+    def is_stopped(self):
+        return self._stop_event.is_set()
+        
+    @property
+    def is_active(self):
+        return self.state in ("排队中", "正在处理", "已暂停")
+        
+    def set_state(self, state):
+        self.state = state
+        self.status_changed.emit(state)
         
     def pause(self):
-        """暂停处理"""
-        self.is_paused = True
-        self.status_changed.emit("已暂停")
+        """暂停处理（已提交给浏览器池的少量任务仍会完成）"""
+        self._resume_event.clear()
+        self.set_state("已暂停")
         
     def resume(self):
         """继续处理"""
-        self.is_paused = False
-        self.status_changed.emit("正在处理")
+        self._resume_event.set()
+        self.set_state("正在处理" if self.isRunning() else "排队中")
         
     def stop(self):
-        """停止处理"""
-        self.is_stopped = True
-        self.status_changed.emit("已停止")
+        """停止处理，尚未开始渲染的行会被取消"""
+        self._stop_event.set()
+        self._resume_event.set()
+        self.set_state("已取消")
+        
+    def wait_if_paused(self):
+        """暂停时阻塞，返回是否应当停止"""
+        self._resume_event.wait()
+        return self.is_stopped
+        
+    def row_finished(self, index, key, output_file, error):
+        """单行完成回调，按时间间隔合并后再通知界面"""
+        stats = self.tracker.update(ok=error is None)
+        if stats is not None:
+            self.publish_stats(stats)
+            
+    def publish_stats(self, stats):
+        """保存统计并通知界面"""
+        self.stats = stats
+        self.progress.emit(stats['percent'])
+        self.stats_changed.emit(stats)
         
     def run(self):
         logger = LoggerManager().get_logger()
+        pdf_maker = None
+        if not self.is_stopped and not self.is_paused:
+            self.set_state("正在处理")
         try:
-            # 读取 Excel 文件
-            logger.info(f"开始读取 Excel 文件：{self.excel_file}")
-            df = pd.read_excel(self.excel_file)
-            total_rows = len(df)
-            logger.info(f"Excel 文件读取成功，共 {total_rows} 行数据")
-            
             # 创建 PDF 生成器
             pdf_maker = PDFMaker(self.config)
             
-            # 处理每一行数据
-            for index, row in df.iterrows():
-                if self.is_stopped:
-                    logger.warning("用户手动停止生成过程")
-                    self.status_changed.emit("已停止")
-                    break
-                    
-                while self.is_paused:
-                    self.msleep(100)  # 暂停时等待
-                    if self.is_stopped:
-                        break
-                
-                if self.is_stopped:
-                    break
-                
-                # 渲染模板
-                logger.debug(f"正在处理第 {index + 1}/{total_rows} 行数据")
-                html_content = pdf_maker.render_template(row, self.field_mapping)
-                
-                # 生成 PDF
-                pdf_maker.generate_pdf(html_content, row)
-                
-                # 更新进度
-                progress = int((index + 1) / total_rows * 100)
-                self.progress.emit(progress)
+            # 读取 Excel 文件（只读取映射用到的列），行选择和模板分组在启动浏览器之前完成
+            logger.info(f"开始读取 Excel 文件：{self.excel_file}")
+            groups = pdf_maker.load_groups(self.excel_file, self.field_mapping, self.selection)
+            total_rows = sum(len(rows) for _, rows in groups)
+            logger.info(f"Excel 文件读取成功，共 {total_rows} 行数据")
+            if total_rows == 0:
+                raise SelectionError("没有符合行选择条件的数据")
+            
+            # 浏览器池由调度器创建并在多个任务间共享，优先级高的任务先被处理
+            self.tracker = ProgressTracker(total_rows)
+            pdf_maker.process_groups(
+                groups, self.pool, on_result=self.row_finished,
+                should_stop=self.wait_if_paused, priority=self.priority)
             
-            if not self.is_stopped:
-                logger.info("PDF 生成完成")
+            if self.is_stopped:
+                logger.warning(f"任务 #{self.job_id} 已被用户取消")
+            else:
+                logger.info(f"任务 #{self.job_id} PDF 生成完成")
+                self.set_state("已完成")
                 self.finished.emit()
             
         except Exception as e:
-            logger.error(f"生成 PDF 时发生错误：{str(e)}")
+            logger.error(f"任务 #{self.job_id} 生成 PDF 时发生错误：{str(e)}")
+            self.set_state("失败")
             self.error.emit(str(e))
+        finally:
+            # 停止或出错时最后一次合并通知之后完成的行也要反映到界面上
+            if self.tracker is not None:
+                self.publish_stats(self.tracker.snapshot())
+            if pdf_maker is not None:
+                pdf_maker.close()
+            self.done.emit()
+
+
+class JobScheduler(QObject):
+    """任务调度：多个任务共享一个常驻浏览器池，按优先级排队
+
+    同时运行的任务数不超过 jobs/max_running；优先级高于所有运行中任务的新任务不受此限制，
+    立即开始，它的渲染请求在浏览器池中排在低优先级任务之前，低优先级任务只是等待，进度不会丢失。
+    """
+    job_changed = pyqtSignal(int)  # 任务编号
+    all_finished = pyqtSignal()
+    
+    def __init__(self, config, parent=None):
+        super().__init__(parent)
+        self.config = config
+        self.logger = LoggerManager().get_logger()
+        self.max_running = max(1, int(config.get('jobs', 'max_running', default='2')))
+        self.jobs = {}
+        self._waiting = []
+        self._running = set()
+        self._ids = itertools.count(1)
+        self.pool = None
+        self.controller = None
+        self._pool_stale = False
+        
+    def submit(self, excel_file, field_mapping, selection=None, priority=5):
+        """加入队列，返回任务线程"""
+        job = PDFGeneratorThread(
+            excel_file, field_mapping, self.config.snapshot(), selection,
+            priority=priority, job_id=next(self._ids))
+        job.status_changed.connect(lambda _, job_id=job.job_id: self.job_changed.emit(job_id))
+        job.stats_changed.connect(lambda _, job_id=job.job_id: self.job_changed.emit(job_id))
+        job.done.connect(lambda job_id=job.job_id: self._job_done(job_id))
+        self.jobs[job.job_id] = job
+        self._waiting.append(job)
+        self._dispatch()
+        return job
+        
+    def cancel(self, job_id):
+        """取消任务，排队中的任务直接移出队列"""
+        job = self.jobs[job_id]
+        if not job.is_active:
+            return
+        job.stop()
+        if job in self._waiting:
+            self._waiting.remove(job)
+            self._check_idle()
+            
+    @property
+    def has_active_jobs(self):
+        return bool(self._running or self._waiting)
+        
+    def prefetch(self):
+        """在后台启动浏览器池并预热浏览器，任务开始时可以直接打印"""
+        if self.config.get('browser', 'prefetch', default='true').lower() == 'false':
+            return None
+        return self._create_pool()
+        
+    def get_pool(self):
+        """返回共享浏览器池，尚未创建时立即创建"""
+        return self._create_pool()
+        
+    def readiness(self):
+        """浏览器池的预热状态，没有浏览器池时返回 None"""
+        if self.pool is None:
+            return None
+        return self.pool.readiness()
+        
+    def reset_pool(self):
+        """浏览器设置变化后重建浏览器池并重新预热，有任务运行时推迟到空闲后执行"""
+        if self._running:
+            self._pool_stale = True
+            return
+        self._close_pool(wait=False)
+        self.prefetch()
+        
+    def _create_pool(self):
+        if self.pool is None:
+            self.pool, self.controller = create_adaptive_pool(self.config)
+            self.pool.start()
+            self.logger.info(f"启动浏览器池并预热浏览器（{self.config.get('browser', 'type', default='local')}）")
+        return self.pool
+        
+    def _ensure_pool(self):
+        self._create_pool()
+        if self.controller:
+            self.controller.start()
+        return self.pool
+        
+    def _close_pool(self, wait=True):
+        if self.controller:
+            self.controller.stop()
+        if self.pool is not None:
+            self.pool.close(wait=wait)
+        self.pool, self.controller = None, None
+        self._pool_stale = False
+        
+    def _dispatch(self):
+        """按优先级启动排队中的任务"""
+        self._waiting.sort(key=lambda job: (job.priority, job.job_id))
+        while self._waiting:
+            job = self._waiting[0]
+            running = [self.jobs[job_id] for job_id in self._running]
+            preempt = running and job.priority < min(other.priority for other in running)
+            if len(running) >= self.max_running and not preempt:
+                break
+            self._waiting.pop(0)
+            job.pool = self._ensure_pool()
+            self._running.add(job.job_id)
+            job.start()
+            
+    def _job_done(self, job_id):
+        self._running.discard(job_id)
+        self.job_changed.emit(job_id)
+        self._dispatch()
+        self._check_idle()
+        
+    def _check_idle(self):
+        if self._running or self._waiting:
+            return
+        # 空闲时停止并发调节，浏览器池保持预热供下一个任务使用
+        if self.controller:
+            self.controller.stop()
+        if self._pool_stale:
+            self._close_pool(wait=False)
+            self.prefetch()
+        self.all_finished.emit()
+        
+    def shutdown(self):
+        """取消全部任务并关闭浏览器池"""
+        for job in list(self._waiting):
+            self.cancel(job.job_id)
+        for job_id in list(self._running):
+            self.jobs[job_id].stop()
+        for job_id in list(self._running):
+            self.jobs[job_id].wait()
+        self._close_pool()
+
 
 class MappingPreviewWidget(QWidget):
     def __init__(self, parent=None):
@@ -124,15 +325,133 @@ class MappingPreviewWidget(QWidget):
         preview_html += "</div>"
         self.preview_text.setText(preview_html)
 
+class RowPreviewWidget(QWidget):
+    """选中行的渲染预览：输入变化后防抖，再由常驻浏览器截取第一页"""
+    preview_ready = pyqtSignal(int, bytes, float, bool)
+    preview_failed = pyqtSignal(int, str)
+    
+    def __init__(self, parent=None, delay=200):
+        super().__init__(parent)
+        # html_provider(行号) 返回要预览的 HTML，条件不足时返回 None
+        self.html_provider = None
+        # renderer_provider() 返回 PreviewRenderer
+        self.renderer_provider = None
+        self._request = 0
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay)
+        self._timer.timeout.connect(self.render_now)
+        self.preview_ready.connect(self.show_image)
+        self.preview_failed.connect(self.show_error)
+        self.setup_ui()
+        
+    def setup_ui(self):
+        layout = QVBoxLayout(self)
+        
+        # 预览标题和行号
+        header_layout = QHBoxLayout()
+        title = QLabel("渲染预览")
+        title.setFont(QFont("Arial", 10, QFont.Bold))
+        header_layout.addWidget(title)
+        header_layout.addWidget(QLabel("行："))
+        self.row_spin = QSpinBox()
+        self.row_spin.setRange(1, 1)
+        self.row_spin.valueChanged.connect(self.schedule)
+        header_layout.addWidget(self.row_spin)
+        header_layout.addStretch()
+        layout.addLayout(header_layout)
+        
+        # 第一页截图
+        self.image_label = QLabel()
+        self.image_label.setAlignment(Qt.AlignCenter)
+        self.image_label.setMinimumSize(210, 297)
+        self.image_label.setStyleSheet("""
+            QLabel {
+                background-color: #ffffff;
+                border: 1px solid #ddd;
+                border-radius: 4px;
+            }
+        """)
+        layout.addWidget(self.image_label)
+        
+        self.status_label = QLabel("选择数据文件、模板并设置映射后显示预览")
+        self.status_label.setWordWrap(True)
+        layout.addWidget(self.status_label)
+        
+    def set_row_count(self, count):
+        self.row_spin.setMaximum(max(1, count))
+        
+    def schedule(self, *args):
+        """重新计时，连续修改时只渲染最后一次"""
+        self._timer.start()
+        
+    def render_now(self):
+        self._request += 1
+        request = self._request
+        try:
+            html_content = self.html_provider(self.row_spin.value() - 1) if self.html_provider else None
+            if html_content is None:
+                self.image_label.clear()
+                self.status_label.setText("选择数据文件、模板并设置映射后显示预览")
+                return
+            future = self.renderer_provider().render(html_content)
+        except Exception as e:
+            self.show_error(request, str(e))
+            return
+        self.status_label.setText("正在渲染...")
+        future.add_done_callback(lambda future, request=request: self._deliver(request, future))
+        
+    def _deliver(self, request, future):
+        """在浏览器线程中调用，通过信号把结果交给界面线程"""
+        try:
+            image, elapsed, cached = future.result()
+        except Exception as e:
+            self.preview_failed.emit(request, str(e))
+            return
+        self.preview_ready.emit(request, image, elapsed, cached)
+        
+    def show_image(self, request, image, elapsed, cached):
+        if request != self._request:
+            return  # 已有更新的预览请求
+        pixmap = QPixmap()
+        pixmap.loadFromData(image, 'PNG')
+        self.image_label.setPixmap(pixmap.scaled(
+            self.image_label.size(), Qt.KeepAspectRatio, Qt.SmoothTransformation))
+        self.status_label.setText(f"第 {self.row_spin.value()} 行，{elapsed * 1000:.0f} ms" + ("（缓存）" if cached else ""))
+        
+    def show_error(self, request, error_msg):
+        if request != self._request:
+            return
+        self.status_label.setText(f"预览失败：{error_msg}")
+
 class MainWindow(QMainWindow):
-    def __init__(self):
+    def __init__(self, prefetch=True):
         super().__init__()
         self.logger = LoggerManager().get_logger()
         self.config = ConfigManager()
+        configure_logging(self.config)
         self.field_mapping = {}
+        self.data_cache = DataCache(self.config)
         self.browser_installer = BrowserInstaller(self)
+        # 任务队列：多个任务共享一个浏览器池
+        self.scheduler = JobScheduler(self.config, self)
+        self.scheduler.job_changed.connect(self.update_job)
+        self.scheduler.all_finished.connect(self.all_jobs_finished)
+        # 预览用的数据和编译模板
+        self.preview_df = None
+        self.preview_template = None
+        self.preview_renderer = None
+        self.template_cache = TemplateCache(
+            optimized=self.config.get('templates', 'optimize', default='true').lower() != 'false')
+        self.template_selector = self.build_template_selector()
         self.setup_ui()
         self.logger.info("PDF 生成器启动")
+        # 窗口显示后在后台预热浏览器，并定时刷新就绪状态
+        if prefetch:
+            QTimer.singleShot(0, self.scheduler.prefetch)
+        self.readiness_timer = QTimer(self)
+        self.readiness_timer.timeout.connect(self.update_browser_status)
+        self.readiness_timer.start(500)
         
     def setup_ui(self):
         self.setWindowTitle("PDF 生成器")
@@ -167,6 +486,16 @@ class MainWindow(QMainWindow):
         template_layout.addWidget(template_btn)
         file_layout.addLayout(template_layout)
         
+        # 按列选择模板：<模板目录>/<列值>.html，找不到时使用上面的模板
+        template_column_layout = QHBoxLayout()
+        template_column_layout.addWidget(QLabel("按列选择模板："))
+        self.template_column_combo = QComboBox()
+        self.template_column_combo.addItem("（不按列选择）", "")
+        self.template_column_combo.currentIndexChanged.connect(self.change_template_column)
+        template_column_layout.addWidget(self.template_column_combo)
+        template_column_layout.addStretch()
+        file_layout.addLayout(template_column_layout)
+        
         file_group.setLayout(file_layout)
         layout.addWidget(file_group)
         
@@ -191,6 +520,12 @@ class MainWindow(QMainWindow):
         mapping_buttons_layout.addWidget(self.map_btn)
         mapping_buttons_layout.addWidget(self.unmap_btn)
         mapping_buttons_layout.addStretch()
+        self.save_mapping_btn = QPushButton("保存映射")
+        self.save_mapping_btn.clicked.connect(self.save_mapping)
+        self.load_mapping_btn = QPushButton("加载映射")
+        self.load_mapping_btn.clicked.connect(self.load_mapping)
+        mapping_buttons_layout.addWidget(self.save_mapping_btn)
+        mapping_buttons_layout.addWidget(self.load_mapping_btn)
         
         # HTML 占位符列表
         html_list_group = QGroupBox("HTML 占位符")
@@ -210,12 +545,31 @@ class MainWindow(QMainWindow):
         
         # 映射预览
         preview_group = QGroupBox("映射预览")
-        preview_layout = QVBoxLayout()
+        preview_layout = QHBoxLayout()
         self.preview_widget = MappingPreviewWidget()
         preview_layout.addWidget(self.preview_widget)
+        self.row_preview = RowPreviewWidget()
+        self.row_preview.html_provider = self.preview_html
+        self.row_preview.renderer_provider = self.get_preview_renderer
+        preview_layout.addWidget(self.row_preview)
         preview_group.setLayout(preview_layout)
         layout.addWidget(preview_group)
         
+        # 行选择：只重新生成部分行，留空表示全部
+        selection_group = QGroupBox("行选择（留空表示全部行）")
+        selection_layout = QFormLayout()
+        self.rows_edit = QLineEdit()
+        self.rows_edit.setPlaceholderText("例如 1-10, 15, 200-（从 1 开始）")
+        selection_layout.addRow("行号范围：", self.rows_edit)
+        self.filter_edit = QLineEdit()
+        self.filter_edit.setPlaceholderText("例如 `total invoice value` > 100 and country == 'US'（只能使用已映射的列）")
+        selection_layout.addRow("筛选条件：", self.filter_edit)
+        self.keys_edit = QLineEdit()
+        self.keys_edit.setPlaceholderText("输出文件名字段的值，多个用逗号分隔")
+        selection_layout.addRow("键值列表：", self.keys_edit)
+        selection_group.setLayout(selection_layout)
+        layout.addWidget(selection_group)
+        
         # 进度条
         self.progress_bar = QProgressBar()
         layout.addWidget(self.progress_bar)
@@ -224,8 +578,16 @@ class MainWindow(QMainWindow):
         button_group = QGroupBox("控制面板")
         button_layout = QHBoxLayout()
         
-        # 生成按钮
-        self.generate_btn = QPushButton("生成 PDF")
+        # 任务优先级
+        button_layout.addWidget(QLabel("优先级："))
+        self.priority_combo = QComboBox()
+        for name, priority in JOB_PRIORITIES:
+            self.priority_combo.addItem(name, priority)
+        self.priority_combo.setCurrentIndex(1)
+        button_layout.addWidget(self.priority_combo)
+        
+        # 生成按钮：把当前文件、模板和映射加入任务队列
+        self.generate_btn = QPushButton("加入队列")
         self.generate_btn.clicked.connect(self.generate_pdfs)
         button_layout.addWidget(self.generate_btn)
         
@@ -244,20 +606,40 @@ class MainWindow(QMainWindow):
         button_group.setLayout(button_layout)
         layout.addWidget(button_group)
         
+        # 任务队列：暂停、继续和停止作用于选中的任务
+        jobs_group = QGroupBox("任务队列")
+        jobs_layout = QVBoxLayout()
+        self.job_list = QListWidget()
+        self.job_list.setSelectionMode(QListWidget.SingleSelection)
+        self.job_list.currentItemChanged.connect(self.job_selected)
+        jobs_layout.addWidget(self.job_list)
+        jobs_group.setLayout(jobs_layout)
+        layout.addWidget(jobs_group)
+        
         # 状态标签
         self.status_label = QLabel("就绪")
         layout.addWidget(self.status_label)
         
+        # 状态栏：吞吐量、耗时、剩余时间和失败数
+        self.stats_label = QLabel()
+        self.statusBar().addPermanentWidget(self.stats_label)
+        
         # 浏览器选择区域
         browser_group = QGroupBox("浏览器设置")
         browser_layout = QHBoxLayout()
         
         browser_label = QLabel("浏览器类型：")
         self.browser_combo = QComboBox()
-        self.browser_combo.addItems(["本地浏览器", "Undetected Chrome", "Playwright"])
+        self.browser_combo.addItems(["本地浏览器", "Undetected Chrome", "Playwright", "CDP 直连", "WeasyPrint（无浏览器）"])
+        # 与配置中的浏览器类型保持一致，预热的就是这里显示的引擎
+        self.browser_combo.setCurrentIndex(
+            BROWSER_TYPES.index(self.config.get('browser', 'type', default='local'))
+            if self.config.get('browser', 'type', default='local') in BROWSER_TYPES else 0)
         self.browser_combo.currentIndexChanged.connect(self.change_browser)
         browser_layout.addWidget(browser_label)
         browser_layout.addWidget(self.browser_combo)
+        self.browser_status_label = QLabel("浏览器：未启动")
+        browser_layout.addWidget(self.browser_status_label)
         browser_layout.addStretch()
         
         browser_group.setLayout(browser_layout)
@@ -318,7 +700,7 @@ class MainWindow(QMainWindow):
         
     def select_excel(self):
         file_name, _ = QFileDialog.getOpenFileName(
-            self, "选择 Excel 文件", "", "Excel Files (*.xlsx *.xls)")
+            self, "选择 Excel 文件", "", FILE_DIALOG_FILTER)
         if file_name:
             self.logger.info(f"选择 Excel 文件：{file_name}")
             self.excel_label.setText(f"Excel 文件：{os.path.basename(file_name)}")
@@ -332,32 +714,81 @@ class MainWindow(QMainWindow):
             self.logger.info(f"选择模板文件：{file_name}")
             self.template_label.setText(f"HTML 模板：{os.path.basename(file_name)}")
             self.config.set('paths', 'template_path', file_name)
+            self.optimize_template(file_name)
             self.update_html_placeholders()
             
+    def optimize_template(self, file_name):
+        """选择模板时预优化一次，结果保存在原模板旁，失败时继续使用原模板"""
+        if self.config.get('templates', 'optimize', default='true').lower() == 'false' or file_name.endswith('.optimized.html'):
+            return
+        try:
+            report = TemplateOptimizer(self.config).optimize(file_name)
+            self.logger.info(TemplateOptimizer.describe(report))
+            saved = 1 - report['after'] / max(1, report['before'])
+            self.template_label.setText(
+                f"HTML 模板：{os.path.basename(file_name)}（已优化，缩小 {saved:.0%}）")
+            self.template_label.setToolTip(TemplateOptimizer.describe(report))
+        except Exception as e:
+            self.logger.warning(f"模板预优化失败，使用原模板：{str(e)}")
+            
     def update_excel_fields(self):
         try:
-            df = pd.read_excel(self.excel_file)
+            # 整表保留在内存中供预览使用，切换预览行不再读取文件
+            self.preview_df = self.data_cache.read(self.excel_file)
+            columns = list(self.preview_df.columns)
             self.excel_list.clear()
-            for column in df.columns:
-                self.excel_list.addItem(column)
-            self.logger.info(f"更新 Excel 字段列表，共 {len(df.columns)} 个字段")
+            for column in columns:
+                self.excel_list.addItem(str(column))
+            self.logger.info(f"更新 Excel 字段列表，共 {len(columns)} 个字段")
+            self.row_preview.set_row_count(len(self.preview_df))
+            
+            # 模板选择列的候选项，保留配置中已选择的列
+            configured = self.config.get('templates', 'column', default='')
+            self.template_column_combo.blockSignals(True)
+            self.template_column_combo.clear()
+            self.template_column_combo.addItem("（不按列选择）", "")
+            for column in columns:
+                self.template_column_combo.addItem(str(column), str(column))
+            index = self.template_column_combo.findData(configured)
+            self.template_column_combo.setCurrentIndex(max(0, index))
+            self.template_column_combo.blockSignals(False)
+            self.row_preview.schedule()
         except Exception as e:
             self.logger.error(f"读取 Excel 文件失败：{str(e)}")
             QMessageBox.critical(self, "错误", f"读取 Excel 文件失败：{str(e)}")
             
+    def build_template_selector(self):
+        """按配置创建模板选择器，配置有误时提示并返回 None"""
+        try:
+            return TemplateSelector.from_config(self.config)
+        except ValueError as e:
+            self.logger.error(f"模板配置错误：{str(e)}")
+            QMessageBox.warning(self, "模板配置错误", str(e))
+            return None
+            
+    def change_template_column(self, index):
+        """设置按哪一列为每行选择模板"""
+        column = self.template_column_combo.itemData(index) or ""
+        self.config.set('templates', 'column', column)
+        self.template_selector = self.build_template_selector()
+        self.logger.info(f"模板选择列：{column or '无'}")
+        self.row_preview.schedule()
+        
     def update_html_placeholders(self):
         try:
-            with open(self.config.get('paths', 'template_path'), 'r', encoding='utf-8') as f:
-                content = f.read()
-                
+            self.preview_template = self.template_cache.get(self.config.get('paths', 'template_path'))
+            # 默认模板和模板目录随之变化
+            self.template_selector = self.build_template_selector()
+            
             # 查找所有 {{xxx}} 格式的占位符
-            placeholders = re.findall(r'\{\{([^}]+)\}\}', content)
+            placeholders = re.findall(r'\{\{([^}]+)\}\}', self.preview_template.content)
             
             self.html_list.clear()
             for placeholder in placeholders:
                 self.html_list.addItem(placeholder)
             
             self.logger.info(f"更新 HTML 占位符列表，共 {len(placeholders)} 个占位符")
+            self.row_preview.schedule()
                 
         except Exception as e:
             self.logger.error(f"读取模板文件失败：{str(e)}")
@@ -376,6 +807,7 @@ class MainWindow(QMainWindow):
             
             # 更新预览
             self.preview_widget.update_preview(self.field_mapping)
+            self.row_preview.schedule()
             
             # 禁用已映射的项
             excel_item.setFlags(excel_item.flags() & ~Qt.ItemIsEnabled)
@@ -395,11 +827,82 @@ class MainWindow(QMainWindow):
                 
                 # 更新预览
                 self.preview_widget.update_preview(self.field_mapping)
+                self.row_preview.schedule()
                 
                 # 重新启用项
                 excel_item.setFlags(excel_item.flags() | Qt.ItemIsEnabled)
                 html_item.setFlags(html_item.flags() | Qt.ItemIsEnabled)
                 
+    def save_mapping(self):
+        """保存当前字段映射，供监控目录模式等无界面任务使用"""
+        if not self.field_mapping:
+            QMessageBox.warning(self, "警告", "请先设置字段映射")
+            return
+        file_name, _ = QFileDialog.getSaveFileName(
+            self, "保存字段映射", self.config.get('paths', 'mapping_file', 'field_mapping.json'),
+            "JSON Files (*.json)")
+        if file_name:
+            try:
+                save_field_mapping(self.field_mapping, file_name)
+                self.config.set('paths', 'mapping_file', file_name)
+                self.logger.info(f"保存字段映射：{file_name}")
+            except Exception as e:
+                self.logger.error(f"保存字段映射失败：{str(e)}")
+                QMessageBox.critical(self, "错误", f"保存字段映射失败：{str(e)}")
+                
+    def load_mapping(self):
+        """加载保存的字段映射"""
+        file_name, _ = QFileDialog.getOpenFileName(
+            self, "加载字段映射", "", "JSON Files (*.json)")
+        if not file_name:
+            return
+        try:
+            self.field_mapping = load_field_mapping(file_name)
+        except Exception as e:
+            self.logger.error(f"加载字段映射失败：{str(e)}")
+            QMessageBox.critical(self, "错误", f"加载字段映射失败：{str(e)}")
+            return
+        self.logger.info(f"加载字段映射：{file_name}，共 {len(self.field_mapping)} 项")
+        self.preview_widget.update_preview(self.field_mapping)
+        self.row_preview.schedule()
+        
+        # 已映射的项设为不可选
+        mapped_fields = set(self.field_mapping)
+        mapped_placeholders = set(self.field_mapping.values())
+        for i in range(self.excel_list.count()):
+            item = self.excel_list.item(i)
+            if item.text() in mapped_fields:
+                item.setFlags(item.flags() & ~Qt.ItemIsEnabled)
+            else:
+                item.setFlags(item.flags() | Qt.ItemIsEnabled)
+        for i in range(self.html_list.count()):
+            item = self.html_list.item(i)
+            if item.text() in mapped_placeholders:
+                item.setFlags(item.flags() & ~Qt.ItemIsEnabled)
+            else:
+                item.setFlags(item.flags() | Qt.ItemIsEnabled)
+                
+    def preview_html(self, row_index):
+        """用编译模板渲染预览行的 HTML，数据、模板或映射缺失时返回 None"""
+        if self.preview_df is None or self.preview_template is None or not self.field_mapping:
+            return None
+        if not 0 <= row_index < len(self.preview_df):
+            return None
+        row = self.preview_df.iloc[row_index].to_dict()
+        template = self.preview_template
+        if self.template_selector is not None and self.template_selector.column in row:
+            self.template_selector.refresh()
+            template = self.template_cache.get(
+                self.template_selector.path_for(format_value(row[self.template_selector.column])))
+        return template.render(PreviewRenderer.row_values(template, self.field_mapping, row))
+        
+    def get_preview_renderer(self):
+        """预览复用任务队列的常驻浏览器池，浏览器池重建后同时更换"""
+        pool = self.scheduler.get_pool()
+        if self.preview_renderer is None or self.preview_renderer.pool is not pool:
+            self.preview_renderer = PreviewRenderer(pool)
+        return self.preview_renderer
+        
     def generate_pdfs(self):
         if not hasattr(self, 'excel_file'):
             self.logger.warning("未选择 Excel 文件")
@@ -411,54 +914,101 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "警告", "请先设置字段映射")
             return
             
-        self.logger.info("开始生成 PDF")
-        # 更新按钮状态
-        self.generate_btn.setEnabled(False)
-        self.pause_btn.setEnabled(True)
-        self.stop_btn.setEnabled(True)
-        self.pause_btn.setText("暂停")
-        self.progress_bar.setValue(0)
-        self.status_label.setText("正在生成 PDF...")
-        
-        # 创建并启动生成线程
-        self.generator_thread = PDFGeneratorThread(
-            self.excel_file, self.field_mapping, self.config)
-        self.generator_thread.progress.connect(self.update_progress)
-        self.generator_thread.finished.connect(self.generation_finished)
-        self.generator_thread.error.connect(self.generation_error)
-        self.generator_thread.status_changed.connect(self.update_status)
-        self.generator_thread.start()
+        try:
+            selection = RowSelection.from_text(
+                self.rows_edit.text(), self.filter_edit.text(), self.keys_edit.text())
+        except SelectionError as e:
+            QMessageBox.warning(self, "警告", f"行选择条件无效：{str(e)}")
+            return
+            
+        # 任务加入队列时取配置快照，之后修改设置不会影响该任务
+        priority = self.priority_combo.currentData()
+        job = self.scheduler.submit(
+            self.excel_file, dict(self.field_mapping), selection, priority=priority)
+        job.error.connect(lambda error_msg, job_id=job.job_id: self.generation_error(job_id, error_msg))
+        self.logger.info(
+            f"任务 #{job.job_id} 加入队列（优先级 {self.priority_combo.currentText()}，{selection.describe()}）")
+        
+        item = QListWidgetItem()
+        item.setData(Qt.UserRole, job.job_id)
+        self.job_list.addItem(item)
+        self.update_job(job.job_id)
+        self.job_list.setCurrentItem(item)
+        self.status_label.setText(f"任务 #{job.job_id} 已加入队列")
+        
+    def selected_job(self):
+        """当前选中的任务，没有选中时返回 None"""
+        item = self.job_list.currentItem()
+        if item is None:
+            return None
+        return self.scheduler.jobs.get(item.data(Qt.UserRole))
+        
+    def describe_job(self, job):
+        priority = next(name for name, value in JOB_PRIORITIES if value == job.priority)
+        text = f"#{job.job_id} [{priority}] {os.path.basename(job.excel_file)} - {job.state}"
+        if job.stats:
+            text += f" - {job.stats['done']}/{job.stats['total']}"
+        return text
+        
+    def update_job(self, job_id):
+        """刷新任务列表中的一项，选中的任务同时更新进度条和状态栏"""
+        job = self.scheduler.jobs[job_id]
+        for i in range(self.job_list.count()):
+            item = self.job_list.item(i)
+            if item.data(Qt.UserRole) == job_id:
+                item.setText(self.describe_job(job))
+                break
+        if job is self.selected_job():
+            self.job_selected()
+            
+    def job_selected(self, *args):
+        """切换选中任务时同步进度和按钮状态"""
+        job = self.selected_job()
+        if job is None:
+            self.pause_btn.setEnabled(False)
+            self.stop_btn.setEnabled(False)
+            return
+        self.pause_btn.setEnabled(job.is_active)
+        self.stop_btn.setEnabled(job.is_active)
+        self.pause_btn.setText("继续" if job.is_paused else "暂停")
+        self.update_status(f"任务 #{job.job_id}：{job.state}")
+        if job.stats:
+            self.update_progress(job.stats['percent'])
+            self.update_stats(job.stats)
+        else:
+            self.progress_bar.setValue(100 if job.state == "已完成" else 0)
+            self.stats_label.clear()
         
     def update_progress(self, value):
         self.progress_bar.setValue(value)
         
-    def generation_finished(self):
-        self.generate_btn.setEnabled(True)
-        self.pause_btn.setEnabled(False)
-        self.stop_btn.setEnabled(False)
-        self.status_label.setText("PDF 生成完成！")
-        QMessageBox.information(self, "完成", "所有 PDF 文件已生成完成！")
+    def update_stats(self, stats):
+        """更新状态栏统计信息"""
+        self.stats_label.setText(ProgressTracker.describe(stats))
         
-    def generation_error(self, error_msg):
-        self.generate_btn.setEnabled(True)
-        self.pause_btn.setEnabled(False)
-        self.stop_btn.setEnabled(False)
-        self.status_label.setText("生成失败")
-        QMessageBox.critical(self, "错误", f"生成 PDF 时发生错误：{error_msg}")
+    def all_jobs_finished(self):
+        self.status_label.setText("队列中的任务已全部结束")
+        self.logger.info("队列中的任务已全部结束")
+        
+    def generation_error(self, job_id, error_msg):
+        QMessageBox.critical(self, "错误", f"任务 #{job_id} 生成 PDF 时发生错误：{error_msg}")
 
     def change_browser(self, index):
         """切换浏览器类型"""
-        browser_types = {
-            0: "local",
-            1: "undetected",
-            2: "playwright"
-        }
-        
-        browser_type = browser_types[index]
+        browser_type = BROWSER_TYPES[index]
         self.logger.info(f"切换浏览器类型：{browser_type}")
         
+        # 按引擎打包的程序不包含其他引擎，也无法在运行时安装
+        if getattr(sys, 'frozen', False) and not engine_available(browser_type):
+            QMessageBox.warning(self, "提示", f"此版本未包含 {browser_type} 引擎，请使用对应的打包版本。")
+            current = self.config.get('browser', 'type', default='local')
+            self.browser_combo.blockSignals(True)
+            self.browser_combo.setCurrentIndex(BROWSER_TYPES.index(current) if current in BROWSER_TYPES else 0)
+            self.browser_combo.blockSignals(False)
+            return
+        
         # 检查浏览器是否已安装
-        if browser_type != "local" and not self.browser_installer.check_browser_installation(browser_type):
+        if browser_type not in ("local", "cdp") and not self.browser_installer.check_browser_installation(browser_type):
             reply = QMessageBox.question(
                 self,
                 "安装提示",
@@ -477,41 +1027,82 @@ class MainWindow(QMainWindow):
                         self.logger.warning("Undetected Chrome 安装失败")
                         self.browser_combo.setCurrentIndex(0)  # 切换回本地浏览器
                         return
+                elif browser_type == "weasyprint":
+                    if not self.browser_installer.install_weasyprint():
+                        self.logger.warning("WeasyPrint 安装失败")
+                        self.browser_combo.setCurrentIndex(0)  # 切换回本地浏览器
+                        return
             else:
                 self.logger.info("用户取消浏览器安装")
                 self.browser_combo.setCurrentIndex(0)  # 切换回本地浏览器
                 return
         
         self.config.set('browser', 'type', browser_type)
+        # 共享浏览器池按新设置重建并立即预热，有任务运行时推迟到空闲后
+        self.scheduler.reset_pool()
+        self.update_browser_status()
+        self.row_preview.schedule()
         self.logger.info("浏览器设置已更新")
-        QMessageBox.information(self, "提示", "浏览器设置已更新，将在下次生成 PDF 时生效。")
+        if self.scheduler.has_active_jobs:
+            QMessageBox.information(self, "提示", "浏览器设置已更新，将在当前任务全部结束后生效。")
 
+    def update_browser_status(self):
+        """显示浏览器池的预热状态"""
+        readiness = self.scheduler.readiness()
+        if readiness is None:
+            self.browser_status_label.setText("浏览器：未启动")
+            self.browser_status_label.setStyleSheet("color: #757575;")
+            return
+        state, ready, target = readiness
+        text, color = {
+            'ready': ("就绪", "#2E7D32"),
+            'warming': ("预热中", "#F57C00"),
+            'failed': ("启动失败", "#C62828"),
+        }[state]
+        self.browser_status_label.setText(f"浏览器：{text}（{ready}/{target}）")
+        self.browser_status_label.setStyleSheet(f"color: {color};")
+        
     def toggle_pause(self):
-        """切换暂停/继续状态"""
-        if hasattr(self, 'generator_thread'):
-            if self.generator_thread.is_paused:
-                self.generator_thread.resume()
-                self.pause_btn.setText("暂停")
-                self.logger.info("继续生成 PDF")
-            else:
-                self.generator_thread.pause()
-                self.pause_btn.setText("继续")
-                self.logger.info("暂停生成 PDF")
+        """切换选中任务的暂停/继续状态"""
+        job = self.selected_job()
+        if job is None or not job.is_active:
+            return
+        if job.is_paused:
+            job.resume()
+            self.logger.info(f"继续任务 #{job.job_id}")
+        else:
+            job.pause()
+            self.logger.info(f"暂停任务 #{job.job_id}")
+        self.job_selected()
                 
     def stop_generation(self):
-        """停止生成过程"""
-        if hasattr(self, 'generator_thread'):
-            self.generator_thread.stop()
-            self.generate_btn.setEnabled(True)
-            self.pause_btn.setEnabled(False)
-            self.stop_btn.setEnabled(False)
-            self.logger.info("停止生成 PDF")
+        """停止选中的任务"""
+        job = self.selected_job()
+        if job is None or not job.is_active:
+            return
+        self.scheduler.cancel(job.job_id)
+        self.logger.info(f"停止任务 #{job.job_id}")
+        self.update_job(job.job_id)
             
     def update_status(self, status):
         """更新状态显示"""
         self.status_label.setText(status)
+        
+    def closeEvent(self, event):
+        """退出前取消未完成的任务并关闭浏览器池"""
+        if self.scheduler.has_active_jobs:
+            reply = QMessageBox.question(
+                self, "退出确认", "还有未完成的任务，确定要退出吗？",
+                QMessageBox.Yes | QMessageBox.No)
+            if reply != QMessageBox.Yes:
+                event.ignore()
+                return
+        self.scheduler.shutdown()
+        event.accept()
 
 if __name__ == '__main__':
+    # 打包后的程序启动后处理等子进程时需要
+    multiprocessing.freeze_support()
     try:
         # 检查 stdout 是否存在并支持 reconfigure
         if hasattr(sys.stdout, 'reconfigure'):
@@ -528,7 +1119,23 @@ if __name__ == '__main__':
     os.environ['WDM_LOG_LEVEL'] = '0'
     os.environ['WDM_PRINT_FIRST_LINE'] = 'False'
     
+    # 启动时间测量：窗口显示后立即退出，不预热浏览器；可指定结果文件（打包后的窗口程序没有控制台）
+    probe = next((arg for arg in sys.argv if arg.startswith('--startup-probe')), None)
+    
     app = QApplication(sys.argv)
-    window = MainWindow()
+    imported = time.perf_counter() - STARTED
+    window = MainWindow(prefetch=probe is None)
     window.show()
+    if probe is not None:
+        def report_startup():
+            result = {'imports': round(imported, 3), 'window': round(time.perf_counter() - STARTED, 3)}
+            target = probe.partition('=')[2]
+            if target:
+                with open(target, 'w', encoding='utf-8') as f:
+                    json.dump(result, f)
+            elif sys.stdout is not None:
+                print(json.dumps(result))
+            window.close()
+            app.quit()
+        QTimer.singleShot(0, report_startup)
     sys.exit(app.exec_()) 
\ No newline at end of file
@@ -0,0 +1,270 @@
+import os
+import sys
+import hashlib
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import pikepdf
+except ImportError:
+    pikepdf = None
+
+logger = logging.getLogger(__name__)
+
+# 可以在页面之间共享的资源类别
+SHARED_RESOURCES = ('/Font', '/XObject')
+
+
+def _lower_priority():
+    """后处理进程以较低优先级运行，不与渲染争抢 CPU"""
+    try:
+        if sys.platform == 'win32':
+            import psutil
+            psutil.Process().nice(psutil.BELOW_NORMAL_PRIORITY_CLASS)
+        else:
+            os.nice(10)
+    except Exception:
+        pass
+
+
+def _digest(obj, memo, depth=0):
+    """计算对象（含引用的子对象和流内容）的摘要，内容相同的字体、图片摘要相同"""
+    # 数字等标量会被 pikepdf 转换为 Python 对象
+    key = obj.objgen if isinstance(obj, pikepdf.Object) and obj.is_indirect else None
+    if key and key in memo:
+        return memo[key]
+    h = hashlib.sha1()
+    if depth > 32:
+        h.update(repr(key).encode())
+    elif isinstance(obj, pikepdf.Stream):
+        h.update(b'stream')
+        h.update(obj.read_raw_bytes())
+        for name in sorted(obj.keys()):
+            if name != '/Length':
+                h.update(name.encode())
+                h.update(_digest(obj[name], memo, depth + 1))
+    elif isinstance(obj, pikepdf.Dictionary):
+        h.update(b'dict')
+        for name in sorted(obj.keys()):
+            h.update(name.encode())
+            h.update(_digest(obj[name], memo, depth + 1))
+    elif isinstance(obj, pikepdf.Array):
+        h.update(b'array')
+        for item in obj:
+            h.update(_digest(item, memo, depth + 1))
+    else:
+        h.update(repr(obj).encode())
+    digest = h.digest()
+    if key:
+        memo[key] = digest
+    return digest
+
+
+def _dedupe_resources(resources, seen, memo, depth=0):
+    """把资源字典中内容相同的字体和图片指向同一个对象，返回替换的数量"""
+    replaced = 0
+    if resources is None or depth > 8:
+        return replaced
+    for category in SHARED_RESOURCES:
+        entries = resources.get(category)
+        if not isinstance(entries, pikepdf.Dictionary):
+            continue
+        for name in list(entries.keys()):
+            obj = entries[name]
+            if not isinstance(obj, pikepdf.Object) or not obj.is_indirect:
+                continue
+            # 表单 XObject 有自己的资源，先处理内层
+            if isinstance(obj, pikepdf.Stream) and obj.get('/Subtype') == '/Form':
+                replaced += _dedupe_resources(obj.get('/Resources'), seen, memo, depth + 1)
+            canonical = seen.setdefault(_digest(obj, memo), obj)
+            if canonical.objgen != obj.objgen:
+                entries[name] = canonical
+                replaced += 1
+    return replaced
+
+
+def dedupe_pages(pdf):
+    """在整个文档范围内合并内容相同的字体和图片，未再被引用的副本在保存时丢弃"""
+    seen, memo = {}, {}
+    replaced = 0
+    for page in pdf.pages:
+        replaced += _dedupe_resources(page.obj.get('/Resources'), seen, memo)
+    return replaced
+
+
+def _save(pdf, path):
+    """重新压缩所有流并使用对象流保存"""
+    pdf.remove_unreferenced_resources()
+    pdf.save(path, compress_streams=True, recompress_flate=True,
+             object_stream_mode=pikepdf.ObjectStreamMode.generate)
+
+
+def optimize_file(path):
+    """压缩并去重单个 PDF，只有变小时才替换原文件，返回 (原大小, 新大小, 去重对象数)"""
+    before = os.path.getsize(path)
+    temp_path = path + '.opt'
+    with pikepdf.open(path) as pdf:
+        replaced = dedupe_pages(pdf)
+        _save(pdf, temp_path)
+    after = os.path.getsize(temp_path)
+    if after < before:
+        os.replace(temp_path, path)
+    else:
+        os.remove(temp_path)
+        after = before
+    return before, after, replaced
+
+
+def merge_files(paths, output_path):
+    """把多个 PDF 合并为一个文件，页面之间共享相同的字体和图片，返回 (合并后大小, 去重对象数)"""
+    sources = []
+    merged = pikepdf.Pdf.new()
+    try:
+        for path in paths:
+            source = pikepdf.open(path)
+            sources.append(source)
+            merged.pages.extend(source.pages)
+        replaced = dedupe_pages(merged)
+        temp_path = output_path + '.tmp'
+        _save(merged, temp_path)
+        os.replace(temp_path, output_path)
+    finally:
+        merged.close()
+        for source in sources:
+            source.close()
+    return os.path.getsize(output_path), replaced
+
+
+def process_batch(paths, merge_path=None, keep_originals=True):
+    """后处理进程执行的任务：逐个压缩，需要时再合并，返回统计字典"""
+    stats = {'files': 0, 'before': 0, 'after': 0, 'shared': 0, 'failed': 0, 'merged': None}
+    done = []
+    for path in paths:
+        try:
+            before, after, replaced = optimize_file(path)
+        except Exception as e:
+            logger.error(f"PDF 后处理失败 {path}: {str(e)}")
+            stats['failed'] += 1
+            continue
+        stats['files'] += 1
+        stats['before'] += before
+        stats['after'] += after
+        stats['shared'] += replaced
+        done.append(path)
+    if merge_path and done:
+        try:
+            size, replaced = merge_files(done, merge_path)
+        except Exception as e:
+            logger.error(f"合并 PDF 失败 {merge_path}: {str(e)}")
+            stats['failed'] += len(done)
+            return stats
+        stats['merged'] = (merge_path, len(done), size)
+        stats['shared'] += replaced
+        if not keep_originals:
+            for path in done:
+                os.remove(path)
+    return stats
+
+
+class PostProcessor:
+    """生成后的 PDF 后处理：重新压缩流、去重相同对象，可按批合并为一个文件并共享字体和图片
+
+    在独立的低优先级进程池中运行，渲染线程只负责提交文件路径。
+    """
+
+    def __init__(self, workers=2, merge_batch=0, keep_originals=True, merge_dir='merged'):
+        self.workers = max(1, workers)
+        self.merge_batch = max(0, merge_batch)
+        self.keep_originals = keep_originals
+        self.merge_dir = merge_dir
+        self.executor = None
+        self.pending = []
+        self.merge_count = 0
+        self.stats = {'files': 0, 'before': 0, 'after': 0, 'shared': 0, 'failed': 0, 'merged': []}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        """按 postprocess 段创建，未启用或未安装 pikepdf 时返回 None"""
+        if not config.get_bool('postprocess', 'enabled', False):
+            return None
+        if pikepdf is None:
+            logger.warning("已启用 PDF 后处理，但未安装 pikepdf（pip install pikepdf），跳过后处理")
+            return None
+        return cls(
+            workers=int(config.get('postprocess', 'workers', default='2')),
+            merge_batch=int(config.get('postprocess', 'merge_batch', default='0')),
+            keep_originals=config.get_bool('postprocess', 'keep_originals', True),
+            merge_dir=os.path.join(config.output_dir, 'merged'))
+
+    def submit(self, output_file):
+        """提交一个已生成的 PDF；合并模式下凑满一批再提交，否则每 8 个文件提交一次"""
+        self.pending.append(output_file)
+        if len(self.pending) >= (self.merge_batch or 8):
+            self.flush()
+
+    def flush(self):
+        """立即提交已积攒的文件，不等凑满一批；在每个任务结束时调用"""
+        if not self.pending:
+            return
+        paths, self.pending = self.pending, []
+        merge_path = None
+        if self.merge_batch:
+            os.makedirs(self.merge_dir, exist_ok=True)
+            self.merge_count += 1
+            name = f"merged_{datetime.now().strftime('%Y%m%d%H%M%S')}_{self.merge_count:04d}.pdf"
+            merge_path = os.path.join(self.merge_dir, name)
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_lower_priority)
+        future = self.executor.submit(process_batch, paths, merge_path, self.keep_originals)
+        future.add_done_callback(self._collect)
+
+    def _collect(self, future):
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.error(f"PDF 后处理进程出错: {str(e)}")
+            return
+        with self._lock:
+            for key in ('files', 'before', 'after', 'shared', 'failed'):
+                self.stats[key] += result[key]
+            if result['merged']:
+                self.stats['merged'].append(result['merged'])
+
+    def close(self):
+        """提交剩余文件并等待全部完成，返回统计字典"""
+        self.flush()
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+            self.executor = None
+        stats = self.stats
+        if stats['files']:
+            saved = stats['before'] - stats['after']
+            logger.info(
+                f"PDF 后处理完成：{stats['files']} 个文件，{stats['before'] / 1048576:.1f} MB → "
+                f"{stats['after'] / 1048576:.1f} MB（节省 {saved / max(1, stats['before']):.0%}），"
+                f"共享 {stats['shared']} 个重复对象，合并 {len(stats['merged'])} 个文件，失败 {stats['failed']} 个")
+        return stats
+
+
+if __name__ == '__main__':
+    import glob
+    import argparse
+
+    parser = argparse.ArgumentParser(description="压缩、去重已生成的 PDF，可按批合并")
+    parser.add_argument('directory', help="PDF 所在目录")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help="后处理进程数")
+    parser.add_argument('--merge-batch', type=int, default=0, help="每批合并的文件数，0 表示不合并")
+    parser.add_argument('--remove-originals', action='store_true', help="合并后删除原文件")
+    args = parser.parse_args()
+
+    if pikepdf is None:
+        parser.error("未安装 pikepdf，请先执行 pip install pikepdf")
+    logging.basicConfig(level=logging.INFO)
+    processor = PostProcessor(args.workers, args.merge_batch, not args.remove_originals,
+                              os.path.join(args.directory, 'merged'))
+    for path in sorted(glob.glob(os.path.join(args.directory, '*.pdf'))):
+        processor.submit(path)
+    processor.close()
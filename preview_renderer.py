@@ -0,0 +1,62 @@
+import hashlib
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from data_cache import format_value
+
+logger = logging.getLogger(__name__)
+
+# 预览请求排在所有生成任务之前
+PREVIEW_PRIORITY = -1
+
+
+class PreviewRenderer:
+    """单行预览：用编译模板生成 HTML，再由浏览器池中的常驻浏览器截取第一页
+
+    最近的预览结果按 HTML 内容缓存（LRU），映射改动后 HTML 不变时直接命中缓存。
+    """
+
+    def __init__(self, pool, max_entries=32):
+        self.pool = pool
+        self.max_entries = max_entries
+        self._cache = OrderedDict()  # HTML 摘要 -> PNG 字节
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def row_values(template, field_mapping, row):
+        """按模板占位符顺序取出一行的值，row 为 {列名: 值}"""
+        return tuple(
+            format_value(row[column]) if column is not None and column in row else ""
+            for column in template.columns_for(field_mapping)
+        )
+
+    def render(self, html_content):
+        """返回 Future，结果为 (PNG 字节, 耗时秒数, 是否命中缓存)"""
+        started = time.perf_counter()
+        digest = hashlib.sha1(html_content.encode('utf-8')).hexdigest()
+        with self._lock:
+            image = self._cache.get(digest)
+            if image is not None:
+                self._cache.move_to_end(digest)
+        if image is not None:
+            future = Future()
+            future.set_result((image, time.perf_counter() - started, True))
+            return future
+
+        def done(image):
+            with self._lock:
+                self._cache[digest] = image
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+            elapsed = time.perf_counter() - started
+            logger.debug("预览渲染耗时 %.0f ms", elapsed * 1000)
+            return image, elapsed, False
+
+        return self.pool.submit(
+            lambda manager: done(manager.render_image(html_content)), priority=PREVIEW_PRIORITY)
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
@@ -0,0 +1,69 @@
+import time
+from collections import deque
+
+
+def format_duration(seconds):
+    """秒数格式化为 HH:MM:SS"""
+    if seconds is None:
+        return "--:--:--"
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class ProgressTracker:
+    """统计进度、吞吐量和剩余时间，并按时间间隔合并进度通知
+
+    update 每行调用一次，只有距上次通知超过 interval 秒（或全部完成）时才返回统计结果，
+    其余调用返回 None，调用方据此决定是否刷新界面。
+    """
+
+    def __init__(self, total, interval=0.25, window=10.0):
+        self.total = total
+        self.interval = interval
+        self.window = window
+        self.done = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self._last_emit = 0.0
+        # 最近 window 秒内的 (时间, 完成数) 采样，用于计算当前速度
+        self._samples = deque([(self.started, 0)])
+
+    def update(self, ok=True):
+        """记录一行完成，到达通知间隔时返回统计结果"""
+        self.done += 1
+        if not ok:
+            self.failed += 1
+        now = time.monotonic()
+        if now - self._last_emit < self.interval and self.done < self.total:
+            return None
+        self._last_emit = now
+        self._samples.append((now, self.done))
+        while len(self._samples) > 2 and now - self._samples[0][0] > self.window:
+            self._samples.popleft()
+        return self.snapshot(now)
+
+    def snapshot(self, now=None):
+        """当前统计：完成数、失败数、百分比、速度（行/秒）、已用时间和预计剩余时间"""
+        now = now or time.monotonic()
+        first_time, first_done = self._samples[0]
+        span = now - first_time
+        rate = (self.done - first_done) / span if span > 0 else 0.0
+        remaining = self.total - self.done
+        return {
+            'done': self.done,
+            'failed': self.failed,
+            'total': self.total,
+            'percent': int(self.done / self.total * 100) if self.total else 100,
+            'rate': rate,
+            'elapsed': now - self.started,
+            'eta': remaining / rate if rate > 0 else None
+        }
+
+    @staticmethod
+    def describe(stats):
+        """生成状态栏文字"""
+        return (
+            f"{stats['done']}/{stats['total']} 行 | {stats['rate']:.1f} 行/秒 | "
+            f"已用 {format_duration(stats['elapsed'])} | 剩余 {format_duration(stats['eta'])} | "
+            f"失败 {stats['failed']}"
+        )
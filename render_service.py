@@ -0,0 +1,259 @@
+import io
+import json
+import logging
+import os
+import re
+import time
+import zipfile
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote
+from browser_pool import BrowserPool
+from PDF_Maker import PDFMaker
+
+logger = logging.getLogger(__name__)
+
+TEMPLATE_ID_PATTERN = re.compile(r'^[\w\-]+$')
+
+
+class ServiceError(Exception):
+    """带 HTTP 状态码的请求错误"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class RenderService:
+    """常驻渲染服务：模板编译缓存 + 预热的浏览器池，按需生成单个或一批 PDF"""
+
+    def __init__(self, config, workers=None, max_queue=None, timeout=None):
+        self.config = config.snapshot()
+        self.pdf_maker = PDFMaker(self.config)
+        self.pool = BrowserPool(self.config, size=workers)
+        self.template_dir = self.config.get('paths', 'template_dir', default='templates')
+        self.max_queue = max_queue or int(self.config.get('service', 'max_queue', default='64'))
+        self.timeout = timeout or float(self.config.get('service', 'timeout', default='60'))
+
+    def start(self):
+        """启动并预热浏览器池"""
+        self.pool.start()
+        return self
+
+    def close(self):
+        self.pool.close()
+        self.pdf_maker.close()
+
+    def resolve_template(self, template_id):
+        """模板 id 为 default 时使用配置中的模板，否则读取 template_dir/<id>.html"""
+        if not template_id or template_id == 'default':
+            return self.pdf_maker.get_template()
+        if not TEMPLATE_ID_PATTERN.match(template_id):
+            raise ServiceError(400, f"无效的模板 id: {template_id}")
+        path = os.path.join(self.template_dir, f"{template_id}.html")
+        if not os.path.exists(path):
+            raise ServiceError(404, f"模板不存在: {template_id}")
+        return self.pdf_maker.get_template(path)
+
+    def row_values(self, template, row, mapping=None):
+        """将 JSON 行转换为按占位符排序的值元组
+
+        未提供 mapping 时 JSON 的键直接对应占位符名。
+        """
+        if mapping:
+            columns = template.columns_for(mapping)
+        else:
+            columns = template.placeholders
+        format_value = self.pdf_maker.format_value
+        return tuple(
+            format_value(row.get(column)) if column is not None else ""
+            for column in columns
+        )
+
+    def render(self, template_id, rows, mapping=None):
+        """渲染多行，返回 [(文件名, PDF 字节, 排队毫秒, 渲染毫秒)]"""
+        if self.pool.pending + len(rows) > self.max_queue:
+            raise ServiceError(503, "渲染队列已满，请稍后重试")
+        template = self.resolve_template(template_id)
+
+        # 先校验并拼接全部行，任何一行无效都不提交渲染任务
+        prepared = []
+        for position, row in enumerate(rows):
+            if not isinstance(row, dict):
+                raise ServiceError(400, f"第 {position + 1} 行必须是 JSON 对象")
+            html_content = template.render(self.row_values(template, row, mapping))
+            key = self.pdf_maker.format_value(row.get(self.pdf_maker.key_field)) or str(position + 1)
+            prepared.append((key, html_content))
+
+        submitted = [
+            (key, time.perf_counter(), self.pool.submit(_timed_render, html_content))
+            for key, html_content in prepared
+        ]
+
+        results = []
+        used_names = set()
+        deadline = time.perf_counter() + self.timeout
+        try:
+            for key, submitted_at, future in submitted:
+                try:
+                    started, finished, pdf_data = future.result(timeout=max(0, deadline - time.perf_counter()))
+                except FutureTimeoutError:
+                    raise ServiceError(504, "渲染超时")
+                results.append((
+                    _unique_name(f"order_{key}", used_names), pdf_data,
+                    (started - submitted_at) * 1000, (finished - started) * 1000
+                ))
+        except BaseException:
+            # 出错或超时后取消本请求其余尚未开始的任务，不再占用浏览器池
+            for _, _, future in submitted:
+                future.cancel()
+            raise
+        return results
+
+    def health(self):
+        return {
+            'status': 'ok',
+            'workers': self.pool.size,
+            'ready': self.pool.ready_count,
+            'pending': self.pool.pending
+        }
+
+    def serve_forever(self, host='127.0.0.1', port=8765):
+        """启动 HTTP 服务（阻塞）"""
+        server = ThreadingHTTPServer((host, port), RenderRequestHandler)
+        server.daemon_threads = True
+        server.service = self
+        logger.info(f"渲染服务已启动: http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            logger.info("渲染服务收到中断信号，正在退出")
+        finally:
+            server.server_close()
+            self.close()
+
+
+def _unique_name(stem, used_names):
+    """生成不重复的文件名，同名时依次追加 _2、_3 ……"""
+    name = f"{stem}.pdf"
+    number = 1
+    while name in used_names:
+        number += 1
+        name = f"{stem}_{number}.pdf"
+    used_names.add(name)
+    return name
+
+
+def _timed_render(manager, html_content):
+    """在浏览器池线程中执行，记录实际开始和结束时间"""
+    started = time.perf_counter()
+    pdf_data = manager.render_pdf(html_content)
+    return started, time.perf_counter(), pdf_data
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """POST /render：{"template": "default", "row": {...}} 或 {"rows": [...]}，可选 "mapping"
+
+    单行返回 application/pdf，多行返回包含所有 PDF 的 zip。GET /health 返回服务状态。
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path.rstrip('/') == '/health':
+            self._send_json(200, self.server.service.health())
+        else:
+            self._send_json(404, {'error': '未知路径'})
+
+    def do_POST(self):
+        received = time.perf_counter()
+        if self.path.rstrip('/') != '/render':
+            self._send_json(404, {'error': '未知路径'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            try:
+                payload = json.loads(self.rfile.read(length) or b'{}')
+            except ValueError:
+                raise ServiceError(400, "请求体不是有效的 JSON")
+            if not isinstance(payload, dict):
+                raise ServiceError(400, "请求体必须是 JSON 对象")
+
+            if 'rows' in payload:
+                rows, single = payload['rows'], False
+            elif 'row' in payload:
+                rows, single = [payload['row']], True
+            else:
+                raise ServiceError(400, "缺少 row 或 rows")
+            if not isinstance(rows, list) or not rows:
+                raise ServiceError(400, "rows 必须是非空数组")
+
+            results = self.server.service.render(
+                payload.get('template'), rows, payload.get('mapping'))
+        except ServiceError as e:
+            self._send_json(e.status, {'error': str(e)})
+            return
+        except Exception as e:
+            logger.error(f"渲染请求失败: {str(e)}")
+            self._send_json(500, {'error': str(e)})
+            return
+
+        if single:
+            file_name, body, queue_ms, render_ms = results[0]
+            content_type = 'application/pdf'
+        else:
+            buffer = io.BytesIO()
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+                for file_name, pdf_data, _, _ in results:
+                    archive.writestr(file_name, pdf_data)
+            body = buffer.getvalue()
+            file_name = 'documents.zip'
+            content_type = 'application/zip'
+            queue_ms = max(result[2] for result in results)
+            render_ms = sum(result[3] for result in results)
+
+        total_ms = (time.perf_counter() - received) * 1000
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Content-Disposition', f"attachment; filename*=UTF-8''{quote(file_name)}")
+        self.send_header('X-Queue-Time-Ms', f"{queue_ms:.1f}")
+        self.send_header('X-Render-Time-Ms', f"{render_ms:.1f}")
+        self.send_header('X-Total-Time-Ms', f"{total_ms:.1f}")
+        self.send_header(
+            'Server-Timing',
+            f"queue;dur={queue_ms:.1f}, render;dur={render_ms:.1f}, total;dur={total_ms:.1f}")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_json(self, status, data):
+        body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s" % (self.address_string(), format % args))
+
+
+if __name__ == '__main__':
+    import argparse
+    from config_manager import ConfigManager
+    from logger_manager import configure_logging
+
+    parser = argparse.ArgumentParser(description="本地 PDF 渲染服务")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址")
+    parser.add_argument('--port', type=int, default=8765, help="监听端口")
+    parser.add_argument('--workers', type=int, default=None, help="并发浏览器数量")
+    parser.add_argument('--max-queue', type=int, default=None, help="最大排队行数")
+    parser.add_argument('--timeout', type=float, default=None, help="单个请求超时时间（秒）")
+    args = parser.parse_args()
+
+    config = ConfigManager()
+    configure_logging(config)
+    service = RenderService(config, workers=args.workers,
+                            max_queue=args.max_queue, timeout=args.timeout)
+    service.start()
+    service.serve_forever(args.host, args.port)
@@ -0,0 +1,99 @@
+import re
+import logging
+from data_cache import format_value
+
+logger = logging.getLogger(__name__)
+
+_RANGE_PATTERN = re.compile(r'^(\d*)-(\d*)$')
+
+
+class SelectionError(ValueError):
+    """行选择条件无效"""
+
+
+def parse_ranges(text):
+    """解析行号范围，如 "1-10, 15, 200-"，行号从 1 开始，返回 [(起始, 结束), ...]，结束为 None 表示到最后一行"""
+    ranges = []
+    # 先去掉 "-" 两侧的空格，"1 - 10" 不会被拆成三段
+    text = re.sub(r'\s*-\s*', '-', (text or '').strip())
+    for part in re.split(r'[,，\s]+', text):
+        if not part:
+            continue
+        if part.isdigit():
+            start = end = int(part)
+        else:
+            match = _RANGE_PATTERN.match(part)
+            if not match or not (match.group(1) or match.group(2)):
+                raise SelectionError(f"无法识别的行号范围: {part}")
+            start = int(match.group(1)) if match.group(1) else 1
+            end = int(match.group(2)) if match.group(2) else None
+        if start < 1 or (end is not None and end < start):
+            raise SelectionError(f"无效的行号范围: {part}")
+        ranges.append((start, end))
+    return ranges
+
+
+def parse_keys(text):
+    """解析键值列表，支持逗号、空格或换行分隔"""
+    return [key for key in re.split(r'[,，;；\s]+', (text or '').strip()) if key]
+
+
+class RowSelection:
+    """只生成部分行：行号范围、筛选表达式和键值列表，同时指定时取交集
+
+    在读取数据后、格式化和渲染之前应用，未选中的行不会进入浏览器。
+    筛选表达式使用 pandas query 语法，只能引用已映射的列，列名含空格或中文符号时用反引号括起来。
+    """
+
+    def __init__(self, ranges=None, query=None, keys=None):
+        self.ranges = ranges or []
+        self.query = (query or '').strip() or None
+        self.keys = list(keys or [])
+
+    @classmethod
+    def from_text(cls, rows=None, query=None, keys=None):
+        """从界面或命令行输入创建，格式错误时抛出 SelectionError"""
+        return cls(parse_ranges(rows), query, parse_keys(keys))
+
+    def __bool__(self):
+        return bool(self.ranges or self.query or self.keys)
+
+    def describe(self):
+        """生成便于记录日志的说明"""
+        parts = []
+        if self.ranges:
+            parts.append("行号 " + ", ".join(
+                str(start) if start == end else f"{start}-{end or ''}" for start, end in self.ranges))
+        if self.query:
+            parts.append(f"筛选 {self.query}")
+        if self.keys:
+            parts.append(f"键值 {len(self.keys)} 个")
+        return "；".join(parts) or "全部行"
+
+    def apply(self, df, key_field=None):
+        """返回选中的行，索引保留原始行号（从 0 开始）"""
+        if not self:
+            return df
+        total = len(df)
+        if self.ranges:
+            positions = set()
+            for start, end in self.ranges:
+                positions.update(range(start - 1, min(end or total, total)))
+            df = df[df.index.isin(positions)]
+        if self.query:
+            try:
+                df = df.query(self.query, engine='python')
+            except Exception as e:
+                raise SelectionError(
+                    f"筛选条件无效（只能引用已映射的列 {list(df.columns)}）: {str(e)}") from e
+        if self.keys:
+            if not key_field or key_field not in df.columns:
+                raise SelectionError(f"数据中没有键值列: {key_field}")
+            key_values = df[key_field].map(format_value)
+            wanted = set(self.keys)
+            df = df[key_values.isin(wanted)]
+            missing = wanted.difference(key_values[key_values.isin(wanted)])
+            if missing:
+                logger.warning(f"以下键值未找到或不满足其他条件: {', '.join(sorted(missing))}")
+        logger.info(f"行选择（{self.describe()}）：共 {total} 行，选中 {len(df)} 行")
+        return df
@@ -0,0 +1,173 @@
+import atexit
+import logging
+from array import array
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+from data_cache import MappedRows
+
+logger = logging.getLogger(__name__)
+
+_ITEM_SIZE = array('q').itemsize
+
+
+class SharedRows:
+    """把 MappedRows 打包进一块共享内存，工作进程按偏移量读取行区间，无需序列化整张表
+
+    内存布局：[单元格偏移量 int64 * (行数 * 字段数 + 1)][原始行号 int64 * 行数][UTF-8 数据]
+    每行的字段为模板占位符的值，最后一个字段是输出文件名用的键值（空字符串表示没有）。
+    """
+
+    def __init__(self, shm, descriptor, owner):
+        self.shm = shm
+        self.descriptor = descriptor
+        self.owner = owner
+        self.row_count = descriptor['row_count']
+        self.field_count = descriptor['field_count']
+        offsets_size = (self.row_count * self.field_count + 1) * _ITEM_SIZE
+        indices_size = self.row_count * _ITEM_SIZE
+        buf = shm.buf
+        self._offsets = buf[:offsets_size].cast('q')
+        self._indices = buf[offsets_size:offsets_size + indices_size].cast('q')
+        self._data = buf[offsets_size + indices_size:offsets_size + indices_size + descriptor['data_size']]
+
+    @classmethod
+    def create(cls, rows):
+        """将行数据写入新的共享内存块"""
+        field_count = len(rows.placeholders) + 1
+        offsets = array('q', [0])
+        chunks = []
+        position = 0
+        for _, key, values in rows:
+            for value in values + (key or "",):
+                encoded = value.encode('utf-8')
+                chunks.append(encoded)
+                position += len(encoded)
+                offsets.append(position)
+        data = b''.join(chunks)
+        del chunks
+        indices = array('q', rows.indices)
+
+        header = offsets.tobytes() + indices.tobytes()
+        shm = shared_memory.SharedMemory(create=True, size=max(1, len(header) + len(data)))
+        shm.buf[:len(header)] = header
+        shm.buf[len(header):len(header) + len(data)] = data
+        descriptor = {
+            'name': shm.name,
+            'row_count': len(rows),
+            'field_count': field_count,
+            'data_size': len(data),
+            'placeholders': list(rows.placeholders)
+        }
+        logger.info(f"共享内存已写入 {len(rows)} 行，{(len(header) + len(data)) / 1024 / 1024:.1f} MB")
+        return cls(shm, descriptor, owner=True)
+
+    @classmethod
+    def attach(cls, descriptor):
+        """在工作进程中按描述信息挂载共享内存"""
+        return cls(shared_memory.SharedMemory(name=descriptor['name']), descriptor, owner=False)
+
+    def __len__(self):
+        return self.row_count
+
+    def read(self, start, end):
+        """读取 [start, end) 行，只复制这几行的字符串"""
+        end = min(end, self.row_count)
+        field_count = self.field_count
+        offsets = self._offsets
+        data = self._data
+        rows, keys = [], []
+        for row in range(start, end):
+            base = row * field_count
+            cells = [
+                str(data[offsets[i]:offsets[i + 1]], 'utf-8')
+                for i in range(base, base + field_count)
+            ]
+            keys.append(cells.pop() or None)
+            rows.append(tuple(cells))
+        return MappedRows(self.descriptor['placeholders'], rows, keys, list(self._indices[start:end]))
+
+    def close(self):
+        """释放视图；创建者同时删除共享内存"""
+        self._offsets.release()
+        self._indices.release()
+        self._data.release()
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+# 工作进程内的全局状态，由 _init_worker 初始化
+_worker_state = {}
+
+
+def _init_worker(config, descriptor, template_path):
+    from logger_manager import configure_logging
+    from PDF_Maker import PDFMaker
+    configure_logging(config)
+    pdf_maker = PDFMaker(config)
+    # 后处理由父进程统一进行，合并批次不会按工作进程拆散
+    pdf_maker.postprocessor = None
+    shared = SharedRows.attach(descriptor)
+    _worker_state.update(
+        pdf_maker=pdf_maker, shared=shared,
+        template=pdf_maker.get_template(template_path))
+
+    def shutdown():
+        pdf_maker.close()
+        shared.close()
+
+    atexit.register(shutdown)
+
+
+def _render_range(start, end):
+    pdf_maker = _worker_state['pdf_maker']
+    template = _worker_state['template']
+    succeeded = failed = 0
+    outputs = []
+    for index, key, values in _worker_state['shared'].read(start, end):
+        output_file = pdf_maker.generate_row(template, values, order_id=key)
+        if output_file:
+            succeeded += 1
+            outputs.append(output_file)
+            pdf_maker.log_manager.log_row('ok', row=index + 1, key=key, file=output_file)
+        else:
+            failed += 1
+            pdf_maker.log_manager.log_row('failed', row=index + 1, key=key)
+    return start, end, succeeded, failed, outputs
+
+
+def render_in_processes(config, shared, template_path, processes, chunk_size=50, on_progress=None,
+                        postprocessor=None):
+    """多进程生成 PDF，行数据通过共享内存分发，返回 (成功数, 失败数)
+
+    shared 为 SharedRows.create 创建的共享内存行数据，由本函数负责关闭；
+    调用方应在创建后释放自己对原始行数据的引用，父进程中每行只保留一份。
+    on_progress(已完成行数, 总行数) 在每个分片完成后调用。
+    postprocessor 不为 None 时，每个分片生成的文件提交给它后处理，全部完成后提交剩余文件。
+    """
+    total = len(shared)
+    succeeded = failed = 0
+    try:
+        with ProcessPoolExecutor(
+                max_workers=processes, initializer=_init_worker,
+                initargs=(config.snapshot(), shared.descriptor, template_path)) as executor:
+            futures = [
+                executor.submit(_render_range, start, start + chunk_size)
+                for start in range(0, total, chunk_size)
+            ]
+            done_rows = 0
+            for future in as_completed(futures):
+                start, end, ok, bad, outputs = future.result()
+                succeeded += ok
+                failed += bad
+                if postprocessor:
+                    for output_file in outputs:
+                        postprocessor.submit(output_file)
+                done_rows += min(end, total) - start
+                if on_progress:
+                    on_progress(done_rows, total)
+    finally:
+        shared.close()
+    if postprocessor:
+        postprocessor.flush()
+    return succeeded, failed
@@ -0,0 +1,240 @@
+import os
+import re
+import json
+import threading
+from collections import OrderedDict
+
+# {{xxx}} 格式的占位符
+PLACEHOLDER_PATTERN = re.compile(r'\{\{([^}]+)\}\}')
+
+# 热页面模式：占位符替换为注释标记，页面加载后由脚本换成文本节点，之后每行只改写文本节点
+HOT_MARKER = '<!--pdf-slot:{}-->'
+
+# 返回绑定到的占位符数量；标记位于表格结构或 head 中（文本会被浏览器移到别处）时返回 -1
+HOT_BIND_SCRIPT = """(() => {
+  const markers = [];
+  const walker = document.createTreeWalker(document, NodeFilter.SHOW_COMMENT);
+  while (walker.nextNode()) {
+    const match = /^pdf-slot:(\\d+)$/.exec(walker.currentNode.data);
+    if (match) markers.push([walker.currentNode, Number(match[1])]);
+  }
+  for (const [marker] of markers) {
+    if (/^(HTML|HEAD|TABLE|TBODY|THEAD|TFOOT|TR|SELECT)$/.test(marker.parentNode.nodeName)) return -1;
+  }
+  const slots = [];
+  for (const [marker, index] of markers) {
+    const node = document.createTextNode('');
+    marker.parentNode.replaceChild(node, marker);
+    (slots[index] = slots[index] || []).push(node);
+  }
+  window.__pdfSlots = slots;
+  return slots.filter(Boolean).length;
+})()"""
+
+
+def hot_fill_script(values):
+    """生成写入一行值的脚本，所有占位符每行都重写，不会残留上一行的内容"""
+    return """((values) => {
+  const slots = window.__pdfSlots;
+  for (let i = 0; i < slots.length; i++) {
+    if (slots[i]) for (const node of slots[i]) node.data = values[i];
+  }
+  return document.fonts.ready.then(() => true);
+})(%s)""" % json.dumps(list(values), ensure_ascii=False)
+
+
+def optimized_path(path):
+    """预优化模板的保存位置：原模板旁的 <名称>.optimized.html"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.optimized{ext}"
+
+
+def strip_placeholder(placeholder):
+    """去掉占位符两侧的花括号，兼容 '{{order_id}}' 与 'order_id' 两种写法"""
+    placeholder = placeholder.strip()
+    if placeholder.startswith('{{') and placeholder.endswith('}}'):
+        placeholder = placeholder[2:-2]
+    return placeholder
+
+
+class CompiledTemplate:
+    """预编译的 HTML 模板：静态片段与占位符交替排列，渲染时只做一次拼接"""
+
+    def __init__(self, content, path=None, source=None):
+        # path 始终是原模板，source 是实际编译的文件（使用预优化版本时与 path 不同）
+        self.path = path
+        self.source = source or path
+        self.content = content
+        pieces = PLACEHOLDER_PATTERN.split(content)
+        # 偶数位是静态片段，奇数位是占位符名
+        self.fragments = pieces[0::2]
+        slot_names = pieces[1::2]
+        # 去重后的占位符顺序，行数据元组按此顺序排列
+        self.placeholders = list(dict.fromkeys(slot_names))
+        positions = {name: i for i, name in enumerate(self.placeholders)}
+        self.slots = [positions[name] for name in slot_names]
+        self._hot_html = False
+        # 浏览器中绑定失败后置为 True，之后该模板一律整页加载
+        self.hot_disabled = False
+
+    @classmethod
+    def from_file(cls, path, source=None):
+        """从文件编译模板，source 指定时读取该文件（如预优化版本），path 仍记录原模板"""
+        with open(source or path, 'r', encoding='utf-8') as f:
+            return cls(f.read(), path=os.path.abspath(path), source=os.path.abspath(source or path))
+
+    def columns_for(self, field_mapping):
+        """按占位符顺序返回映射到的 Excel 列，未映射的占位符为 None"""
+        reverse = {}
+        for field, placeholder in field_mapping.items():
+            reverse.setdefault(strip_placeholder(placeholder), field)
+        return [reverse.get(name) for name in self.placeholders]
+
+    @property
+    def hot_html(self):
+        """热页面模式使用的文档，模板无法绑定时为 None
+
+        占位符必须都位于普通文本中：不能在标签属性、注释、style / title / textarea 内，模板也不能含有脚本。
+        """
+        if self._hot_html is False:
+            self._hot_html = self._build_hot_html()
+        return self._hot_html
+
+    def _build_hot_html(self):
+        content = self.content
+        lowered = content.lower()
+        if '<script' in lowered:
+            return None
+        for match in PLACEHOLDER_PATTERN.finditer(content):
+            position = match.start()
+            if content.rfind('<', 0, position) > content.rfind('>', 0, position):
+                return None
+            if lowered.rfind('<!--', 0, position) > lowered.rfind('-->', 0, position):
+                return None
+            for tag in ('style', 'title', 'textarea'):
+                if lowered.rfind('<' + tag, 0, position) > lowered.rfind('</' + tag, 0, position):
+                    return None
+        parts = [self.fragments[0]]
+        for slot, fragment in zip(self.slots, self.fragments[1:]):
+            parts.append(HOT_MARKER.format(slot))
+            parts.append(fragment)
+        return ''.join(parts)
+
+    def can_bind(self, values):
+        """这一行能否用热页面模式渲染：值中含有 < 或 & 时按 HTML 解析的结果与文本不同，需要整页加载"""
+        if self.hot_disabled or self.hot_html is None:
+            return False
+        return not any('<' in value or '&' in value for value in values)
+
+    def render(self, values):
+        """用按占位符顺序排列的值元组渲染模板"""
+        fragments = self.fragments
+        parts = [fragments[0]]
+        for slot, fragment in zip(self.slots, fragments[1:]):
+            parts.append(values[slot])
+            parts.append(fragment)
+        return ''.join(parts)
+
+
+class TemplateCache:
+    """已编译模板的 LRU 缓存，按文件修改时间判断是否需要重新编译
+
+    optimized 为 True 时，原模板旁有更新的预优化版本（<名称>.optimized.html）则编译该版本。
+    """
+
+    def __init__(self, max_entries=16, optimized=False):
+        self.max_entries = max_entries
+        self.optimized = optimized
+        self._entries = OrderedDict()  # 绝对路径 -> ((实际编译的文件, 修改时间), CompiledTemplate)
+        self._lock = threading.Lock()
+
+    def source_for(self, path):
+        """返回实际编译的文件：预优化版本比原模板新时使用预优化版本"""
+        if self.optimized:
+            candidate = optimized_path(path)
+            if os.path.exists(candidate) and os.path.getmtime(candidate) >= os.path.getmtime(path):
+                return candidate
+        return path
+
+    def get(self, path):
+        """返回编译后的模板，文件修改后自动重新编译"""
+        path = os.path.abspath(path)
+        source = self.source_for(path)
+        version = (source, os.path.getmtime(source))
+        with self._lock:
+            cached = self._entries.get(path)
+            if cached is not None and cached[0] == version:
+                self._entries.move_to_end(path)
+                return cached[1]
+        template = CompiledTemplate.from_file(path, source)
+        with self._lock:
+            self._entries[path] = (version, template)
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return template
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TemplateSelector:
+    """按某一列的值为每行选择模板
+
+    查找顺序：规则文件中的 {值: 模板路径}，然后是模板目录下的 <值>.html，最后使用默认模板。
+    """
+
+    def __init__(self, column, default, rules=None, directory=None):
+        if not default:
+            # 没有匹配规则的行会落到默认模板，缺少时渲染到一半才会出错
+            raise ValueError(f"已设置模板选择列 {column}，但未配置默认模板（paths/template_path）")
+        self.column = column
+        self.default = default
+        self.rules = rules or {}
+        self.directory = directory
+        self._memo = {}
+        self._directory_mtime = self._mtime()
+
+    @classmethod
+    def from_config(cls, config):
+        """根据 templates 配置段创建，未设置选择列时返回 None"""
+        column = config.get('templates', 'column')
+        if not column:
+            return None
+        default = config.get('paths', 'template_path')
+        rules = {}
+        rules_file = config.get('templates', 'rules_file')
+        if rules_file and os.path.exists(rules_file):
+            with open(rules_file, 'r', encoding='utf-8') as f:
+                # 相对路径以规则文件所在目录为准
+                base = os.path.dirname(os.path.abspath(rules_file))
+                rules = {str(value): os.path.join(base, path) for value, path in json.load(f).items()}
+        directory = config.get('templates', 'directory') or (os.path.dirname(os.path.abspath(default)) if default else None)
+        return cls(column, default, rules, directory)
+
+    def _mtime(self):
+        try:
+            return os.stat(self.directory).st_mtime_ns if self.directory else None
+        except OSError:
+            return None
+
+    def refresh(self):
+        """模板目录中有文件新增、改名或删除时（目录修改时间变化）清空查找结果；每次读取数据前调用一次"""
+        mtime = self._mtime()
+        if mtime != self._directory_mtime:
+            self._memo.clear()
+            self._directory_mtime = mtime
+
+    def path_for(self, value):
+        """返回某个列值对应的模板路径"""
+        path = self._memo.get(value)
+        if path is None:
+            path = self.rules.get(value)
+            # 列值只作为文件名使用，不允许包含目录
+            if path is None and self.directory and value and os.path.basename(value) == value:
+                candidate = os.path.join(self.directory, f"{value}.html")
+                if os.path.isfile(candidate):
+                    path = candidate
+            path = os.path.abspath(path or self.default)
+            self._memo[value] = path
+        return path
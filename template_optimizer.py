@@ -0,0 +1,367 @@
+import io
+import os
+import re
+import base64
+import logging
+from html.parser import HTMLParser
+from template_compiler import CompiledTemplate, PLACEHOLDER_PATTERN, optimized_path
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+# 不参与空白压缩的元素
+_RAW_BLOCK = re.compile(r'(<(pre|textarea|script|style)\b.*?</\2\s*>)', re.S | re.I)
+_STYLE_BLOCK = re.compile(r'(<style\b[^>]*>)(.*?)(</style\s*>)', re.S | re.I)
+# 标签（属性值中可能含有 ">"），合并空白时跳过
+_TAG = re.compile(r'''(<(?:[^>"']|"[^"]*"|'[^']*')*>)''')
+# 需要保留空白的样式，以及无法检查内容的外部样式表
+_PRESERVED_WHITESPACE = re.compile(r'white-space\s*:\s*(pre(-wrap|-line)?|break-spaces)\b', re.I)
+_LINKED_STYLESHEET = re.compile(r'''<link\b[^>]*\brel\s*=\s*["']?stylesheet|@import\b''', re.I)
+# 条件注释保留
+_HTML_COMMENT = re.compile(r'<!--(?!\[if).*?-->', re.S)
+_CSS_COMMENT = re.compile(r'/\*.*?\*/', re.S)
+_CSS_STRING = r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\''
+_PROTECTED = f'({_CSS_STRING}|{PLACEHOLDER_PATTERN.pattern})'
+_DATA_URI = re.compile(r'data:image/(png|jpe?g|webp);base64,([A-Za-z0-9+/=\s]+)', re.I)
+_IMG_TAG = re.compile(r'<img\b[^>]*>', re.I)
+_EXTERNAL = re.compile(r'''(?:@import\s+(?:url\()?|url\(|href=|src=)\s*["']?(https?://[^"')\s>]+)''', re.I)
+# 空元素没有结束标签
+_VOID_TAGS = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta',
+              'param', 'source', 'track', 'wbr'}
+# 解析器会自动补上的元素：<table> 中直接写 <tr> 时补 <tbody>，直接写 <col> 时补 <colgroup>
+_IMPLIED_TAGS = {'table': ('tbody',), 'col': ('colgroup',)}
+# 排版开销较大的 CSS 属性
+_COSTLY_PROPERTIES = ('box-shadow', 'filter', 'text-shadow', 'border-radius', 'transform', 'opacity')
+
+
+def minify_css(css):
+    """去掉注释和多余空白，字符串和占位符保持不变"""
+    css = _CSS_COMMENT.sub('', css)
+    css = re.sub(_PROTECTED + r'|\s+', lambda m: m.group(1) or ' ', css)
+    css = re.sub(_PROTECTED + r'|\s*([{};,>])\s*', lambda m: m.group(1) or m.group(3), css)
+    css = re.sub(_PROTECTED + r'|:\s+', lambda m: m.group(1) or ':', css)
+    return css.replace(';}', '}').strip()
+
+
+def split_rules(css):
+    """把（已去掉注释的）CSS 按顶层规则拆分为 [(前导, 规则体), ...]，@charset 等无规则体的语句体为 None"""
+    rules = []
+    start = depth = 0
+    position = 0
+    prelude = None
+    while position < len(css):
+        char = css[position]
+        if char in '"\'':
+            match = re.compile(_CSS_STRING).match(css, position)
+            position = match.end() if match else position + 1
+            continue
+        if char == '{':
+            if depth == 0:
+                prelude = css[start:position].strip()
+                start = position + 1
+            depth += 1
+        elif char == '}':
+            depth -= 1
+            if depth == 0:
+                rules.append((prelude, css[start:position]))
+                start = position + 1
+        elif char == ';' and depth == 0:
+            rules.append((css[start:position].strip(), None))
+            start = position + 1
+        position += 1
+    return rules
+
+
+class DocumentScanner(HTMLParser):
+    """收集模板中用到的标签、类名、ID，以及每个元素的子孙数量和表格嵌套深度"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        # 浏览器总会补齐这几个元素
+        self.tags = {'html', 'head', 'body'}
+        self.classes = set()
+        self.ids = set()
+        self.dynamic_classes = False
+        self.dynamic_ids = False
+        self.stack = []
+        self.elements = []
+        # 顶层元素（body 的子元素，或没有 body 时的最外层元素）
+        self.roots = []
+        self.nodes = 0
+        self.max_table_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        self.nodes += 1
+        self.tags.add(tag)
+        self.tags.update(_IMPLIED_TAGS.get(tag, ()))
+        attrs = dict(attrs)
+        classes = (attrs.get('class') or '').split()
+        if PLACEHOLDER_PATTERN.search(attrs.get('class') or ''):
+            self.dynamic_classes = True
+        if PLACEHOLDER_PATTERN.search(attrs.get('id') or ''):
+            self.dynamic_ids = True
+        self.classes.update(classes)
+        if attrs.get('id'):
+            self.ids.add(attrs['id'])
+        for element in self.stack:
+            element['descendants'] += 1
+        if tag in _VOID_TAGS:
+            return
+        tables = sum(1 for element in self.stack if element['tag'] == 'table') + (tag == 'table')
+        self.max_table_depth = max(self.max_table_depth, tables)
+        label = tag + (f"#{attrs['id']}" if attrs.get('id') else '') + (f".{classes[0]}" if classes else '')
+        element = {'tag': tag, 'label': label, 'line': self.getpos()[0], 'descendants': 0,
+                   'tables': tables, 'children': []}
+        parent = self.stack[-1] if self.stack else None
+        if tag not in ('html', 'head', 'body'):
+            if parent is None or parent['tag'] in ('html', 'body'):
+                self.roots.append(element)
+            else:
+                parent['children'].append(element)
+        self.stack.append(element)
+        self.elements.append(element)
+
+    def handle_endtag(self, tag):
+        # 省略结束标签时一直弹出到匹配的元素
+        for position in range(len(self.stack) - 1, -1, -1):
+            if self.stack[position]['tag'] == tag:
+                del self.stack[position:]
+                break
+
+
+def _selector_used(selector, scanner):
+    """选择器引用的标签、类名和 ID 是否都出现在模板中；无法判断时视为使用
+
+    只由标签名组成的选择器一律保留：浏览器可能补上模板中没有写出的元素，值中也可能带有 HTML。
+    """
+    if '\\' in selector or '(' in selector or '[' in selector:
+        return True
+    simple = re.sub(r'::?[-\w]+', '', selector)
+    classes = re.findall(r'\.(-?[_a-zA-Z][-\w]*)', simple)
+    ids = re.findall(r'#(-?[_a-zA-Z][-\w]*)', simple)
+    if not classes and not ids:
+        return True
+    tags = re.findall(r'(?:^|[\s>+~])([a-zA-Z][-\w]*)', simple)
+    if not scanner.dynamic_classes and any(name not in scanner.classes for name in classes):
+        return False
+    if not scanner.dynamic_ids and any(name not in scanner.ids for name in ids):
+        return False
+    return all(tag.lower() in scanner.tags for tag in tags)
+
+
+def strip_unused_rules(css, scanner):
+    """删除模板中没有元素匹配的选择器，返回 (CSS, 删除的规则数)"""
+    kept, removed = [], 0
+    for prelude, body in split_rules(css):
+        if body is None:
+            kept.append(prelude + ';')
+        elif prelude.startswith('@media') or prelude.startswith('@supports'):
+            inner, count = strip_unused_rules(body, scanner)
+            removed += count
+            if inner:
+                kept.append(f'{prelude}{{{inner}}}')
+        elif prelude.startswith('@'):
+            kept.append(f'{prelude}{{{body}}}')
+        else:
+            selectors = [selector for selector in prelude.split(',') if _selector_used(selector.strip(), scanner)]
+            if selectors:
+                kept.append(f"{','.join(selectors)}{{{body}}}")
+            else:
+                removed += 1
+    return ''.join(kept), removed
+
+
+def _css_length(value):
+    """把 HTML / CSS 长度转换为 CSS 像素，无法换算时返回 None"""
+    match = re.match(r'\s*([\d.]+)\s*(px|mm|cm|in|pt)?\s*$', value or '')
+    if not match:
+        return None
+    factor = {'px': 1, None: 1, 'in': 96, 'cm': 96 / 2.54, 'mm': 96 / 25.4, 'pt': 96 / 72}[match.group(2)]
+    return float(match.group(1)) * factor
+
+
+def _display_size(tag, name):
+    """<img> 标签的 width / height 属性或内联样式，换算为 CSS 像素"""
+    match = re.search(rf'(?<![-\w]){name}\s*(?:=\s*["\']?|:\s*)([\d.]+[a-z]*)', tag, re.I)
+    return _css_length(match.group(1)) if match else None
+
+
+class TemplateOptimizer:
+    """模板预优化：压缩 HTML/CSS、删除未使用的选择器、把过大的内嵌图片缩小到打印分辨率，并报告排版开销大的元素
+
+    优化结果保存在原模板旁（<名称>.optimized.html），模板缓存在其比原文件新时自动使用。
+    """
+
+    def __init__(self, config):
+        config = config.snapshot()
+        self.dpi = config.get_float('templates', 'image_dpi', 200.0)
+        # 值中插入的 HTML 可能用到模板里没有的类名和 ID，默认不删除选择器
+        self.strip_selectors = config.get_bool('templates', 'strip_selectors', False)
+        self.page_width = config.paper_width * 96
+        self.page_height = config.paper_height * 96
+
+    def optimize(self, path):
+        """优化模板并写入缓存文件，返回报告字典"""
+        with open(path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        scanner = DocumentScanner()
+        scanner.feed(content)
+        scanner.close()
+        report = {'source': os.path.abspath(path), 'output': optimized_path(os.path.abspath(path)),
+                  'before': len(content.encode('utf-8')), 'images': [], 'rules_removed': 0,
+                  'heavy': self.heavy_elements(content, scanner), 'warnings': []}
+
+        optimized = self.shrink_images(content, report)
+        optimized = self.optimize_styles(optimized, scanner, report)
+        optimized = self.minify_html(optimized)
+
+        # 占位符必须完全一致，否则放弃优化结果
+        if CompiledTemplate(optimized).placeholders != CompiledTemplate(content).placeholders:
+            raise ValueError("优化后占位符发生变化，未写入优化结果")
+        temp_path = report['output'] + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(optimized)
+        os.replace(temp_path, report['output'])
+        report['after'] = len(optimized.encode('utf-8'))
+        return report
+
+    def optimize_styles(self, content, scanner, report):
+        """压缩 <style> 中的 CSS；开启 strip_selectors 且模板不含脚本时删除未使用的选择器"""
+        strip = self.strip_selectors and '<script' not in content.lower()
+
+        def replace(match):
+            css = minify_css(match.group(2))
+            # 含占位符的样式表无法可靠拆分规则
+            if strip and not PLACEHOLDER_PATTERN.search(css):
+                css, removed = strip_unused_rules(css, scanner)
+                report['rules_removed'] += removed
+            return match.group(1) + css + match.group(3)
+
+        return _STYLE_BLOCK.sub(replace, content)
+
+    @staticmethod
+    def minify_html(content):
+        """去掉注释、合并文本节点中的连续空白；标签和属性值保持不变
+
+        pre / textarea / script / style 内部不合并；使用 white-space: pre / pre-wrap / pre-line / break-spaces，
+        或引用了无法检查的外部样式表时整个模板都不合并。
+        """
+        collapse = not (_PRESERVED_WHITESPACE.search(content) or _LINKED_STYLESHEET.search(content))
+        parts = _RAW_BLOCK.split(content)
+        # split 的结果依次为：普通片段、整个保留块、标签名
+        for position in range(0, len(parts), 3):
+            text = _HTML_COMMENT.sub('', parts[position])
+            if collapse:
+                # 标签（含属性值）为奇数项，只处理偶数项的文本
+                pieces = _TAG.split(text)
+                for index in range(0, len(pieces), 2):
+                    pieces[index] = re.sub(
+                        f'({PLACEHOLDER_PATTERN.pattern})|\\s+', lambda m: m.group(1) or ' ', pieces[index])
+                text = ''.join(pieces)
+            parts[position] = text
+        return ''.join(part for position, part in enumerate(parts) if position % 3 != 2).strip()
+
+    def shrink_images(self, content, report):
+        """把超出显示尺寸（<img> 的宽高属性，否则为纸张大小）打印分辨率的内嵌图片缩小"""
+        def replace_tag(match):
+            tag = match.group(0)
+            width, height = _display_size(tag, 'width'), _display_size(tag, 'height')
+            return self._replace_data_uris(tag, width or self.page_width, height or self.page_height, report)
+
+        content = _IMG_TAG.sub(replace_tag, content)
+        return self._replace_data_uris(content, self.page_width, self.page_height, report)
+
+    def _replace_data_uris(self, text, width, height, report):
+        limit = (max(1, int(width * self.dpi / 96)), max(1, int(height * self.dpi / 96)))
+
+        def replace(match):
+            raw = base64.b64decode(re.sub(r'\s+', '', match.group(2)))
+            if Image is None:
+                if len(raw) > 100 * 1024:
+                    report['warnings'].append(f"内嵌图片 {len(raw) // 1024} KB，未安装 Pillow，无法缩小")
+                return match.group(0)
+            smaller = self._shrink(raw, match.group(1).lower(), limit)
+            if smaller is None:
+                return match.group(0)
+            report['images'].append((len(raw), len(smaller)))
+            return f"data:image/{match.group(1)};base64,{base64.b64encode(smaller).decode('ascii')}"
+
+        return _DATA_URI.sub(replace, text)
+
+    def _shrink(self, raw, kind, limit):
+        """缩小到 limit 像素以内，重新编码后变小时返回新数据，否则返回 None"""
+        try:
+            image = Image.open(io.BytesIO(raw))
+            if image.width <= limit[0] and image.height <= limit[1]:
+                return None
+            image.thumbnail(limit, Image.LANCZOS)
+            output = io.BytesIO()
+            if kind in ('jpg', 'jpeg'):
+                image.convert('RGB').save(output, 'JPEG', quality=85, optimize=True)
+            else:
+                image.save(output, kind.upper(), optimize=True)
+        except Exception as e:
+            logger.warning(f"处理内嵌图片失败: {str(e)}")
+            return None
+        data = output.getvalue()
+        return data if len(data) < len(raw) else None
+
+    def heavy_elements(self, content, scanner):
+        """静态估计排版开销：子孙节点最多的元素、表格嵌套、外部资源、大量高开销样式"""
+        findings = []
+        # 从顶层元素开始，只有一个外层容器时向内展开，找出体量最大的几个区块
+        blocks = scanner.roots
+        while len(blocks) == 1 and blocks[0]['children']:
+            blocks = blocks[0]['children']
+        blocks = [element for element in blocks if element['descendants'] >= scanner.nodes * 0.1]
+        for element in sorted(blocks, key=lambda e: -e['descendants'])[:5]:
+            findings.append(f"第 {element['line']} 行 <{element['label']}> 包含 {element['descendants']} 个元素"
+                            f"（全部 {scanner.nodes} 个）")
+        if scanner.max_table_depth > 2:
+            deepest = max((e for e in scanner.elements if e['tag'] == 'table'), key=lambda e: e['tables'])
+            findings.append(f"表格嵌套 {scanner.max_table_depth} 层（第 {deepest['line']} 行），表格布局需要多次测量")
+        for url in sorted(set(_EXTERNAL.findall(content))):
+            findings.append(f"外部资源 {url}，每次加载页面都要联网获取，建议改为本地文件")
+        lowered = content.lower()
+        for name in _COSTLY_PROPERTIES:
+            count = len(re.findall(rf'(?<![-\w]){name}\s*:', lowered))
+            if count >= 20:
+                findings.append(f"{name} 出现 {count} 次")
+        return findings
+
+    @staticmethod
+    def describe(report):
+        """生成便于记录日志的报告文字"""
+        saved = report['before'] - report['after']
+        lines = [f"模板优化：{report['before'] / 1024:.1f} KB → {report['after'] / 1024:.1f} KB"
+                 f"（缩小 {saved / max(1, report['before']):.0%}），删除 {report['rules_removed']} 条未使用的 CSS 规则"]
+        if report['images']:
+            before = sum(original for original, _ in report['images'])
+            after = sum(smaller for _, smaller in report['images'])
+            lines.append(f"缩小 {len(report['images'])} 张内嵌图片：{before / 1024:.0f} KB → {after / 1024:.0f} KB")
+        lines += report['warnings']
+        if report['heavy']:
+            lines.append("排版开销较大的部分：")
+            lines += [f"  {finding}" for finding in report['heavy']]
+        return "\n".join(lines)
+
+
+if __name__ == '__main__':
+    import argparse
+    from config_manager import ConfigManager
+
+    parser = argparse.ArgumentParser(description="预优化 HTML 模板，结果保存为 <名称>.optimized.html")
+    parser.add_argument('templates', nargs='+', help="HTML 模板")
+    parser.add_argument('--strip-selectors', action='store_true',
+                        help="删除模板中没有元素匹配的类名和 ID 选择器（值中不含 HTML 时使用）")
+    args = parser.parse_args()
+
+    optimizer = TemplateOptimizer(ConfigManager())
+    optimizer.strip_selectors = optimizer.strip_selectors or args.strip_selectors
+    for template_path in args.templates:
+        print(template_path)
+        print(TemplateOptimizer.describe(optimizer.optimize(template_path)))
@@ -0,0 +1,83 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from browser_manager import write_atomic
+from job_queue import JobQueue
+
+
+class FakeClock:
+
+    def __init__(self, now=1000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class JobQueueTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.clock = FakeClock()
+        self.queue = JobQueue(os.path.join(self.directory, 'queue.db'), max_attempts=2, clock=self.clock)
+        self.job_id = self.queue.add_job('input.xlsx', 'template.html', {'a': '{{a}}'}, 25, 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_splits_job_into_chunks(self):
+        tasks = [self.queue.claim('w1', 60) for _ in range(3)]
+        self.assertEqual([(t['start_row'], t['end_row']) for t in tasks], [(0, 10), (10, 20), (20, 25)])
+        self.assertIsNone(self.queue.claim('w1', 60))
+
+    def test_complete(self):
+        task = self.queue.claim('w1', 60)
+        self.assertTrue(self.queue.complete(task['id'], 'w1', 10, 0, 1.5))
+        self.assertEqual(self.queue.summary(self.job_id)['tasks'], {'done': 1, 'pending': 2})
+
+    def test_expired_lease_is_requeued(self):
+        task = self.queue.claim('w1', 60)
+        self.clock.advance(30)
+        self.assertTrue(self.queue.renew(task['id'], 'w1', 60))
+        self.clock.advance(61)
+        again = self.queue.claim('w2', 60)
+        self.assertEqual(again['id'], task['id'])
+        # 原节点的租约已被接管，续租和上报都失败
+        self.assertFalse(self.queue.renew(task['id'], 'w1', 60))
+        self.assertFalse(self.queue.complete(task['id'], 'w1', 10, 0, 1.0))
+        self.assertTrue(self.queue.complete(task['id'], 'w2', 10, 0, 1.0))
+
+    def test_exhausted_task_fails(self):
+        task = self.queue.claim('w1', 60)
+        self.clock.advance(61)
+        self.assertEqual(self.queue.claim('w2', 60)['id'], task['id'])
+        self.clock.advance(61)
+        # 尝试次数用尽：领取时标记为失败，转而领取下一个分片
+        self.assertNotEqual(self.queue.claim('w3', 60)['id'], task['id'])
+        self.assertEqual(self.queue.get_job(self.job_id)['total_rows'], 25)
+        self.assertEqual(self.queue.summary(self.job_id)['tasks'].get('failed'), 1)
+        self.assertEqual(self.queue.expire_exhausted(), 0)
+
+
+class WriteAtomicTest(unittest.TestCase):
+
+    def test_rerun_replaces_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'order_1_1.pdf')
+            write_atomic(path, b'first')
+            write_atomic(path, b'second')
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'second')
+            self.assertEqual(os.listdir(directory), ['order_1_1.pdf'])
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,20 @@
+import unittest
+
+from row_selection import SelectionError, parse_ranges
+
+
+class ParseRangesTest(unittest.TestCase):
+
+    def test_spaces_around_dash(self):
+        self.assertEqual(parse_ranges('1 - 10, 15  200 -'), [(1, 10), (15, 15), (200, None)])
+        self.assertEqual(parse_ranges('- 5'), [(1, 5)])
+
+    def test_rejects_invalid_range(self):
+        with self.assertRaises(SelectionError):
+            parse_ranges('10 - 2')
+        with self.assertRaises(SelectionError):
+            parse_ranges('-')
+
+
+if __name__ == '__main__':
+    unittest.main()
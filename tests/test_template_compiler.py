@@ -0,0 +1,42 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from template_compiler import TemplateSelector
+
+
+class TemplateSelectorTest(unittest.TestCase):
+
+    def test_requires_default_template(self):
+        with self.assertRaises(ValueError):
+            TemplateSelector('type', None)
+        with self.assertRaises(ValueError):
+            TemplateSelector('type', '')
+
+    def test_falls_back_to_default(self):
+        selector = TemplateSelector('type', 'default.html', rules={'a': 'a.html'})
+        self.assertEqual(selector.path_for('a'), os.path.abspath('a.html'))
+        self.assertEqual(selector.path_for('b'), os.path.abspath('default.html'))
+
+
+    def test_refresh_sees_new_template(self):
+        directory = tempfile.mkdtemp()
+        try:
+            default = os.path.join(directory, 'default.html')
+            selector = TemplateSelector('type', default, directory=directory)
+            self.assertEqual(selector.path_for('a'), default)
+            added = os.path.join(directory, 'a.html')
+            with open(added, 'w', encoding='utf-8') as f:
+                f.write('<p>{{x}}</p>')
+            # 部分文件系统的目录修改时间精度较低，显式推进
+            stat = os.stat(directory)
+            os.utime(directory, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+            selector.refresh()
+            self.assertEqual(selector.path_for('a'), added)
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
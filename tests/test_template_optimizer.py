@@ -0,0 +1,55 @@
+import unittest
+
+from template_optimizer import DocumentScanner, TemplateOptimizer, minify_css, strip_unused_rules
+
+
+def scan(html):
+    scanner = DocumentScanner()
+    scanner.feed(html)
+    scanner.close()
+    return scanner
+
+
+class StripUnusedRulesTest(unittest.TestCase):
+
+    def test_keeps_rules_for_implied_tbody(self):
+        # 模板中没有写 <tbody>，浏览器解析时会补上
+        scanner = scan('<table><tr><td class="x">1</td></tr></table>')
+        css, removed = strip_unused_rules(minify_css('tbody td { padding: 2px } tbody .x { color: red }'), scanner)
+        self.assertEqual(removed, 0)
+        self.assertIn('tbody td{padding:2px}', css)
+        self.assertIn('tbody .x{color:red}', css)
+
+    def test_keeps_tag_only_rules(self):
+        scanner = scan('<p>text</p>')
+        css, removed = strip_unused_rules('thead th{color:red}', scanner)
+        self.assertEqual(removed, 0)
+        self.assertEqual(css, 'thead th{color:red}')
+
+    def test_strips_unknown_class_and_id(self):
+        scanner = scan('<p class="x">text</p>')
+        css, removed = strip_unused_rules('.x{a:b}.unused{a:b}#missing p{a:b}', scanner)
+        self.assertEqual(removed, 2)
+        self.assertEqual(css, '.x{a:b}')
+
+
+
+class MinifyHtmlTest(unittest.TestCase):
+
+    def test_collapses_text_but_not_attributes(self):
+        html = '<p title="a   b" data-x=\'1 > 2   3\'>\n  one   {{ value }}\n</p>'
+        self.assertEqual(TemplateOptimizer.minify_html(html),
+                         '<p title="a   b" data-x=\'1 > 2   3\'> one {{ value }} </p>')
+
+    def test_keeps_whitespace_for_pre_wrap_and_pre_line(self):
+        for value in ('pre-wrap', 'pre-line'):
+            html = f'<div style="white-space: {value}">a\n   b</div>'
+            self.assertEqual(TemplateOptimizer.minify_html(html), html)
+
+    def test_keeps_whitespace_with_linked_stylesheet(self):
+        html = '<link href="print.css" rel="stylesheet"><div>a\n   b</div>'
+        self.assertEqual(TemplateOptimizer.minify_html(html), html)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+
+from weasy_engine import with_base_href
+
+
+class WithBaseHrefTest(unittest.TestCase):
+
+    def test_inserts_into_head(self):
+        html = '<!DOCTYPE html><html><head><title>x</title></head><body><img src="logo.png"></body></html>'
+        self.assertEqual(
+            with_base_href(html, '/srv/templates'),
+            '<!DOCTYPE html><html><head><base href="file:///srv/templates/"><title>x</title></head>'
+            '<body><img src="logo.png"></body></html>')
+
+    def test_keeps_doctype_first(self):
+        result = with_base_href('<!doctype html><p>x</p>', '/srv/templates')
+        self.assertTrue(result.startswith('<!doctype html><base '))
+
+    def test_existing_base_unchanged(self):
+        html = '<head><base href="assets/"></head>'
+        self.assertEqual(with_base_href(html, '/srv/templates'), html)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,238 @@
+import ctypes
+import ctypes.util
+import logging
+import os
+import queue
+import select
+import shutil
+import struct
+import sys
+import threading
+import time
+from datetime import datetime
+from concurrency_controller import create_adaptive_pool
+from config_manager import load_field_mapping
+from data_cache import SUPPORTED_EXTENSIONS
+from PDF_Maker import PDFMaker
+
+logger = logging.getLogger(__name__)
+
+# inotify 事件掩码
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class PollingWatcher:
+    """轮询方式的目录监控，所有平台可用"""
+
+    def __init__(self, directory, interval):
+        self.directory = directory
+        self.interval = interval
+
+    def wait(self, timeout=None):
+        """等待下一次扫描时机"""
+        time.sleep(min(self.interval, timeout) if timeout is not None else self.interval)
+        return True
+
+    def close(self):
+        pass
+
+
+class InotifyWatcher:
+    """基于 Linux inotify 的目录监控，有文件写入或移入时立即唤醒"""
+
+    def __init__(self, directory):
+        libc_name = ctypes.util.find_library('c')
+        if not sys.platform.startswith('linux') or not libc_name:
+            raise OSError("当前平台不支持 inotify")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if self._libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch 失败: {directory}")
+
+    def wait(self, timeout=None):
+        """等待事件，返回是否有文件变化"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return False
+        return len(data) >= _EVENT_HEADER.size
+
+    def close(self):
+        os.close(self.fd)
+
+
+class WatchDaemon:
+    """监控收件目录：新数据文件写入完成后按保存的映射生成 PDF，并移入 done / failed 目录"""
+
+    def __init__(self, config, inbox=None, field_mapping=None):
+        self.config = config.snapshot()
+        self.inbox = inbox or self.config.get('watch', 'inbox', default='inbox')
+        self.done_dir = self.config.get('watch', 'done_dir', default=os.path.join(self.inbox, 'done'))
+        self.failed_dir = self.config.get('watch', 'failed_dir', default=os.path.join(self.inbox, 'failed'))
+        self.poll_interval = float(self.config.get('watch', 'poll_interval', default='2'))
+        # 文件大小和修改时间保持不变超过该秒数，才认为写入完成
+        self.settle_seconds = float(self.config.get('watch', 'settle_seconds', default='3'))
+        if field_mapping is None:
+            field_mapping = load_field_mapping(
+                self.config.get('paths', 'mapping_file', default='field_mapping.json'))
+        self.field_mapping = field_mapping
+
+        for directory in (self.inbox, self.done_dir, self.failed_dir):
+            if not os.path.exists(directory):
+                os.makedirs(directory)
+
+        self.pdf_maker = PDFMaker(self.config)
+        # 浏览器池在整个守护进程生命周期内保持预热，并发数自动调节
+        self.pool, self.controller = create_adaptive_pool(self.config)
+        self.jobs = queue.Queue()
+        self._candidates = {}   # 路径 -> (大小, 修改时间, 首次观察到该状态的时间)
+        self._queued = set()
+        self._stop = threading.Event()
+
+    def create_watcher(self):
+        """优先使用 inotify，不可用时退回轮询"""
+        try:
+            watcher = InotifyWatcher(self.inbox)
+            logger.info(f"使用 inotify 监控目录: {self.inbox}")
+            return watcher
+        except (OSError, AttributeError) as e:
+            logger.info(f"inotify 不可用（{str(e)}），改用轮询监控目录: {self.inbox}")
+            return PollingWatcher(self.inbox, self.poll_interval)
+
+    def is_candidate(self, name):
+        """忽略隐藏文件、Excel 锁文件和不支持的格式"""
+        if name.startswith(('.', '~$')):
+            return False
+        return os.path.splitext(name)[1].lower() in SUPPORTED_EXTENSIONS
+
+    def scan(self):
+        """扫描收件目录，把写入完成的文件放入任务队列"""
+        now = time.monotonic()
+        seen = set()
+        for entry in os.scandir(self.inbox):
+            if not entry.is_file() or not self.is_candidate(entry.name):
+                continue
+            path = entry.path
+            seen.add(path)
+            if path in self._queued:
+                continue
+            stat = entry.stat()
+            state = (stat.st_size, stat.st_mtime)
+            previous = self._candidates.get(path)
+            if previous is None or previous[:2] != state:
+                self._candidates[path] = state + (now,)
+                continue
+            if now - previous[2] >= self.settle_seconds and self._can_open(path):
+                del self._candidates[path]
+                self._queued.add(path)
+                self.jobs.put(path)
+                logger.info(f"新文件加入队列: {path}")
+        # 清理已经消失的文件
+        for path in list(self._candidates):
+            if path not in seen:
+                del self._candidates[path]
+
+    def _can_open(self, path):
+        """Windows 上文件仍被写入方占用时无法打开"""
+        try:
+            with open(path, 'rb'):
+                return True
+        except OSError:
+            return False
+
+    def process_file(self, path):
+        """处理单个数据文件，返回是否全部成功"""
+        started = time.perf_counter()
+        logger.info(f"开始处理: {path}")
+        groups = self.pdf_maker.load_groups(path, self.field_mapping)
+        succeeded, failed = self.pdf_maker.process_groups(
+            groups, self.pool, should_stop=self._stop.is_set)
+        elapsed = time.perf_counter() - started
+        logger.info(f"处理完成: {path}，成功 {succeeded} 行，失败 {failed} 行，耗时 {elapsed:.1f} 秒")
+        return failed == 0 and succeeded == sum(len(rows) for _, rows in groups)
+
+    def move(self, path, directory):
+        """移动文件，目标已存在时追加时间戳"""
+        target = os.path.join(directory, os.path.basename(path))
+        if os.path.exists(target):
+            stem, ext = os.path.splitext(os.path.basename(path))
+            target = os.path.join(directory, f"{stem}_{datetime.now().strftime('%Y%m%d%H%M%S')}{ext}")
+        shutil.move(path, target)
+        return target
+
+    def _job_worker(self):
+        while not self._stop.is_set():
+            try:
+                path = self.jobs.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                ok = self.process_file(path)
+            except Exception as e:
+                logger.error(f"处理文件失败: {path}: {str(e)}")
+                ok = False
+            if self._stop.is_set():
+                # 中途停止的文件留在收件目录，下次启动重新处理
+                break
+            try:
+                self.move(path, self.done_dir if ok else self.failed_dir)
+            except OSError as e:
+                logger.error(f"移动文件失败: {path}: {str(e)}")
+            finally:
+                self._queued.discard(path)
+
+    def run(self):
+        """启动守护进程（阻塞，直到 stop 或 Ctrl+C）"""
+        self.pool.start()
+        if self.controller:
+            self.controller.start()
+        worker = threading.Thread(target=self._job_worker, name="watch-jobs", daemon=True)
+        worker.start()
+        watcher = self.create_watcher()
+        try:
+            self.scan()
+            while not self._stop.is_set():
+                # 有待稳定的文件时缩短等待，及时完成防抖判断
+                timeout = self.settle_seconds if self._candidates else self.poll_interval
+                watcher.wait(timeout)
+                self.scan()
+        except KeyboardInterrupt:
+            logger.info("收到中断信号，正在退出")
+        finally:
+            self._stop.set()
+            watcher.close()
+            worker.join()
+            if self.controller:
+                self.controller.stop()
+            self.pool.close()
+            self.pdf_maker.close()
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == '__main__':
+    import argparse
+    from config_manager import ConfigManager
+    from logger_manager import configure_logging
+
+    parser = argparse.ArgumentParser(description="监控收件目录，自动为新数据文件生成 PDF")
+    parser.add_argument('--inbox', default=None, help="收件目录")
+    parser.add_argument('--mapping', default=None, help="字段映射 JSON 文件")
+    args = parser.parse_args()
+
+    config = ConfigManager()
+    configure_logging(config)
+    mapping = load_field_mapping(args.mapping) if args.mapping else None
+    WatchDaemon(config, inbox=args.inbox, field_mapping=mapping).run()
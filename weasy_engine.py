@@ -0,0 +1,187 @@
+import io
+import os
+import re
+import time
+import logging
+from pathlib import Path
+
+try:
+    import weasyprint
+    from weasyprint.text.fonts import FontConfiguration
+except ImportError:
+    weasyprint = None
+
+logger = logging.getLogger(__name__)
+
+# WeasyPrint 不支持或与 Chrome 表现不同的特性：(正则, 说明)
+UNSUPPORTED_FEATURES = [
+    (r'<script\b', "含有脚本，WeasyPrint 不执行 JavaScript"),
+    (r'<(iframe|video|audio|canvas|object|embed)\b', "含有 iframe / video / canvas 等嵌入元素"),
+    (r'display\s*:\s*(inline-)?grid', "使用 CSS Grid，WeasyPrint 只部分支持"),
+    (r'display\s*:\s*(inline-)?flex', "使用 Flexbox，WeasyPrint 只部分支持，换行和对齐可能不同"),
+    (r'position\s*:\s*sticky', "使用 position: sticky"),
+    (r'(filter|backdrop-filter|mix-blend-mode|clip-path)\s*:', "使用滤镜、混合模式或裁剪路径"),
+    (r'@media\s+screen', "只针对屏幕的 @media 规则，WeasyPrint 按打印媒体渲染"),
+    (r'writing-mode\s*:\s*vertical', "使用竖排文字"),
+    (r'https?://', "引用网络资源，渲染时需要联网"),
+]
+
+_PAGE_PATTERN = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+_MEDIABOX_PATTERN = re.compile(rb'/MediaBox\s*\[\s*([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s+([-\d.]+)\s*\]')
+
+
+class WeasyRenderer:
+    """进程内把 HTML/CSS 渲染为 PDF，不启动浏览器，适合简单模板在小容器中高密度运行
+
+    纸张大小和边距来自配置；prefer_css_page_size 为 true 时模板中的 @page 规则优先。
+    """
+
+    def __init__(self, config):
+        if weasyprint is None:
+            raise RuntimeError("未安装 WeasyPrint，请先执行 pip install weasyprint")
+        important = '' if config.prefer_css_page_size else ' !important'
+        page_css = (
+            f"@page {{ size: {config.paper_width}in {config.paper_height}in{important}; "
+            f"margin: {config.margin_top}in {config.margin_right}in "
+            f"{config.margin_bottom}in {config.margin_left}in{important}; }}"
+        )
+        # 以用户样式表传入，优先级低于模板自身的样式
+        self.font_config = FontConfiguration()
+        self.stylesheets = [weasyprint.CSS(string=page_css, font_config=self.font_config)]
+        self.zoom = config.scale
+        # 模板中的相对路径（图片、样式表）以模板所在目录为准
+        self.base_url = os.path.dirname(os.path.abspath(config.template_path)) if config.template_path else None
+
+    def render_pdf(self, html_content, base_url=None):
+        """base_url 为模板中相对路径的基准目录，省略时使用配置中模板所在目录"""
+        document = weasyprint.HTML(string=html_content, base_url=base_url or self.base_url)
+        return document.write_pdf(
+            stylesheets=self.stylesheets, font_config=self.font_config, zoom=self.zoom)
+
+
+def with_base_href(html_content, directory):
+    """在 <head> 开头插入指向 directory 的 <base>，使从临时文件加载的页面也能按模板目录解析相对路径
+
+    模板已有 <base> 时不变。
+    """
+    if re.search(r'<base\b', html_content, re.I):
+        return html_content
+    tag = f'<base href="{Path(os.path.abspath(directory)).as_uri()}/">'
+    # 插在 <!DOCTYPE> 之后，避免页面进入怪异模式
+    for pattern in (r'<head\b[^>]*>', r'<html\b[^>]*>', r'<!doctype\b[^>]*>'):
+        match = re.search(pattern, html_content, re.I)
+        if match:
+            return html_content[:match.end()] + tag + html_content[match.end():]
+    return tag + html_content
+
+
+def scan_template(content):
+    """静态检查模板中 WeasyPrint 不支持或表现不同的特性"""
+    lowered = content.lower()
+    return [message for pattern, message in UNSUPPORTED_FEATURES if re.search(pattern, lowered)]
+
+
+def pdf_pages(pdf_data):
+    """粗略解析 PDF：返回 (页数, 第一页尺寸（点）)"""
+    pages = len(_PAGE_PATTERN.findall(pdf_data))
+    match = _MEDIABOX_PATTERN.search(pdf_data)
+    size = None
+    if match:
+        x0, y0, x1, y1 = (float(value) for value in match.groups())
+        size = (round(x1 - x0, 1), round(y1 - y0, 1))
+    return pages, size
+
+
+def raster_difference(pdf_a, pdf_b, dpi=50):
+    """第一页栅格化后的平均像素差（0 ~ 1），需要 pypdfium2 和 Pillow，缺少时返回 None"""
+    try:
+        import pypdfium2
+        from PIL import Image, ImageChops, ImageStat
+    except ImportError:
+        return None
+    images = []
+    for data in (pdf_a, pdf_b):
+        page = pypdfium2.PdfDocument(io.BytesIO(data))[0]
+        images.append(page.render(scale=dpi / 72).to_pil().convert('L'))
+    first, second = images
+    if first.size != second.size:
+        second = second.resize(first.size, Image.BILINEAR)
+    return ImageStat.Stat(ImageChops.difference(first, second)).mean[0] / 255
+
+
+def check_compatibility(config, template_path, values=None, reference='local', tolerance=0.02):
+    """比较参考浏览器引擎与 WeasyPrint 对同一模板的渲染结果
+
+    values 为按占位符顺序排列的值元组，省略时用占位符名称填充。
+    返回报告字典：compatible、issues（问题列表）以及两种引擎的页数、纸张尺寸、耗时和像素差。
+    """
+    from dataclasses import replace
+    from browser_manager import BrowserManager
+    from template_compiler import CompiledTemplate
+
+    config = config.snapshot()
+    template = CompiledTemplate.from_file(template_path)
+    if values is None:
+        values = tuple(template.placeholders)
+    # 参考引擎从临时目录加载页面，加上 <base> 后图片、样式表和字体与 WeasyPrint 一样按模板目录解析，
+    # 比较结果不受资源缺失影响
+    html_content = with_base_href(template.render(values), os.path.dirname(template.path))
+    issues = scan_template(template.content)
+
+    results = {}
+    for engine in (reference, 'weasyprint'):
+        manager = BrowserManager(replace(config, browser_type=engine, template_path=template_path))
+        try:
+            started = time.perf_counter()
+            pdf_data = manager.render_pdf(html_content)
+            elapsed = time.perf_counter() - started
+        except Exception as e:
+            issues.append(f"{engine} 渲染失败: {str(e)}")
+            results[engine] = None
+            continue
+        finally:
+            manager.close()
+        pages, size = pdf_pages(pdf_data)
+        results[engine] = {'pdf': pdf_data, 'pages': pages, 'size': size,
+                           'bytes': len(pdf_data), 'seconds': round(elapsed, 3)}
+
+    expected, actual = results.get(reference), results.get('weasyprint')
+    difference = None
+    if expected and actual:
+        # 对象流压缩的 PDF 无法粗略解析页数，为 0 时不比较
+        if expected['pages'] and actual['pages'] and expected['pages'] != actual['pages']:
+            issues.append(f"页数不同：{reference} {expected['pages']} 页，WeasyPrint {actual['pages']} 页")
+        if expected['size'] and actual['size'] and any(
+                abs(a - b) > 1 for a, b in zip(expected['size'], actual['size'])):
+            issues.append(f"纸张尺寸不同：{reference} {expected['size']}，WeasyPrint {actual['size']}")
+        difference = raster_difference(expected['pdf'], actual['pdf'])
+        if difference is not None and difference > tolerance:
+            issues.append(f"第一页像素差 {difference:.1%}，超过阈值 {tolerance:.1%}")
+
+    report = {
+        'template': template_path,
+        'compatible': bool(expected and actual) and not issues,
+        'issues': issues,
+        'difference': difference,
+    }
+    for engine, result in results.items():
+        if result:
+            report[engine] = {key: value for key, value in result.items() if key != 'pdf'}
+    return report
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+    from config_manager import ConfigManager
+
+    parser = argparse.ArgumentParser(description="检查模板能否用 WeasyPrint 引擎得到与浏览器一致的结果")
+    parser.add_argument('template', help="HTML 模板")
+    parser.add_argument('--reference', default='local', help="参考引擎：local / undetected / playwright / cdp")
+    parser.add_argument('--tolerance', type=float, default=0.02, help="第一页允许的平均像素差（0 ~ 1）")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    report = check_compatibility(ConfigManager(), args.template, reference=args.reference, tolerance=args.tolerance)
+    print(json.dumps(report, ensure_ascii=False, indent=2))
+    print("兼容：可以使用 WeasyPrint 引擎" if report['compatible'] else "不兼容：请继续使用浏览器引擎")